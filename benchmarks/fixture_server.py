@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Local GraphQL server standing in for the subgraph, for load tests with no network. It answers the queries of the
+CLI from synthetic rows, rows saved with fixtures.save_entities (--fixture), or responses recorded with
+GNOP_TRANSPORT=record (--recorded), optionally through a slow and unreliable simulated network:
+
+  python benchmarks/fixture_server.py --rows 100000 --latency normal:200:50 --error-rate 0.05
+  GNOP_SUBGRAPH_URL=http://localhost:8000 ./gnop trades --all
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock
+import json
+import time
+
+import click
+
+from fixtures import FixtureTransport, generate_entities, load_entities
+from utils.transport import ReplayTransport, SimulatedTransport
+
+
+def get_handler(transport, throttle_interval=0):
+  documents = {}
+  throttle_lock = Lock()
+  next_request_time = [0]
+
+  class FixtureHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+      from gql import gql
+
+      if throttle_interval:
+        # Requests sooner than throttle_interval after the last one answered are rejected, as rate limited
+        with throttle_lock:
+          now = time.monotonic()
+          throttled = now < next_request_time[0]
+          if not throttled:
+            next_request_time[0] = now + throttle_interval
+        if throttled:
+          self.send_error(429, 'Too Many Requests')
+          return
+
+      request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+      query = request['query']
+      if query not in documents:
+        documents[query] = gql(query)
+
+      try:
+        result = transport.execute(documents[query], variable_values=request.get('variables'))
+      except Exception as error:
+        self.send_error(500, str(error))
+        return
+
+      response = {'data': result.data}
+      if result.errors:
+        response['errors'] = [{'message': str(error)} for error in result.errors]
+      self.send_json(response)
+
+    def send_json(self, response):
+      body = json.dumps(response).encode()
+      self.send_response(200)
+      self.send_header('Content-Type', 'application/json')
+      self.send_header('Content-Length', str(len(body)))
+      self.end_headers()
+      self.wfile.write(body)
+
+    def log_message(self, format, *args):
+      pass
+
+  return FixtureHandler
+
+
+class LockedTransport:
+  """The fixture transport is not thread safe. Queries are resolved one at a time, but the simulated network delays
+  are still concurrent"""
+
+  def __init__(self, transport):
+    self.transport = transport
+    self.lock = Lock()
+
+  def execute(self, document, variable_values=None, timeout=None):
+    with self.lock:
+      return self.transport.execute(document, variable_values=variable_values, timeout=timeout)
+
+
+@click.command()
+@click.option('--port', default=8000, help='Port to listen on')
+@click.option('--rows', default=10000, help='Synthetic rows of each entity')
+@click.option('--fixture', type=click.Path(exists=True, dir_okay=False), help='Rows saved with fixtures.save_entities (JSON)')
+@click.option('--recorded', type=click.Path(exists=True, file_okay=False), help='Responses recorded with GNOP_TRANSPORT=record')
+@click.option('--latency', help='Latency (ms) of each query i.e. fixed:200, uniform:50:500, normal:200:50')
+@click.option('--error-rate', default=0.0, help='Ratio of queries failing (0 to 1)')
+@click.option('--max-requests-per-second', default=0.0, help='Queries are delayed to answer no more than these per second')
+@click.option('--throttle', is_flag=True, help='Reject the queries over --max-requests-per-second (HTTP 429) instead of delaying them')
+def main(port, rows, fixture, recorded, latency, error_rate, max_requests_per_second, throttle):
+  if recorded:
+    transport = ReplayTransport(recorded)
+  else:
+    transport = FixtureTransport(load_entities(fixture) if fixture else generate_entities(rows))
+
+  transport = SimulatedTransport(
+    LockedTransport(transport),
+    latency=latency,
+    error_rate=error_rate,
+    max_requests_per_second=0 if throttle else max_requests_per_second
+  )
+  throttle_interval = 1 / max_requests_per_second if throttle and max_requests_per_second else 0
+
+  click.echo(f'Serving the fixtures on http://localhost:{port}')
+  ThreadingHTTPServer(('', port), get_handler(transport, throttle_interval)).serve_forever()
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,303 @@
+"""Synthetic subgraph rows, with the same shape (and realistic values) of the protocol subgraph, and a transport
+serving them to the CLI as the subgraph would
+"""
+from bisect import bisect_left, bisect_right
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+BASE_BATCH_ID = 5300000
+BATCH_TIME_SECONDS = 300
+MAX_AMOUNT = str(2 ** 128 - 1)
+MAX_BATCH_ID = 844674335
+
+# Entity of the references of the rows, resolved when other fields than the id are selected
+REFERENCE_ENTITIES = {
+  'sellToken': 'tokens',
+  'buyToken': 'tokens',
+  'token': 'tokens',
+  'order': 'orders'
+}
+
+
+def generate_tokens(count, seed=1):
+  rnd = random.Random(seed)
+  return [
+    {
+      'id': str(i),
+      'address': '0x%040x' % (i + 1),
+      'decimals': 18 if i == 0 else rnd.choice([18, 18, 6, 8, 0]),
+      'name': f'Token {i}' if i % 11 != 3 else None,
+      'symbol': f'T{i}' if i % 11 != 3 else None,
+      'createEpoch': str(BASE_BATCH_ID * BATCH_TIME_SECONDS - (count - i) * 3600),
+      'txHash': '0x%064x' % i
+    }
+    for i in range(count)
+  ]
+
+
+def generate_orders(count, tokens, seed=1):
+  rnd = random.Random(seed)
+  owners = _generate_owners(count)
+  orders = []
+  for i in range(count):
+    sell_token, buy_token = rnd.sample(tokens, 2)
+    owner = owners[i % len(owners)]
+    from_batch_id = BASE_BATCH_ID + i // 3
+    sold_volume = rnd.choice([0, rnd.randint(1, 10 ** 21)])
+    orders.append({
+      'id': f"{owner['id']}-{i}",
+      'owner': owner,
+      'orderId': str(i),
+      'fromBatchId': str(from_batch_id),
+      'untilBatchId': str(rnd.choice([from_batch_id + 100, MAX_BATCH_ID])),
+      'buyToken': {'id': buy_token['id']},
+      'sellToken': {'id': sell_token['id']},
+      'priceNumerator': str(rnd.randint(10 ** 21, 10 ** 22)),
+      'priceDenominator': str(rnd.randint(10 ** 21, 10 ** 22)),
+      'maxSellAmount': rnd.choice([MAX_AMOUNT, str(rnd.randint(10 ** 18, 10 ** 24))]),
+      'soldVolume': str(sold_volume),
+      'boughtVolume': str(sold_volume * rnd.randint(1, 3)),
+      'createEpoch': str(from_batch_id * BATCH_TIME_SECONDS + rnd.randint(0, BATCH_TIME_SECONDS - 1)),
+      'cancelEpoch': rnd.choice([None, None, None, str((from_batch_id + 10) * BATCH_TIME_SECONDS)]),
+      'deleteEpoch': None,
+      'txHash': '0x%064x' % (10 ** 6 + i)
+    })
+  return orders
+
+
+def generate_trades(count, orders, seed=1):
+  rnd = random.Random(seed)
+  trades = []
+  for i in range(count):
+    order = orders[i % len(orders)]
+    batch_id = BASE_BATCH_ID + i // 4
+    trades.append({
+      'id': 'trade-%08d' % i,
+      'owner': order['owner'],
+      'order': {'id': order['id'], 'orderId': order['orderId']},
+      'tradeBatchId': str(batch_id),
+      'sellToken': order['sellToken'],
+      'buyToken': order['buyToken'],
+      'sellVolume': str(rnd.randint(1, 10 ** 22)),
+      'buyVolume': str(rnd.randint(1, 10 ** 22)),
+      'tradeEpoch': str((batch_id + 1) * BATCH_TIME_SECONDS + 10),
+      'revertEpoch': str((batch_id + 1) * BATCH_TIME_SECONDS + 100) if i % 97 == 5 else None,
+      'txHash': '0x%064x' % (10 ** 8 + i // 4)
+    })
+  return trades
+
+
+def generate_prices(count, tokens, seed=1):
+  rnd = random.Random(seed)
+  prices = []
+  for i in range(count):
+    token = tokens[i % len(tokens)]
+    batch_id = BASE_BATCH_ID + i // len(tokens)
+    prices.append({
+      'id': f"{token['id']}-{batch_id}",
+      'token': {'id': token['id']},
+      'batchId': str(batch_id),
+      'priceInOwlNumerator': str(rnd.randint(10 ** 17, 10 ** 19)),
+      'priceInOwlDenominator': str(10 ** 18),
+      'volume': str(rnd.randint(0, 10 ** 22)),
+      'txHash': '0x%064x' % (10 ** 9 + batch_id)
+    })
+  return prices
+
+
+def generate_entities(rows, token_count=50, seed=1):
+  """Rows of every entity, with "rows" trades, orders and prices"""
+  tokens = generate_tokens(token_count, seed)
+  orders = generate_orders(rows, tokens, seed)
+  return {
+    'tokens': tokens,
+    'orders': orders,
+    'trades': generate_trades(rows, orders, seed),
+    'prices': generate_prices(rows, tokens, seed)
+  }
+
+
+def use_tokens(tokens):
+  """Resolve the token references from these tokens, instead of the token registry"""
+  import commands.tokens
+  from constants import network
+
+  commands.tokens.token_registries[network.value] = {
+    token['id']: commands.tokens.Token(
+      id=token['id'],
+      name=token['name'],
+      symbol=token['symbol'],
+      address=token['address'],
+      decimals=token['decimals']
+    )
+    for token in tokens
+  }
+
+
+def save_entities(entities, path):
+  with open(path, 'w') as fixture_file:
+    json.dump(entities, fixture_file)
+
+
+def load_entities(path):
+  """Rows recorded from the subgraph (or saved with save_entities), as {entity: [rows]}"""
+  with open(path) as fixture_file:
+    return json.load(fixture_file)
+
+
+class FixtureTransport:
+  """GraphQL transport resolving the queries of the CLI (where, orderBy, orderDirection, first and skip) from the
+  fixture rows, instead of the subgraph.
+
+  Responses are encoded and decoded as JSON, as they would be over HTTP. The decoding time is added to decode_time.
+  """
+
+  def __init__(self, entities):
+    self.entities = entities
+    self.sorted_rows = {}
+    self.rows_by_id = {}
+    self.requests = 0
+    self.decode_time = 0
+
+  def execute(self, document, variable_values=None, timeout=None):
+    from graphql.execution import ExecutionResult
+
+    self.requests += 1
+    data = {}
+    for operation in document.definitions:
+      for field in operation.selection_set.selections:
+        arguments = {
+          argument.name.value: _get_value(argument.value, variable_values or {}) for argument in field.arguments
+        }
+        rows = self.resolve(field.name.value, arguments)
+        data[field.alias.value if field.alias else field.name.value] = [
+          self._project(row, field.selection_set) for row in rows
+        ]
+
+    response = json.dumps({'data': data})
+    start = time.perf_counter()
+    result = json.loads(response)
+    self.decode_time += time.perf_counter() - start
+    return ExecutionResult(data=result['data'], errors=None)
+
+  def resolve(self, entity, arguments):
+    where = arguments.get('where') or {}
+    sort = arguments.get('orderBy') or 'id'
+    descending = arguments.get('orderDirection') == 'desc'
+    skip, first = arguments.get('skip') or 0, arguments.get('first', 100)
+    rows, keys = self._get_sorted_rows(entity, sort)
+
+    # Only scan the rows within the bounds of the sort key (i.e. the pagination cursor)
+    start, end = 0, len(rows)
+    for condition, value in where.items():
+      if condition in (f'{sort}_gte', f'{sort}_gt', f'{sort}'):
+        start = max(start, (bisect_left if condition != f'{sort}_gt' else bisect_right)(keys, _get_key(value)))
+      if condition in (f'{sort}_lte', f'{sort}_lt', f'{sort}'):
+        end = min(end, (bisect_right if condition != f'{sort}_lt' else bisect_left)(keys, _get_key(value)))
+
+    indexes = range(end - 1, start - 1, -1) if descending else range(start, end)
+    matches = []
+    for index in indexes:
+      if _matches(rows[index], where):
+        matches.append(rows[index])
+        if len(matches) == skip + first:
+          break
+
+    return matches[skip:]
+
+  def _project(self, row, selection_set):
+    projected = {}
+    for selection in selection_set.selections:
+      name = selection.name.value
+      value = row.get(name)
+      if selection.selection_set is not None and value is not None:
+        value = self._project(self._get_reference(name, value), selection.selection_set)
+      projected[selection.alias.value if selection.alias else name] = value
+
+    return projected
+
+  def _get_reference(self, field, reference):
+    """Row referenced by a field (i.e. the token of sellToken), as the references of the rows only have its id"""
+    entity = REFERENCE_ENTITIES.get(field)
+    if entity is None:
+      return reference
+
+    if entity not in self.rows_by_id:
+      self.rows_by_id[entity] = {row['id']: row for row in self.entities.get(entity, [])}
+    return self.rows_by_id[entity].get(reference['id'], reference)
+
+  def _get_sorted_rows(self, entity, sort):
+    if (entity, sort) not in self.sorted_rows:
+      rows = sorted(self.entities[entity], key=lambda row: (_get_key(row.get(sort)), _get_key(row['id'])))
+      self.sorted_rows[entity, sort] = rows, [_get_key(row.get(sort)) for row in rows]
+
+    return self.sorted_rows[entity, sort]
+
+
+def _get_value(node, variables):
+  from graphql.language import ast
+
+  if isinstance(node, ast.Variable):
+    return variables.get(node.name.value)
+  elif isinstance(node, ast.IntValue):
+    return int(node.value)
+  elif isinstance(node, (ast.StringValue, ast.EnumValue, ast.BooleanValue)):
+    return node.value
+  elif isinstance(node, ast.ListValue):
+    return [_get_value(value, variables) for value in node.values]
+  elif isinstance(node, ast.ObjectValue):
+    return {field.name.value: _get_value(field.value, variables) for field in node.fields}
+  else:
+    return None
+
+
+def _get_key(value):
+  """Sort key of a value: numbers (BigInts are strings) before text, and references by their id"""
+  if isinstance(value, dict):
+    value = value['id']
+
+  if value is None:
+    return (0, 0)
+  elif isinstance(value, int) or (isinstance(value, str) and value.isdigit()):
+    return (1, int(value))
+  else:
+    return (2, value)
+
+
+def _matches(row, where):
+  for condition, expected in where.items():
+    for suffix in ('_not_in', '_in', '_gte', '_lte', '_gt', '_lt', '_not'):
+      if condition.endswith(suffix):
+        field = condition[:-len(suffix)]
+        break
+    else:
+      field, suffix = condition, ''
+
+    value = _get_key(row.get(field))
+    if suffix in ('_in', '_not_in'):
+      found = value in {_get_key(item) for item in expected}
+      if found != (suffix == '_in'):
+        return False
+    else:
+      expected = _get_key(expected)
+      matched = {
+        '': value == expected,
+        '_not': value != expected,
+        '_gt': value > expected,
+        '_gte': value >= expected,
+        '_lt': value < expected,
+        '_lte': value <= expected
+      }[suffix]
+      if not matched:
+        return False
+
+  return True
+
+
+def _generate_owners(count):
+  return [{'id': '0x%040x' % (0xabc000 + i)} for i in range(max(1, count // 20))]
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""Memory benchmark: bytes allocated per row by the trade, order and price DTOs, and how fast they are built.
+
+Rows are synthetic (see fixtures.py), so no network is needed:
+
+  python benchmarks/memory.py --rows 100000 --output memory.json
+"""
+import json
+import platform
+import time
+import tracemalloc
+
+import click
+
+from fixtures import generate_entities, use_tokens
+from startup import get_commit
+
+from commands.orders import to_order_dto
+from commands.prices import to_price_dto
+from commands.trades import to_trade_dto
+
+COMMANDS = {
+  'trades': to_trade_dto,
+  'orders': to_order_dto,
+  'prices': to_price_dto
+}
+
+
+def measure(to_dto, rows):
+  tracemalloc.start()
+  start = time.perf_counter()
+  dtos = [to_dto(row) for row in rows]
+  elapsed = time.perf_counter() - start
+  size, peak_size = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+
+  del dtos
+  return elapsed, size, peak_size
+
+
+@click.command()
+@click.option('--rows', default=50000, help='DTOs built for each entity')
+@click.option('--output', type=click.Path(dir_okay=False), help='Write the results to this JSON file')
+def main(rows, output):
+  entities = generate_entities(rows)
+  use_tokens(entities['tokens'])
+
+  results = {
+    'commit': get_commit(),
+    'python': platform.python_version(),
+    'rows': rows,
+    'commands': {}
+  }
+  for entity, to_dto in COMMANDS.items():
+    # Build them once first, so lazily created objects (i.e. cached strings) are not measured
+    measure(to_dto, entities[entity][:100])
+    elapsed, size, peak_size = measure(to_dto, entities[entity])
+
+    results['commands'][entity] = {
+      'bytes_per_row': round(size / rows),
+      'peak_bytes_per_row': round(peak_size / rows),
+      'rows_per_second': round(rows / elapsed)
+    }
+    click.echo(f'{entity:<10} {size / rows:8.0f} bytes/row   {rows / elapsed:12,.0f} rows/s')
+
+  if output:
+    with open(output, 'w') as output_file:
+      json.dump(results, output_file, indent=2)
+
+
+if __name__ == '__main__':
+  main()
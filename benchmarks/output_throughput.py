@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""Output throughput benchmark: rows per second written by each command, in each format.
+
+Rows are synthetic (see fixtures.py), and they are formatted and written to a file, so no network is needed:
+
+  python benchmarks/output_throughput.py --rows 20000 --output throughput.json
+"""
+from statistics import median
+import json
+import os
+import platform
+import tempfile
+import time
+
+import click
+
+from fixtures import generate_entities, use_tokens
+from startup import get_commit
+
+from commands.orders import print_orders, to_order_dto
+from commands.prices import print_prices, to_price_dto
+from commands.trades import print_trades, to_trade_dto
+from utils.output import set_output_file
+
+COMMANDS = {
+  'trades': (to_trade_dto, print_trades),
+  'orders': (to_order_dto, print_orders),
+  'prices': (to_price_dto, print_prices)
+}
+
+FORMATS = ['csv', 'pretty']
+
+
+def run_command(entity, rows, print_format, output_path):
+  to_dto, print_rows = COMMANDS[entity]
+  set_output_file(output_path)
+  start = time.perf_counter()
+  print_rows((to_dto(row) for row in rows), print_format)
+  return time.perf_counter() - start
+
+
+@click.command()
+@click.option('--rows', default=10000, help='Rows written by each command')
+@click.option('--runs', default=3, help='Runs of each command and format, the median is reported')
+@click.option('--output', type=click.Path(dir_okay=False), help='Write the results to this JSON file')
+def main(rows, runs, output):
+  entities = generate_entities(rows)
+  use_tokens(entities['tokens'])
+
+  results = {
+    'commit': get_commit(),
+    'python': platform.python_version(),
+    'rows': rows,
+    'commands': {}
+  }
+
+  with tempfile.TemporaryDirectory() as output_dir:
+    output_path = os.path.join(output_dir, 'output')
+    for entity in COMMANDS:
+      for print_format in FORMATS:
+        elapsed = median(run_command(entity, entities[entity], print_format, output_path) for _ in range(runs))
+        command = f'{entity} --format {print_format}'
+        results['commands'][command] = {
+          'rows_per_second': round(rows / elapsed),
+          'bytes': os.path.getsize(output_path)
+        }
+        click.echo(f'{command:<25} {rows / elapsed:12,.0f} rows/s')
+
+  if output:
+    with open(output, 'w') as output_file:
+      json.dump(results, output_file, indent=2)
+
+
+if __name__ == '__main__':
+  main()
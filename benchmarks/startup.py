@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""Cold start benchmark: wall time and import time (python -X importtime) of each command.
+
+Commands run with --help or against an empty local mirror, so no network is needed. Use --baseline with the results of
+a previous run to fail on regressions:
+
+  python benchmarks/startup.py --output startup.json
+  python benchmarks/startup.py --baseline startup.json
+"""
+from statistics import median
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+
+CLI = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'cli.py')
+
+COMMANDS = [
+  ['--help'],
+  ['tokens', '--help'],
+  ['prices', '--help'],
+  ['trades', '--help'],
+  ['orders', '--help'],
+  ['tokens', '--local', '--format', 'csv'],
+  ['prices', '--local', '--format', 'csv'],
+  ['trades', '--local', '--format', 'csv'],
+  ['orders', '--local', '--format', 'csv'],
+]
+
+
+def run_command(args, cache_dir):
+  start = time.perf_counter()
+  process = subprocess.run(
+    [sys.executable, '-X', 'importtime', CLI] + args,
+    env={**os.environ, 'GNOP_CACHE_DIR': cache_dir},
+    stdout=subprocess.DEVNULL,
+    stderr=subprocess.PIPE,
+    universal_newlines=True,
+    check=True
+  )
+  wall_time = time.perf_counter() - start
+
+  # Lines look like "import time:       416 |      15424 | click", nested imports are indented
+  top_level_imports = {}
+  for line in process.stderr.splitlines():
+    if line.startswith('import time:') and not line.endswith('imported package'):
+      _, cumulative, module = line.split('|')
+      if not module.startswith('  '):
+        top_level_imports[module.strip()] = int(cumulative) / 1000
+
+  return wall_time * 1000, top_level_imports
+
+
+def get_commit():
+  try:
+    return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], universal_newlines=True).strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+
+@click.command()
+@click.option('--runs', default=5, help='Runs of each command, the median is reported')
+@click.option('--output', type=click.Path(dir_okay=False), help='Write the results to this JSON file')
+@click.option('--baseline', type=click.Path(exists=True, dir_okay=False), help='Results of a previous run to compare with')
+@click.option('--max-regression', default=20, help='Max increase of the wall time over the baseline (in %)')
+def main(runs, output, baseline, max_regression):
+  results = {
+    'commit': get_commit(),
+    'python': platform.python_version(),
+    'commands': {}
+  }
+
+  with tempfile.TemporaryDirectory() as cache_dir:
+    for args in COMMANDS:
+      wall_times, import_times, imports = [], [], {}
+      for _ in range(runs):
+        wall_time, imports = run_command(args, cache_dir)
+        wall_times.append(wall_time)
+        import_times.append(sum(imports.values()))
+
+      command = ' '.join(args)
+      results['commands'][command] = {
+        'wall_ms': round(median(wall_times), 1),
+        'import_ms': round(median(import_times), 1),
+        'heaviest_imports': {
+          module: round(import_time, 1)
+          for module, import_time in sorted(imports.items(), key=lambda item: -item[1])[:5]
+        }
+      }
+      click.echo(f'{command:<35} wall: {median(wall_times):8.1f} ms   imports: {median(import_times):8.1f} ms')
+
+  if output:
+    with open(output, 'w') as output_file:
+      json.dump(results, output_file, indent=2)
+
+  if baseline:
+    with open(baseline) as baseline_file:
+      baseline_results = json.load(baseline_file)
+
+    regressions = []
+    for command, result in results['commands'].items():
+      previous = baseline_results['commands'].get(command)
+      if previous and result['wall_ms'] > previous['wall_ms'] * (1 + max_regression / 100):
+        regressions.append(f"  {command}: {previous['wall_ms']} ms -> {result['wall_ms']} ms")
+
+    if regressions:
+      click.echo(f'Startup regressions (more than {max_regression}% slower than {baseline}):', err=True)
+      click.echo('\n'.join(regressions), err=True)
+      sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""Benchmark of every command, stage by stage, with no network: queries are served from fixtures by FixtureTransport.
+
+Stages are timed separately: building the queries, parsing them (gql), decoding the JSON responses, building the DTOs
+and printing them (csv and pretty). Rows are synthetic, or recorded ones with --fixture:
+
+  python benchmarks/suite.py --sizes 1000,100000 --output suite.json
+  python benchmarks/suite.py --baseline suite.json
+"""
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import click
+
+from fixtures import (FixtureTransport, generate_orders, generate_prices, generate_tokens, generate_trades,
+                      load_entities, use_tokens)
+from startup import get_commit
+
+from commands.orders import ORDERS_FIELDS, print_orders_csv, print_orders_pretty, to_order_dto
+from commands.prices import PRICES_FIELDS, print_prices_csv, print_prices_pretty, to_price_dto
+from commands.tokens import TOKENS_FIELDS, print_tokens_csv, print_tokens_pretty, to_token_dto
+from commands.trader import TRADER_QUERY, get_trader_variables, print_trader_pretty, print_trader_records, to_trader_dtos
+from commands.trades import TRADE_FIELDS, print_trades_csv, print_trades_pretty, to_trade_dto
+from constants import PAGE_SIZE
+from utils.cache import set_query_cache_mode
+from utils.graphql import execute_query, get_entity_query, gql_filter, gql_sort_by, paginate, set_graphql_transport
+from utils.output import set_output_file
+import utils.misc
+
+COMMANDS = {
+  'trades': (TRADE_FIELDS, 'tradeBatchId', to_trade_dto, print_trades_csv, print_trades_pretty),
+  'orders': (ORDERS_FIELDS, 'createEpoch', to_order_dto, print_orders_csv, print_orders_pretty),
+  'prices': (PRICES_FIELDS, 'batchId', to_price_dto, print_prices_csv, print_prices_pretty),
+  'tokens': (TOKENS_FIELDS, 'id', to_token_dto, print_tokens_csv, print_tokens_pretty)
+}
+
+# Commands of several entities, benchmarked on their own (see run_trader)
+MULTI_ENTITY_COMMANDS = ['trader']
+
+
+def generate_rows(entity, rows, tokens):
+  if entity == 'trader':
+    # Every order (and trade) is of the same trader, the tokens are resolved from the rows of the query
+    orders = generate_orders(rows, tokens)
+    orders = [{**order, 'owner': orders[0]['owner']} for order in orders]
+    return {'tokens': tokens, 'orders': orders, 'trades': generate_trades(rows, orders)}
+  elif entity == 'tokens':
+    return generate_tokens(rows)
+  elif entity == 'prices':
+    return generate_prices(rows, tokens)
+  else:
+    orders = generate_orders(rows if entity == 'orders' else min(rows, 10000), tokens)
+    return orders if entity == 'orders' else generate_trades(rows, orders)
+
+
+def timed(function, *args):
+  start = time.perf_counter()
+  result = function(*args)
+  return result, time.perf_counter() - start
+
+
+def run_command(entity, rows, output_path):
+  fields, sort, to_dto, print_csv, print_pretty = COMMANDS[entity]
+  transport = FixtureTransport({entity: rows})
+  set_graphql_transport(transport)
+  pages = -(-len(rows) // PAGE_SIZE)
+
+  def build_queries():
+    for page in range(pages):
+      get_entity_query(entity, f'id {sort} {fields}')
+      gql_filter({f'{sort}_gte': str(page), 'id_not_in': []})
+      gql_sort_by(sort, True)
+
+  def parse_query():
+    from gql import gql
+    gql(get_entity_query(entity, f'id {sort} {fields}'))
+
+  def fetch():
+    return list(paginate(entity, fields, {}, sort, sort_ascending=True, verbose=0))
+
+  def print_rows(print_rows_function, dtos):
+    set_output_file(output_path)
+    print_rows_function(dtos)
+
+  _, query_build = timed(build_queries)
+  _, gql_parse = timed(parse_query)
+  fetched_rows, fetch_time = timed(fetch)
+  dtos, dto_time = timed(lambda: [to_dto(row) for row in fetched_rows])
+  _, csv_time = timed(print_rows, print_csv, dtos)
+  _, pretty_time = timed(print_rows, print_pretty, dtos)
+
+  if len(fetched_rows) != len(rows):
+    raise Exception(f'{entity}: fetched {len(fetched_rows)} of {len(rows)} rows')
+
+  return {
+    'rows': len(rows),
+    'requests': transport.requests,
+    'query_build': query_build,
+    'gql_parse': gql_parse,
+    'json_decode': transport.decode_time,
+    'fetch': fetch_time,
+    'to_dto': dto_time,
+    'print_csv': csv_time,
+    'print_pretty': pretty_time
+  }
+
+
+def run_trader(entities, output_path):
+  owner = entities['trades'][0]['owner']['id']
+  transport = FixtureTransport(entities)
+  set_graphql_transport(transport)
+
+  def parse_query():
+    from gql import gql
+    gql(TRADER_QUERY)
+
+  def print_rows(print_function, *args):
+    set_output_file(output_path)
+    print_function(*args)
+
+  variables, query_build = timed(get_trader_variables, owner, len(entities['trades']))
+  _, gql_parse = timed(parse_query)
+  result, fetch_time = timed(execute_query, TRADER_QUERY, variables, 0)
+  (orders, open_orders, trades), dto_time = timed(to_trader_dtos, result)
+  _, jsonl_time = timed(print_rows, print_trader_records, orders, open_orders, trades)
+  _, pretty_time = timed(print_rows, print_trader_pretty, owner, orders, open_orders, trades)
+
+  if not trades:
+    raise Exception(f'trader: no trades fetched for {owner}')
+
+  return {
+    'rows': len(result['orders']) + len(result['openOrders']) + len(result['trades']),
+    'requests': transport.requests,
+    'query_build': query_build,
+    'gql_parse': gql_parse,
+    'json_decode': transport.decode_time,
+    'fetch': fetch_time,
+    'to_dto': dto_time,
+    'print_jsonl': jsonl_time,
+    'print_pretty': pretty_time
+  }
+
+
+@click.command()
+@click.option('--sizes', default='1000,100000', help='Comma separated number of rows of each command')
+@click.option('--commands', default=','.join([*COMMANDS, *MULTI_ENTITY_COMMANDS]), help='Comma separated commands to benchmark')
+@click.option('--runs', default=1, help='Runs of each command, the fastest time of each stage is kept')
+@click.option('--fixture', type=click.Path(exists=True, dir_okay=False), help='Rows recorded from the subgraph (JSON), instead of synthetic ones')
+@click.option('--output', type=click.Path(dir_okay=False), help='Write the results to this JSON file')
+@click.option('--baseline', type=click.Path(exists=True, dir_okay=False), help='Results of a previous run to compare with')
+@click.option('--max-regression', default=20, help='Max increase of the time of a stage over the baseline (in %)')
+def main(sizes, commands, runs, fixture, output, baseline, max_regression):
+  results = {
+    'commit': get_commit(),
+    'python': platform.python_version(),
+    'commands': {}
+  }
+  recorded_entities = load_entities(fixture) if fixture else None
+
+  with tempfile.TemporaryDirectory() as cache_dir:
+    # Nothing is cached (or read from the cache) between runs
+    utils.misc.CACHE_DIR = cache_dir
+    set_query_cache_mode(read=False, write=False)
+    output_path = os.path.join(cache_dir, 'output')
+
+    tokens = recorded_entities['tokens'] if recorded_entities else generate_tokens(50)
+    use_tokens(tokens)
+    for entity in commands.split(','):
+      if recorded_entities and entity in MULTI_ENTITY_COMMANDS:
+        entity_sizes = [(len(recorded_entities['trades']), recorded_entities)]
+      elif recorded_entities:
+        entity_sizes = [(len(recorded_entities[entity]), recorded_entities[entity])]
+      else:
+        entity_sizes = [(int(size), None) for size in sizes.split(',')]
+
+      for size, rows in entity_sizes:
+        rows = rows or generate_rows(entity, size, tokens)
+        run = run_trader if entity == 'trader' else lambda rows, output_path: run_command(entity, rows, output_path)
+        run_results = [run(rows, output_path) for _ in range(runs)]
+        result = {stage: min(run_result[stage] for run_result in run_results) for stage in run_results[0]}
+        results['commands'][f'{entity} {size}'] = result
+        click.echo(f'{entity} {size:>9,d} rows  ' + '  '.join(
+          f'{stage}: {seconds * 1000:9.1f} ms' for stage, seconds in result.items() if stage not in ('rows', 'requests')
+        ))
+
+  if output:
+    with open(output, 'w') as output_file:
+      json.dump(results, output_file, indent=2)
+
+  if baseline:
+    with open(baseline) as baseline_file:
+      baseline_results = json.load(baseline_file)
+
+    regressions = []
+    for command, result in results['commands'].items():
+      previous = baseline_results['commands'].get(command, {})
+      for stage, seconds in result.items():
+        if stage in previous and stage not in ('rows', 'requests') and seconds > previous[stage] * (1 + max_regression / 100):
+          regressions.append(f'  {command} {stage}: {previous[stage] * 1000:.1f} ms -> {seconds * 1000:.1f} ms')
+
+    if regressions:
+      click.echo(f'Regressions (more than {max_regression}% slower than {baseline}):', err=True)
+      click.echo('\n'.join(regressions), err=True)
+      sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
@@ -1,18 +1,16 @@
 #!/usr/bin/env python3
 
-from commands.orders import get_orders
-from commands.prices import get_prices
-from commands.tokens import get_tokens
-from commands.trades import get_trades
-
 import click
 
+# The commands are imported when they are run, so the CLI (i.e. --help) starts without loading all of their dependencies
+
 
 def show_header(ctx, param, value):
     """Display header if requested format allows that"""
     if value == 'pretty':
+        from utils.output import echo, style
 
-        click.echo('\n' + click.style('''        
+        echo('\n' + style('''        
  _____                 _✨      ______          _                  _ 
 |  __ \               (_)       | ___ \        | |                | |
 | |  \/_ __   ___  ___ _ ___    | |_/ / __ ___ | |_ ___   ___ ___ | |
@@ -23,6 +21,73 @@ def show_header(ctx, param, value):
     return value
 
 
+def write_output_to_file(ctx, param, value):
+    """Write the output to a file, if requested"""
+    if value:
+        from utils.output import set_output_file
+        set_output_file(value)
+
+
+def disable_query_cache(ctx, param, value):
+    """Neither read nor write the query cache if requested"""
+    if value:
+        from utils.cache import set_query_cache_mode
+        set_query_cache_mode(read=False, write=False)
+
+
+def refresh_query_cache(ctx, param, value):
+    """Don't read the query cache if requested, but still cache the new results"""
+    if value:
+        from utils.cache import set_query_cache_mode
+        set_query_cache_mode(read=False)
+
+
+def parse_networks(ctx, param, value):
+    """Networks to query at the same time, if requested"""
+    if value:
+        from utils.network import parse_networks
+        return parse_networks(value)
+
+
+def parse_batch_id(ctx, param, value):
+    """Batch id of a date (or batch id) of --from/--to, if given"""
+    if value:
+        from utils.misc import parse_batch_id
+        return parse_batch_id(value, end=param.name == 'to_batch_id')
+
+
+def show_profile(ctx, param, value):
+    """Print the time of each phase of the command to stderr, if requested"""
+    if value:
+        from utils.profile import print_profile
+        ctx.call_on_close(print_profile)
+
+
+def write_cprofile(ctx, param, value):
+    """Profile the command with cProfile, and write the stats (pstats) to a file, if requested"""
+    if value:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        ctx.call_on_close(lambda: profiler.disable() or profiler.dump_stats(value))
+
+
+def profile_options(command):
+    """Options to profile a command: --profile and --cprofile"""
+    command = click.option('--cprofile', type=click.Path(dir_okay=False, writable=True), expose_value=False, is_eager=True, callback=write_cprofile, help='Write the cProfile stats (pstats) of the command to a file')(command)
+    command = click.option('--profile', is_flag=True, expose_value=False, is_eager=True, callback=show_profile, help='Print the time of each phase (network, decode, DTOs, output...) to stderr')(command)
+    return command
+
+
+def common_options(command):
+    """Options shared by the commands that query the subgraph: query cache, output file and profiling"""
+    command = profile_options(command)
+    command = click.option('--output', type=click.Path(dir_okay=False, writable=True), expose_value=False, is_eager=True, callback=write_output_to_file, help='Write the output to a file instead of stdout')(command)
+    command = click.option('--refresh', is_flag=True, expose_value=False, callback=refresh_query_cache, help='Ignore the cached results, and cache the new ones')(command)
+    command = click.option('--no-cache', is_flag=True, expose_value=False, callback=disable_query_cache, help='Don\'t use the query cache')(command)
+    return command
+
+
 @click.group()
 def main():
     """
@@ -36,13 +101,19 @@ def main():
 @click.option('--skip', default=0, help='Number of tokens to skip, used for pagination')
 @click.option('--sort', default="symbol", help='Sort result by a field, used for pagination')
 @click.option('--asc/--desc', 'sort_ascending', default=True, help='Sort direction. "asc" (default) for ascending, "desc" for descending')
-@click.option('--format', 'print_format', default="pretty", expose_value=True, is_eager=False, callback=show_header, help='Format type i.e. pretty, csv')
+@click.option('--from', 'from_batch_id', callback=parse_batch_id, help='Start of the range of tokens added: a date (UTC) i.e. 2020-05-20 or 2020-05-20T13:30, or a batch id')
+@click.option('--to', 'to_batch_id', callback=parse_batch_id, help='End of the range of tokens added (excluded): a date (UTC) or a batch id')
+@click.option('--format', 'print_format', default="pretty", expose_value=True, is_eager=False, callback=show_header, help='Format type i.e. pretty, csv, jsonl, parquet, arrow')
 @click.option('-v', '--verbose', count=True)
 @click.option('--id', 'token_id', help='Token id')
 @click.option('--symbol', help='Token symbol')
 @click.option('--address', help='Token address')
-def tokens(count, skip, sort, sort_ascending, print_format, verbose, token_id, symbol, address):
+@click.option('--local', is_flag=True, help='Query the local mirror (see "sync") instead of the subgraph')
+@click.option('--network', 'networks', callback=parse_networks, help='Query these networks at the same time i.e. mainnet,xdai or all (instead of the NETWORK env var), adding a network column')
+@common_options
+def tokens(count, skip, sort, sort_ascending, print_format, verbose, token_id, symbol, address, from_batch_id, to_batch_id, local, networks):
     """Get list of tokens. For more details, see https://docs.gnosis.io/protocol/docs/addtoken1"""
+    from commands.tokens import get_tokens
     get_tokens(
       # Pagination
       count=count,
@@ -57,48 +128,78 @@ def tokens(count, skip, sort, sort_ascending, print_format, verbose, token_id, s
       # Filters
       token_id=token_id,
       address=address,
-      symbol=symbol
+      symbol=symbol,
+      from_batch_id=from_batch_id,
+      to_batch_id=to_batch_id,
+
+      # Datasource
+      local=local,
+      networks=networks
     )
 
 
 @main.command()
 @click.option('--count', default=100, help='Number of prices to return, used for pagination')
 @click.option('--skip', default=0, help='Number of prices to skip, used for pagination')
+@click.option('--all', 'fetch_all', is_flag=True, help='Return all prices, fetching as many pages as needed')
+@click.option('--limit', type=int, help='Number of prices to return, fetching as many pages as needed')
 @click.option('--sort', default="batchId", help='Sort result by a field, used for pagination')
 @click.option('--asc/--desc', 'sort_ascending', default=False, help='Sort direction. "desc" (default) for ascending, "desc" for descending')
-@click.option('--format', 'print_format', default="pretty", expose_value=True, is_eager=False, callback=show_header, help='Format type i.e. pretty, csv')
+@click.option('--from', 'from_batch_id', callback=parse_batch_id, help='Start of the range of prices: a date (UTC) i.e. 2020-05-20 or 2020-05-20T13:30, or a batch id')
+@click.option('--to', 'to_batch_id', callback=parse_batch_id, help='End of the range of prices (excluded): a date (UTC) or a batch id')
+@click.option('--format', 'print_format', default="pretty", expose_value=True, is_eager=False, callback=show_header, help='Format type i.e. pretty, csv, jsonl, parquet, arrow')
 @click.option('--batch', 'batch_id', help='Batch id')
 @click.option('--token', 'token_id', help='Token id')
 @click.option('--tx', 'tx_hash', help='Transaction hash for the price (same as solution submission)')
 @click.option('-v', '--verbose', count=True)
-def prices(count, skip, sort, sort_ascending, print_format, verbose, batch_id, token_id, tx_hash):
+@click.option('--follow', is_flag=True, help='Keep running, printing the new prices as they appear (after the last ones, oldest first)')
+@click.option('--local', is_flag=True, help='Query the local mirror (see "sync") instead of the subgraph')
+@click.option('--network', 'networks', callback=parse_networks, help='Query these networks at the same time i.e. mainnet,xdai or all (instead of the NETWORK env var), adding a network column')
+@common_options
+def prices(count, skip, fetch_all, limit, sort, sort_ascending, print_format, verbose, batch_id, token_id, tx_hash, follow, local, networks, from_batch_id, to_batch_id):
     """Get historic prices"""
-    get_prices(count=count, skip=skip, sort=sort, sort_ascending=sort_ascending, print_format=print_format, verbose=verbose, batch_id=batch_id, token_id=token_id, tx_hash=tx_hash)
+    from commands.prices import get_prices
+    get_prices(count=count, skip=skip, fetch_all=fetch_all, limit=limit, sort=sort, sort_ascending=sort_ascending, print_format=print_format, verbose=verbose, batch_id=batch_id, token_id=token_id, tx_hash=tx_hash, follow=follow, local=local, networks=networks, from_batch_id=from_batch_id, to_batch_id=to_batch_id)
 
 
 @main.command()
 @click.option('--count', default=10, help='Number of trades to return, used for pagination')
 @click.option('--skip', default=0, help='Number of trades to skip, used for pagination')
+@click.option('--all', 'fetch_all', is_flag=True, help='Return all trades, fetching as many pages as needed')
+@click.option('--limit', type=int, help='Number of trades to return, fetching as many pages as needed')
+@click.option('--parallel', type=click.IntRange(min=1), help='Fetch the tradeBatchId range split in this many parts at the same time (requires sorting by tradeBatchId)')
 @click.option('--sort', default="tradeBatchId", help='Sort result by a field, used for pagination')
 @click.option('--asc/--desc', 'sort_ascending', default=False, help='Sort direction. "desc" (default) for ascending, "desc" for descending')
-@click.option('--format', 'print_format', default="pretty", expose_value=True, is_eager=False, callback=show_header, help='Format type i.e. pretty, csv')
+@click.option('--from', 'from_batch_id', callback=parse_batch_id, help='Start of the range of trades: a date (UTC) i.e. 2020-05-20 or 2020-05-20T13:30, or a batch id')
+@click.option('--to', 'to_batch_id', callback=parse_batch_id, help='End of the range of trades (excluded): a date (UTC) or a batch id')
+@click.option('--format', 'print_format', default="pretty", expose_value=True, is_eager=False, callback=show_header, help='Format type i.e. pretty, csv, jsonl, parquet, arrow')
 @click.option('-v', '--verbose', count=True)
 @click.option('--trader', help='Ethereum address of the trader')
 @click.option('--batch', 'batch_id', help='Batch id')
 @click.option('--buy', 'buy_token_id', help='Buy token id')
 @click.option('--sell', 'sell_token_id', help='Sell token id')
 @click.option('--tx', 'tx_hash', help='Transaction hash for the trade (same as solution submission)')
-def trades(count, skip, sort, sort_ascending, print_format, verbose, trader, batch_id, buy_token_id, sell_token_id, tx_hash):
+@click.option('--follow', is_flag=True, help='Keep running, printing the new trades as they appear (after the last ones, oldest first)')
+@click.option('--local', is_flag=True, help='Query the local mirror (see "sync") instead of the subgraph')
+@click.option('--network', 'networks', callback=parse_networks, help='Query these networks at the same time i.e. mainnet,xdai or all (instead of the NETWORK env var), adding a network column')
+@common_options
+def trades(count, skip, fetch_all, limit, parallel, sort, sort_ascending, print_format, verbose, trader, batch_id, buy_token_id, sell_token_id, tx_hash, follow, local, networks, from_batch_id, to_batch_id):
     """Get trades"""
-    get_trades(count=count, skip=skip, sort=sort, sort_ascending=sort_ascending, print_format=print_format, verbose=verbose, trader=trader, batch_id=batch_id, buy_token_id=buy_token_id, sell_token_id=sell_token_id, tx_hash=tx_hash)
+    from commands.trades import get_trades
+    get_trades(count=count, skip=skip, fetch_all=fetch_all, limit=limit, parallel=parallel, sort=sort, sort_ascending=sort_ascending, print_format=print_format, verbose=verbose, trader=trader, batch_id=batch_id, buy_token_id=buy_token_id, sell_token_id=sell_token_id, tx_hash=tx_hash, follow=follow, local=local, networks=networks, from_batch_id=from_batch_id, to_batch_id=to_batch_id)
 
 
 @main.command()
 @click.option('--count', default=10, help='Number of orders to return, used for pagination')
 @click.option('--skip', default=0, help='Number of orders to skip, used for pagination')
+@click.option('--all', 'fetch_all', is_flag=True, help='Return all orders, fetching as many pages as needed')
+@click.option('--limit', type=int, help='Number of orders to return, fetching as many pages as needed')
+@click.option('--parallel', type=click.IntRange(min=1), help='Fetch the createEpoch range split in this many parts at the same time (requires sorting by createEpoch)')
 @click.option('--sort', default="createEpoch", help='Sort result by a field, used for pagination')
 @click.option('--asc/--desc', 'sort_ascending', default=False, help='Sort direction. "desc" (default) for ascending, "desc" for descending')
-@click.option('--format', 'print_format', default="pretty", expose_value=True, is_eager=False, callback=show_header, help='Format type i.e. pretty, csv')
+@click.option('--from', 'from_batch_id', callback=parse_batch_id, help='Start of the range of orders placed: a date (UTC) i.e. 2020-05-20 or 2020-05-20T13:30, or a batch id')
+@click.option('--to', 'to_batch_id', callback=parse_batch_id, help='End of the range of orders placed (excluded): a date (UTC) or a batch id')
+@click.option('--format', 'print_format', default="pretty", expose_value=True, is_eager=False, callback=show_header, help='Format type i.e. pretty, csv, jsonl, parquet, arrow')
 @click.option('-v', '--verbose', count=True)
 @click.option('--trader', help='Ethereum address of the trader')
 @click.option('--id', 'order_id', help='Order id')
@@ -106,9 +207,100 @@ def trades(count, skip, sort, sort_ascending, print_format, verbose, trader, bat
 @click.option('--sell', 'sell_token_id', help='Sell token id')
 @click.option('--traded/--not-traded', 'has_traded', default=None, help='The order has been executed, either totally or partially')
 @click.option('--tx', 'tx_hash', help='Transaction hash for the trade (same as solution submission)')
-def orders(count, skip, sort, sort_ascending, print_format, verbose, trader, order_id, buy_token_id, sell_token_id, has_traded, tx_hash):
+@click.option('--follow', is_flag=True, help='Keep running, printing the new orders as they appear (after the last ones, oldest first)')
+@click.option('--local', is_flag=True, help='Query the local mirror (see "sync") instead of the subgraph')
+@click.option('--network', 'networks', callback=parse_networks, help='Query these networks at the same time i.e. mainnet,xdai or all (instead of the NETWORK env var), adding a network column')
+@common_options
+def orders(count, skip, fetch_all, limit, parallel, sort, sort_ascending, print_format, verbose, trader, order_id, buy_token_id, sell_token_id, has_traded, tx_hash, follow, local, networks, from_batch_id, to_batch_id):
     """Get orders"""
-    get_orders(count=count, skip=skip, sort=sort, sort_ascending=sort_ascending, print_format=print_format, verbose=verbose, trader=trader, order_id=order_id, buy_token_id=buy_token_id, sell_token_id=sell_token_id, has_traded=has_traded, tx_hash=tx_hash)
+    from commands.orders import get_orders
+    get_orders(count=count, skip=skip, fetch_all=fetch_all, limit=limit, parallel=parallel, sort=sort, sort_ascending=sort_ascending, print_format=print_format, verbose=verbose, trader=trader, order_id=order_id, buy_token_id=buy_token_id, sell_token_id=sell_token_id, has_traded=has_traded, tx_hash=tx_hash, follow=follow, local=local, networks=networks, from_batch_id=from_batch_id, to_batch_id=to_batch_id)
+
+
+@main.command()
+@click.option('--by', 'group_by', type=click.Choice(['sell', 'buy', 'pair', 'trader', 'hour', 'day', 'week', 'month']), default='pair', help='Add up the volume by sell token, buy token, pair, trader (and pair) or time bucket (and pair)')
+@click.option('--from', 'from_batch_id', callback=parse_batch_id, help='Start of the range of trades: a date (UTC) i.e. 2020-05-20 or 2020-05-20T13:30, or a batch id')
+@click.option('--to', 'to_batch_id', callback=parse_batch_id, help='End of the range of trades (excluded): a date (UTC) or a batch id')
+@click.option('--parallel', type=click.IntRange(min=1), help='Fetch the tradeBatchId range split in this many parts at the same time')
+@click.option('--format', 'print_format', default="pretty", expose_value=True, is_eager=False, callback=show_header, help='Format type i.e. pretty, csv, jsonl, parquet, arrow')
+@click.option('-v', '--verbose', count=True)
+@click.option('--trader', help='Ethereum address of the trader')
+@click.option('--buy', 'buy_token_id', help='Buy token id')
+@click.option('--sell', 'sell_token_id', help='Sell token id')
+@click.option('--local', is_flag=True, help='Query the local mirror (see "sync") instead of the subgraph')
+@click.option('--network', 'networks', callback=parse_networks, help='Query these networks at the same time i.e. mainnet,xdai or all (instead of the NETWORK env var), adding a network column')
+@common_options
+def volume(group_by, from_batch_id, to_batch_id, parallel, print_format, verbose, trader, buy_token_id, sell_token_id, local, networks):
+    """Get the traded volume (not reverted) of a range of batches"""
+    from commands.volume import get_volume
+    get_volume(group_by=group_by, from_batch_id=from_batch_id, to_batch_id=to_batch_id, parallel=parallel, print_format=print_format, verbose=verbose, trader=trader, buy_token_id=buy_token_id, sell_token_id=sell_token_id, local=local, networks=networks)
+
+
+@main.command()
+@click.option('--interval', default='hour', help='Interval of the candles i.e. hour, day or a number of batches (of 5 minutes)')
+@click.option('--count', default=100, help='Number of intervals to return, ending with the last one')
+@click.option('--all', 'fetch_all', is_flag=True, help='Return all the candles')
+@click.option('--token', 'token_id', help='Token id')
+@click.option('--from', 'from_batch_id', callback=parse_batch_id, help='Start of the range of candles: a date (UTC) i.e. 2020-05-20 or 2020-05-20T13:30, or a batch id')
+@click.option('--to', 'to_batch_id', callback=parse_batch_id, help='End of the range of candles (excluded): a date (UTC) or a batch id')
+@click.option('--format', 'print_format', default="pretty", expose_value=True, is_eager=False, callback=show_header, help='Format type i.e. pretty, csv, jsonl, parquet, arrow')
+@click.option('-v', '--verbose', count=True)
+@click.option('--local', is_flag=True, help='Query the local mirror (see "sync") instead of the subgraph')
+@click.option('--rebuild', is_flag=True, help='Discard the cached candles and build them again from scratch')
+@common_options
+def candles(interval, count, fetch_all, token_id, print_format, verbose, local, rebuild, from_batch_id, to_batch_id):
+    """Get price candles (open, high, low, close and volume) of the tokens"""
+    from commands.candles import get_candles
+    get_candles(interval=interval, count=count, fetch_all=fetch_all, token_id=token_id, print_format=print_format, verbose=verbose, local=local, rebuild=rebuild, from_batch_id=from_batch_id, to_batch_id=to_batch_id)
+
+
+@main.command()
+@click.option('--base', 'base_token_id', required=True, help='Base token id (the volume is in base tokens)')
+@click.option('--quote', 'quote_token_id', required=True, help='Quote token id (the prices are in quote tokens per base token)')
+@click.option('--batch', 'batch_ids', type=int, multiple=True, help='Batch id of the book, the current one by default. Repeat it to get several books fetching the orders once')
+@click.option('--levels', default=10, help='Number of depth levels of each side')
+@click.option('--decimals', default=6, help='Decimals of the prices of the depth levels')
+@click.option('--format', 'print_format', default="pretty", expose_value=True, is_eager=False, callback=show_header, help='Format type i.e. pretty, csv, jsonl, parquet, arrow')
+@click.option('-v', '--verbose', count=True)
+@click.option('--local', is_flag=True, help='Query the local mirror (see "sync") instead of the subgraph')
+@common_options
+def orderbook(base_token_id, quote_token_id, batch_ids, levels, decimals, print_format, verbose, local):
+    """Get the order book (depth levels of the active orders) of a token pair"""
+    from commands.orderbook import get_orderbook
+    get_orderbook(base_token_id=base_token_id, quote_token_id=quote_token_id, batch_ids=batch_ids, levels=levels, decimals=decimals, print_format=print_format, verbose=verbose, local=local)
+
+
+@main.command()
+@click.option('--trader', 'address', required=True, help='Ethereum address of the trader')
+@click.option('--count', default=20, help='Number of recent orders and trades')
+@click.option('--from', 'from_batch_id', callback=parse_batch_id, help='Start of the range of recent orders and trades: a date (UTC) i.e. 2020-05-20 or 2020-05-20T13:30, or a batch id')
+@click.option('--to', 'to_batch_id', callback=parse_batch_id, help='End of the range of recent orders and trades (excluded): a date (UTC) or a batch id')
+@click.option('--format', 'print_format', default="pretty", expose_value=True, is_eager=False, callback=show_header, help='Format type i.e. pretty, jsonl')
+@click.option('-v', '--verbose', count=True)
+@common_options
+def trader(address, count, print_format, verbose, from_batch_id, to_batch_id):
+    """Get a summary of a trader: open exposure, fill ratio of the recent orders and volume by token, in a single query"""
+    from commands.trader import get_trader
+    get_trader(address=address, count=count, print_format=print_format, verbose=verbose, from_batch_id=from_batch_id, to_batch_id=to_batch_id)
+
+
+@main.command()
+@click.option('--full', is_flag=True, help='Discard the local mirror and sync it again from scratch')
+@click.option('-v', '--verbose', count=True)
+@profile_options
+def sync(full, verbose):
+    """Sync the local mirror of the subgraph, used by the commands with --local"""
+    from commands.sync import sync as run_sync
+    run_sync(full=full, verbose=verbose)
+
+
+@main.command()
+@click.option('--host', default='127.0.0.1', help='Address to listen on')
+@click.option('--port', default=8080, help='Port to listen on')
+def serve(host, port):
+    """Serve the tokens, trades, orders, prices and volume commands over HTTP (i.e. GET /trades?trader=0x...&format=csv), sharing a warm client and caches"""
+    from commands.serve import serve as run_serve
+    run_serve(host=host, port=port)
 
 
 if __name__ == "__main__":
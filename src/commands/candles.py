@@ -0,0 +1,345 @@
+from commands.tokens import Token, get_token_columns, to_token, to_token_record
+from fractions import Fraction
+from itertools import islice
+from typing import NamedTuple
+import sqlite3
+
+from constants import (BATCH_TIME_SECONDS, COLOR_LABEL, COLOR_SEPARATOR,
+                       OWL_DECIMALS, PAGE_SIZE, SEPARATOR)
+from utils.format import FormatContext, format_amount_in_weis, format_integer, format_ratio
+from utils.export import EXPORT_FORMATS, export_records
+from utils.graphql import paginate
+from utils.mirror import query_mirror
+from utils.misc import get_cache_path, get_csv_writer, get_current_batch_id, to_date_from_batch_id
+from utils.output import echo, flush_output, style_label
+from utils.profile import Phase, profile_rows
+
+CANDLES_FILE = 'candles.sqlite'
+
+# Only the fields needed to build the candles
+CANDLE_PRICE_FIELDS = '''
+  token { id }
+  batchId
+  priceInOwlNumerator
+  priceInOwlDenominator
+  volume
+'''
+
+# Named intervals, in batches
+CANDLE_INTERVALS = {
+  'hour': 3600 // BATCH_TIME_SECONDS,
+  'day': 86400 // BATCH_TIME_SECONDS
+}
+
+# Columns of the exported candles (jsonl, parquet and arrow formats). Prices are exported as (exact) decimal strings
+CANDLE_COLUMNS = {
+  **get_token_columns('token'),
+  'batch_id': 'integer',
+  'date': 'date',
+  'open': 'string',
+  'high': 'string',
+  'low': 'string',
+  'close': 'string',
+  'volume': 'amount',
+  'prices': 'integer'
+}
+
+# Connections to the candle cache of each network (by path)
+candle_connections = {}
+
+
+class Candle(NamedTuple):
+  token: Token
+  batch_id: int
+  open: Fraction
+  high: Fraction
+  low: Fraction
+  close: Fraction
+  volume: int
+  prices: int
+
+  @property
+  def date(self):
+    return to_date_from_batch_id(self.batch_id)
+
+
+def parse_interval(interval):
+  """Number of batches of an interval: hour, day or a number of batches"""
+  if interval in CANDLE_INTERVALS:
+    return CANDLE_INTERVALS[interval]
+  elif interval.isdigit() and int(interval) > 0:
+    return int(interval)
+  else:
+    raise Exception('Interval "%s" is not supported. Use hour, day or a number of batches' % interval)
+
+
+def get_candles(interval, count, print_format, verbose, token_id, fetch_all=False, local=False, rebuild=False, from_batch_id=None, to_batch_id=None):
+  batches = parse_interval(interval)
+  # Candles built from the local mirror and from the subgraph are cached apart, as the mirror can be behind
+  series = f'{batches}:{token_id or "all"}:{"local" if local else "subgraph"}'
+  if rebuild:
+    clear_candles(series)
+
+  last_batch_id = update_candles(series, batches, token_id, verbose, local, to_batch_id)
+  if from_batch_id is not None:
+    # Including the candle of the first batch of the range
+    from_batch_id -= from_batch_id % batches
+  elif not fetch_all and to_batch_id is None and last_batch_id is not None:
+    from_batch_id = last_batch_id - last_batch_id % batches - (count - 1) * batches
+
+  candles = profile_rows(query_candles(series, from_batch_id, to_batch_id), to_candle_dto)
+  print_candles(candles, print_format)
+
+
+def update_candles(series, batches, token_id, verbose, local, to_batch_id=None):
+  """Extend the cached candles of a series with the prices of the batches settled since it was last updated (until
+  to_batch_id, excluded), instead of building them again. Returns the last batch with prices of the series
+  """
+  connection = get_candle_cache()
+  last_batch_id = connection.execute('SELECT lastBatchId FROM series WHERE series = ?', (series,)).fetchone()
+  last_batch_id = last_batch_id[0] if last_batch_id else None
+
+  # Prices of the batches not settled yet can still change, they are never cached
+  last_settled_batch_id = get_current_batch_id() - 2
+  if to_batch_id is not None:
+    last_settled_batch_id = min(last_settled_batch_id, to_batch_id - 1)
+  if last_batch_id is not None and last_batch_id >= last_settled_batch_id:
+    return last_batch_id
+
+  filters = {
+    "token": token_id if token_id else None,
+    "batchId_gt": str(last_batch_id) if last_batch_id is not None else None,
+    "batchId_lte": str(last_settled_batch_id)
+  }
+  if local:
+    prices = query_mirror('prices', filters, 'batchId', True)
+  else:
+    prices = paginate('prices', CANDLE_PRICE_FIELDS, filters, 'batchId', True, verbose)
+
+  # The last candle of each token is still open: it's extended by the new prices of its interval
+  candles = {
+    token: [batch_id, *_to_candle_values(row)]
+    for token, batch_id, *row in connection.execute(
+      'SELECT token, MAX(batchId), open, high, low, close, volume, prices FROM candles WHERE series = ? GROUP BY token',
+      (series,)
+    )
+  }
+
+  prices = iter(prices)
+  pending = []
+  while True:
+    with Phase('fetch'):
+      fetched = list(islice(prices, PAGE_SIZE))
+    chunk, pending = pending + fetched, []
+    if not chunk:
+      break
+    if fetched:
+      # The prices of the last batch of the chunk can continue in the next one. They are aggregated with it, so the
+      # last batch id saved is always complete, and the next update doesn't skip the rest of its prices
+      split = len(chunk)
+      while split and int(chunk[split - 1]['batchId']) == int(chunk[-1]['batchId']):
+        split -= 1
+      chunk, pending = chunk[:split], chunk[split:]
+      if not chunk:
+        continue
+
+    with Phase('aggregate'):
+      changed = {}
+      for price in chunk:
+        batch_id, denominator = int(price['batchId']), int(price['priceInOwlDenominator'])
+        last_batch_id = batch_id
+        if not denominator:
+          continue
+
+        token = price['token']['id']
+        value, volume = Fraction(int(price['priceInOwlNumerator']), denominator), int(price['volume'])
+        start = batch_id - batch_id % batches
+        candle = candles.get(token)
+        if candle is None or candle[0] != start:
+          candle = candles[token] = [start, value, value, value, value, 0, 0]
+        else:
+          candle[2] = max(candle[2], value)
+          candle[3] = min(candle[3], value)
+          candle[4] = value
+        candle[5] += volume
+        candle[6] += 1
+        changed[token, start] = candle
+
+    with Phase('cache'):
+      with connection:
+        connection.executemany(
+          'INSERT OR REPLACE INTO candles (series, token, batchId, open, high, low, close, volume, prices) '
+          'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+          ((series, token, *_to_candle_row(candle)) for (token, _), candle in changed.items())
+        )
+        _set_last_batch_id(connection, series, last_batch_id)
+
+  return last_batch_id
+
+
+def query_candles(series, from_batch_id=None, to_batch_id=None):
+  query = (
+    'SELECT token, batchId, open, high, low, close, volume, prices FROM candles WHERE series = ?' +
+    (' AND batchId >= ?' if from_batch_id is not None else '') +
+    (' AND batchId < ?' if to_batch_id is not None else '') +
+    ' ORDER BY CAST(token AS INTEGER), batchId'
+  )
+  params = [series] + [value for value in (from_batch_id, to_batch_id) if value is not None]
+  for token, batch_id, *row in get_candle_cache().execute(query, params):
+    yield (token, batch_id, *_to_candle_values(row))
+
+
+def clear_candles(series):
+  connection = get_candle_cache()
+  with connection:
+    connection.execute('DELETE FROM candles WHERE series = ?', (series,))
+    connection.execute('DELETE FROM series WHERE series = ?', (series,))
+
+
+def get_candle_cache():
+  path = get_cache_path(CANDLES_FILE)
+  candle_connection = candle_connections.get(path)
+  if candle_connection is None:
+    candle_connection = candle_connections[path] = sqlite3.connect(path)
+    with candle_connection:
+      # Series of candles (by interval and token), and the last batch they include
+      candle_connection.execute('CREATE TABLE IF NOT EXISTS series (series TEXT PRIMARY KEY, lastBatchId INTEGER)')
+      # Prices are stored as fractions ("numerator/denominator"), and volumes as text, as they don't fit in an INTEGER
+      candle_connection.execute('''
+        CREATE TABLE IF NOT EXISTS candles (
+          series TEXT,
+          token TEXT,
+          batchId INTEGER,
+          open TEXT,
+          high TEXT,
+          low TEXT,
+          close TEXT,
+          volume TEXT,
+          prices INTEGER,
+          PRIMARY KEY (series, token, batchId)
+        )
+      ''')
+
+  return candle_connection
+
+
+def to_candle_dto(candle):
+  token, batch_id, open, high, low, close, volume, prices = candle
+  return Candle(
+    token=to_token({'id': token}),
+    batch_id=batch_id,
+    open=open,
+    high=high,
+    low=low,
+    close=close,
+    volume=volume,
+    prices=prices
+  )
+
+
+def print_candles(candles, print_format):
+  with Phase('render'):
+    try:
+      if print_format == 'pretty':
+        print_candles_pretty(candles)
+      elif print_format == 'csv':
+        print_candles_csv(candles)
+      elif print_format in EXPORT_FORMATS:
+        print_candles_records(candles, print_format)
+      else:
+        raise Exception('Format "%s" is not supported. Supported formats are: pretty, csv, %s' % (print_format, ', '.join(EXPORT_FORMATS)))
+    finally:
+      flush_output()
+
+
+def print_candles_pretty(candles):
+  context = FormatContext()
+  echo(style_label(SEPARATOR, COLOR_SEPARATOR))
+
+  for candle in candles:
+    echo(
+      style_label('  Token', COLOR_LABEL) + ': ' +
+      context.token_long(candle.token) + '\n' +
+
+      style_label('  Batch Id', COLOR_LABEL) + ': ' +
+      context.batch_id_with_date(candle.batch_id) + '\n\n' +
+
+      style_label('  Open', COLOR_LABEL) + ': ' + format_price_in_owl(candle.open) + '\n' +
+      style_label('  High', COLOR_LABEL) + ': ' + format_price_in_owl(candle.high) + '\n' +
+      style_label('  Low', COLOR_LABEL) + ': ' + format_price_in_owl(candle.low) + '\n' +
+      style_label('  Close', COLOR_LABEL) + ': ' + format_price_in_owl(candle.close) + '\n' +
+
+      style_label('  Volume', COLOR_LABEL) + ': ' +
+      format_amount_in_weis(candle.volume, candle.token.decimals) + ' ' + context.token_short(candle.token) + '\n' +
+
+      style_label('  Prices', COLOR_LABEL) + ': ' +
+      format_integer(candle.prices) + '\n' +
+
+      style_label(SEPARATOR, COLOR_SEPARATOR)
+    )
+
+
+def print_candles_csv(candles):
+  context = FormatContext()
+  writer = get_csv_writer()
+
+  writer.writerow(['Token',
+                   'Registered',
+                   'Batch Id',
+                   'Batch Start',
+                   'Open',
+                   'High',
+                   'Low',
+                   'Close',
+                   'Volume',
+                   'Prices'])
+
+  for candle in candles:
+    writer.writerow([
+      context.token_short(candle.token),
+      candle.token.address,
+      candle.batch_id,
+      context.batch_date_iso8601(candle.batch_id),
+      format_price_in_owl(candle.open, thousands_separator=False),
+      format_price_in_owl(candle.high, thousands_separator=False),
+      format_price_in_owl(candle.low, thousands_separator=False),
+      format_price_in_owl(candle.close, thousands_separator=False),
+      format_amount_in_weis(candle.volume, candle.token.decimals, thousands_separator=False),
+      candle.prices
+    ])
+
+
+def print_candles_records(candles, print_format):
+  records = (
+    {
+      **to_token_record(candle.token, 'token'),
+      'batch_id': candle.batch_id,
+      'date': candle.date,
+      'open': format_price_in_owl(candle.open, thousands_separator=False),
+      'high': format_price_in_owl(candle.high, thousands_separator=False),
+      'low': format_price_in_owl(candle.low, thousands_separator=False),
+      'close': format_price_in_owl(candle.close, thousands_separator=False),
+      'volume': candle.volume,
+      'prices': candle.prices
+    }
+    for candle in candles
+  )
+  export_records(records, CANDLE_COLUMNS, print_format)
+
+
+def format_price_in_owl(price, thousands_separator=True):
+  return format_ratio(price.numerator, price.denominator, decimals=OWL_DECIMALS, thousands_separator=thousands_separator)
+
+
+def _to_candle_values(row):
+  open, high, low, close, volume, prices = row
+  return [Fraction(open), Fraction(high), Fraction(low), Fraction(close), int(volume), prices]
+
+
+def _to_candle_row(candle):
+  batch_id, open, high, low, close, volume, prices = candle
+  return [batch_id, str(open), str(high), str(low), str(close), str(volume), prices]
+
+
+def _set_last_batch_id(connection, series, last_batch_id):
+  connection.execute('INSERT OR REPLACE INTO series (series, lastBatchId) VALUES (?, ?)', (series, last_batch_id))
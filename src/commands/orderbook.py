@@ -0,0 +1,264 @@
+from bisect import bisect_right
+from commands.tokens import to_token
+from decimal import ROUND_DOWN, ROUND_UP, Decimal
+from typing import NamedTuple
+
+from constants import (BATCH_TIME_SECONDS, COLOR_LABEL, COLOR_LABEL_DELETED,
+                       COLOR_SECONDARY, COLOR_SEPARATOR, SEPARATOR)
+from utils.format import FormatContext, format_amount, format_amount_in_weis, format_integer
+from utils.export import EXPORT_FORMATS, export_records
+from utils.graphql import paginate
+from utils.mirror import query_mirror
+from utils.misc import calculate_price, get_csv_writer, get_current_batch_id, is_unlimited_amount
+from utils.output import echo, flush_output, style, style_label
+from utils.profile import Phase, profile_rows
+
+# Only the fields needed to place the orders in the book
+ORDERBOOK_FIELDS = '''
+    fromBatchId
+    untilBatchId
+    buyToken { id }
+    sellToken { id }
+    priceNumerator
+    priceDenominator
+    maxSellAmount
+    soldVolume
+    cancelEpoch
+    deleteEpoch
+'''
+
+# Columns of the exported depth levels (jsonl, parquet and arrow formats). Prices are exported as decimal strings, and
+# the volumes of levels with unlimited orders are empty
+ORDERBOOK_COLUMNS = {
+  'batch_id': 'integer',
+  'side': 'string',
+  'price': 'string',
+  'volume': 'amount',
+  'cumulative_volume': 'amount',
+  'orders': 'integer'
+}
+
+
+class BookOrder(NamedTuple):
+  # Limit price, in quote tokens per base token
+  price: Decimal
+  # Batches where the order is active: from_batch_id <= batch < end_batch_id
+  from_batch_id: int
+  end_batch_id: int
+  # Remaining volume in base token (weis), None if unlimited
+  volume: int
+
+
+class Level(NamedTuple):
+  side: str
+  price: Decimal
+  volume: int
+  cumulative_volume: int
+  orders: int
+
+
+class OrderBookSide:
+  """Orders of one side of the book, sorted by price (best first). Only the orders that start or end between the last
+  batch and the new one are checked when moving to another batch"""
+
+  def __init__(self, orders, best_first):
+    self.orders = sorted(orders, key=lambda order: order.price, reverse=best_first == 'highest')
+    self.active = [False] * len(self.orders)
+    self.starts = sorted((order.from_batch_id, index) for index, order in enumerate(self.orders))
+    self.ends = sorted((order.end_batch_id, index) for index, order in enumerate(self.orders))
+
+  def move(self, from_batch_id, batch_id):
+    if from_batch_id is None:
+      changed = range(len(self.orders))
+    else:
+      low, high = sorted((from_batch_id, batch_id))
+      changed = {
+        index
+        for events in (self.starts, self.ends)
+        for _, index in events[bisect_right(events, (low, len(self.orders))):bisect_right(events, (high, len(self.orders)))]
+      }
+
+    for index in changed:
+      order = self.orders[index]
+      self.active[index] = order.from_batch_id <= batch_id < order.end_batch_id
+
+  def get_levels(self, side, decimals, rounding, levels):
+    """Depth levels: active orders added up by price (rounded to some decimals), with the cumulative volume"""
+    quantizer = Decimal(10) ** -decimals
+    result = []
+    cumulative_volume = 0
+    for order, active in zip(self.orders, self.active):
+      if not active:
+        continue
+
+      price = order.price.quantize(quantizer, rounding=rounding)
+      if not result or result[-1].price != price:
+        if len(result) == levels:
+          break
+        result.append(Level(side, price, 0, cumulative_volume, 0))
+
+      level = result[-1]
+      volume = None if order.volume is None or level.volume is None else level.volume + order.volume
+      cumulative_volume = None if order.volume is None or cumulative_volume is None else cumulative_volume + order.volume
+      result[-1] = level._replace(volume=volume, cumulative_volume=cumulative_volume, orders=level.orders + 1)
+
+    return result
+
+
+class OrderBook:
+  """Index of the orders of a pair, to get the book at any batch of a range without fetching the orders again"""
+
+  def __init__(self, asks, bids):
+    self.asks = OrderBookSide(asks, best_first='lowest')
+    self.bids = OrderBookSide(bids, best_first='highest')
+    self.batch_id = None
+
+  def at(self, batch_id, decimals, levels):
+    """Depth levels of the asks and bids at a batch"""
+    self.asks.move(self.batch_id, batch_id)
+    self.bids.move(self.batch_id, batch_id)
+    self.batch_id = batch_id
+    return (
+      self.asks.get_levels('ask', decimals, ROUND_UP, levels),
+      self.bids.get_levels('bid', decimals, ROUND_DOWN, levels)
+    )
+
+
+def get_orderbook(base_token_id, quote_token_id, batch_ids, levels, decimals, print_format, verbose, local=False):
+  base_token, quote_token = to_token({'id': base_token_id}), to_token({'id': quote_token_id})
+  batch_ids = list(batch_ids) or [get_current_batch_id()]
+
+  # Orders of the pair (either way) active at some point of the range
+  filters = {
+    "sellToken_in": [base_token_id, quote_token_id],
+    "buyToken_in": [base_token_id, quote_token_id],
+    "fromBatchId_lte": max(batch_ids),
+    "untilBatchId_gte": min(batch_ids)
+  }
+  if local:
+    orders = query_mirror('orders', filters, 'createEpoch', True)
+  else:
+    orders = paginate('orders', ORDERBOOK_FIELDS, filters, 'createEpoch', True, verbose)
+
+  asks, bids = [], []
+  for order in profile_rows(orders, lambda order: to_book_order(order, base_token, quote_token)):
+    if order is not None:
+      (asks if order[0] == 'ask' else bids).append(order[1])
+
+  book = OrderBook(asks, bids)
+  print_orderbook(
+    ((batch_id, *book.at(batch_id, decimals, levels)) for batch_id in batch_ids),
+    base_token,
+    quote_token,
+    print_format
+  )
+
+
+def to_book_order(order, base_token, quote_token):
+  """Side and BookOrder of an order of the pair, or None if it has no volume left (or no valid price)"""
+  numerator, denominator = int(order['priceNumerator']), int(order['priceDenominator'])
+  max_sell_amount = int(order['maxSellAmount'])
+  remaining = max_sell_amount - int(order['soldVolume'])
+  if remaining <= 0 or not numerator or not denominator:
+    return None
+
+  # Cancelled (or deleted) orders are not active since the batch they were cancelled in
+  end_batch_id = int(order['untilBatchId']) + 1
+  for epoch in (order['cancelEpoch'], order['deleteEpoch']):
+    if epoch is not None:
+      end_batch_id = min(end_batch_id, int(epoch) // BATCH_TIME_SECONDS)
+
+  unlimited = is_unlimited_amount(max_sell_amount)
+  if order['sellToken']['id'] == base_token.id:
+    # Sells base for (at least) numerator / denominator quote tokens
+    price = calculate_price(numerator, denominator, quote_token.decimals, base_token.decimals)
+    volume = None if unlimited else remaining
+    side = 'ask'
+  else:
+    # Buys (at least) numerator base tokens for denominator quote tokens
+    price = calculate_price(denominator, numerator, quote_token.decimals, base_token.decimals)
+    volume = None if unlimited else remaining * numerator // denominator
+    side = 'bid'
+
+  return side, BookOrder(price, int(order['fromBatchId']), end_batch_id, volume)
+
+
+def print_orderbook(books, base_token, quote_token, print_format):
+  with Phase('render'):
+    try:
+      if print_format == 'pretty':
+        print_orderbook_pretty(books, base_token, quote_token)
+      elif print_format == 'csv':
+        print_orderbook_csv(books, base_token)
+      elif print_format in EXPORT_FORMATS:
+        print_orderbook_records(books, print_format)
+      else:
+        raise Exception('Format "%s" is not supported. Supported formats are: pretty, csv, %s' % (print_format, ', '.join(EXPORT_FORMATS)))
+    finally:
+      flush_output()
+
+
+def print_orderbook_pretty(books, base_token, quote_token):
+  context = FormatContext()
+  base_label, quote_label = context.token_short(base_token), context.token_short(quote_token)
+  echo(style_label(SEPARATOR, COLOR_SEPARATOR))
+
+  for batch_id, asks, bids in books:
+    echo(
+      style_label('  Batch Id', COLOR_LABEL) + ': ' + context.batch_id_with_date(batch_id) + '\n' +
+      style_label('  Pair', COLOR_LABEL) + ': ' + context.token_long(base_token) + ' / ' + context.token_long(quote_token) + '\n' +
+      style(f'  {"Price " + quote_label + "/" + base_label:>30} {"Volume " + base_label:>30} {"Cumulative":>30} {"Orders":>7}', fg=COLOR_SECONDARY)
+    )
+
+    # Asks from the highest price to the best one, so both sides meet at the spread
+    for level in reversed(asks):
+      echo(_format_level(level, base_token, COLOR_LABEL_DELETED))
+    echo(style('  ' + '-' * 100, fg=COLOR_SECONDARY))
+    for level in bids:
+      echo(_format_level(level, base_token, COLOR_LABEL))
+
+    echo(style_label(SEPARATOR, COLOR_SEPARATOR))
+
+
+def print_orderbook_csv(books, base_token):
+  writer = get_csv_writer()
+
+  writer.writerow(['Batch Id', 'Side', 'Price', 'Volume', 'Cumulative Volume', 'Orders'])
+  for batch_id, asks, bids in books:
+    for level in asks + bids:
+      writer.writerow([
+        batch_id,
+        level.side,
+        format_amount(level.price, thousands_separator=False),
+        _format_volume(level.volume, base_token, thousands_separator=False),
+        _format_volume(level.cumulative_volume, base_token, thousands_separator=False),
+        level.orders
+      ])
+
+
+def print_orderbook_records(books, print_format):
+  records = (
+    {
+      'batch_id': batch_id,
+      'side': level.side,
+      'price': format_amount(level.price, thousands_separator=False),
+      'volume': level.volume,
+      'cumulative_volume': level.cumulative_volume,
+      'orders': level.orders
+    }
+    for batch_id, asks, bids in books
+    for level in asks + bids
+  )
+  export_records(records, ORDERBOOK_COLUMNS, print_format)
+
+
+def _format_level(level, base_token, color):
+  return style(
+    f'  {format_amount(level.price):>30} {_format_volume(level.volume, base_token):>30} '
+    f'{_format_volume(level.cumulative_volume, base_token):>30} {format_integer(level.orders):>7}',
+    fg=color
+  )
+
+
+def _format_volume(volume, token, thousands_separator=True):
+  return 'Unlimited' if volume is None else format_amount_in_weis(volume, token.decimals, thousands_separator=thousands_separator)
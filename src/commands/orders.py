@@ -1,34 +1,29 @@
 
-from commands.tokens import TOKEN_FIELDS_BASIC, to_token
-from decimal import Decimal
-
-import click
-from gql import gql
+from commands.tokens import Token, get_token_columns, to_token, to_token_record
+from typing import NamedTuple
 
 from constants import (COLOR_LABEL, COLOR_LABEL_DELETED, COLOR_SECONDARY,
                        COLOR_SEPARATOR, SEPARATOR)
-from utils.format import (format_amount, format_amount_in_weis,
-                          format_batch_id_with_date, format_date_time,
-                          format_integer, format_percentage, format_price,
-                          format_token_long, format_token_short,
-                          parse_date_from_epoch,
-                          format_date_time_iso8601,)
-from utils.graphql import (debug_query, get_graphql_client, gql_filter,
-                           gql_sort_by)
-from utils.misc import (calculate_price, is_unlimited_amount,
-                        to_date_from_batch_id, to_date_from_epoch,
-                        to_etherscan_link,
-                        get_csv_writer)
+from utils.format import (FormatContext, format_amount_in_weis, format_integer,
+                          format_percentage, format_price_ratio, format_ratio,
+                          parse_date_from_epoch)
+from utils.export import EXPORT_FORMATS, export_records
+from utils.follow import follow_pages
+from utils.graphql import gql_range_filter, paginate, paginate_networks, paginate_parallel
+from utils.mirror import query_mirror
+from utils.misc import is_unlimited_amount, to_etherscan_link, get_csv_writer
+from utils.output import echo, flush_output, style, style_label
+from utils.profile import Phase, profile_rows
 
 # Orders entity fields
 #   See https://thegraph.com/explorer/subgraph/gnosis/protocol
-ORDERS_FIELDS = f'''
-    owner {{ id }}
+ORDERS_FIELDS = '''
+    owner { id }
     orderId
     fromBatchId
     untilBatchId
-    buyToken {{ {TOKEN_FIELDS_BASIC} }}
-    sellToken {{ {TOKEN_FIELDS_BASIC} }}
+    buyToken { id }
+    sellToken { id }
     priceNumerator
     priceDenominator
     maxSellAmount
@@ -40,84 +35,181 @@ ORDERS_FIELDS = f'''
     txHash
 '''
 
-def get_orders(count, skip, sort, sort_ascending, print_format, verbose, trader, order_id, buy_token_id, sell_token_id, has_traded, tx_hash):
-    filters = gql_filter({
+# Columns of the exported orders (jsonl, parquet and arrow formats)
+ORDER_COLUMNS = {
+  'order_id': 'integer',
+  'trader': 'string',
+  'from_batch_id': 'integer',
+  'until_batch_id': 'integer',
+  **get_token_columns('sell_token'),
+  **get_token_columns('buy_token'),
+  'price_numerator': 'amount',
+  'price_denominator': 'amount',
+  'max_sell_amount': 'amount',
+  'sold_volume': 'amount',
+  'bought_volume': 'amount',
+  'create_date': 'date',
+  'cancel_date': 'date',
+  'delete_date': 'date',
+  'tx_hash': 'string'
+}
+
+def get_orders(count, skip, sort, sort_ascending, print_format, verbose, trader, order_id, buy_token_id, sell_token_id, has_traded, tx_hash, fetch_all=False, limit=None, parallel=None, local=False, networks=None, follow=False, from_batch_id=None, to_batch_id=None):
+    filters = {
       "owner": trader.lower() if trader else None,
       "orderId": int(order_id) if order_id else None,
       "buyToken": buy_token_id if buy_token_id else None,
       "sellToken": sell_token_id if sell_token_id else None,
       "soldVolume_gt": 0 if has_traded == True else None,
       "soldVolume": 0 if has_traded == False else None,
-      "txHash": tx_hash.lower() if tx_hash else None
-    })
-
-    query = f'''
-{{
-  orders (first: {count} , skip: {skip}, {gql_sort_by(sort, sort_ascending)}{filters}) {{ {ORDERS_FIELDS} }}
-}}
-    '''
-    
-    debug_query(query, verbose)
-    client = get_graphql_client()
-    result = client.execute(gql(query))
-    orders_dto = [to_order_dto(order) for order in result['orders']] 
-    print_orders(orders_dto, print_format)
-
-
-def print_orders(orders, print_format):
-  if print_format == 'pretty':    
-    print_orders_pretty(orders)
-  elif print_format == 'csv':
-    print_orders_csv(orders)
-  else:
-    raise Exception('Format "%s" is not supported. Supported formats are: pretty, csv' % (print_format))  
+      "txHash": tx_hash.lower() if tx_hash else None,
+      **gql_range_filter('createEpoch', from_batch_id, to_batch_id)
+    }
+
+    if follow:
+      if sort != 'createEpoch':
+        raise Exception('Following orders requires sorting by createEpoch')
+      if local or networks:
+        raise Exception('Following orders is only supported for the subgraph of a single network')
+
+      orders_dto = (
+        order
+        for page in follow_pages('orders', ORDERS_FIELDS, filters, sort, verbose, limit or count)
+        for order in profile_rows(page, to_order_dto)
+      )
+      print_orders(orders_dto, print_format)
+      return
+
+    def fetch_orders():
+      if local:
+        return query_mirror('orders', filters, sort, sort_ascending, skip=skip, limit=None if fetch_all else (limit or count))
+      elif parallel:
+        if sort != 'createEpoch':
+          raise Exception('Parallel fetching of orders requires sorting by createEpoch')
+
+        return paginate_parallel(
+          entity='orders',
+          fields=ORDERS_FIELDS,
+          filters=filters,
+          sort=sort,
+          sort_ascending=sort_ascending,
+          verbose=verbose,
+          partitions=parallel,
+          skip=skip,
+          limit=None if fetch_all else (limit or count)
+        )
+      else:
+        return paginate(
+          entity='orders',
+          fields=ORDERS_FIELDS,
+          filters=filters,
+          sort=sort,
+          sort_ascending=sort_ascending,
+          verbose=verbose,
+          skip=skip,
+          limit=None if fetch_all else (limit or count)
+        )
+
+    orders = paginate_networks(networks, fetch_orders) if networks else fetch_orders()
+    orders_dto = profile_rows(orders, to_order_dto)
+    print_orders(orders_dto, print_format, with_network=bool(networks))
+
+
+def print_orders(orders, print_format, with_network=False):
+  with Phase('render'):
+    try:
+      if print_format == 'pretty':    
+        print_orders_pretty(orders)
+      elif print_format == 'csv':
+        print_orders_csv(orders, with_network)
+      elif print_format in EXPORT_FORMATS:
+        print_orders_records(orders, print_format, with_network)
+      else:
+        raise Exception('Format "%s" is not supported. Supported formats are: pretty, csv, %s' % (print_format, ', '.join(EXPORT_FORMATS)))
+    finally:
+      flush_output()
+
+
+class Order(NamedTuple):
+  owner_address: str
+  order_id: int
+  from_batch_id: int
+  until_batch_id: int
+  sell_token: Token
+  buy_token: Token
+  price_numerator: int
+  price_denominator: int
+  max_sell_amount: int
+  sold_volume: int
+  bought_volume: int
+  create_epoch: str
+  cancel_epoch: str
+  delete_epoch: str
+  tx_hash: str
+  network: str = None
+
+  # Dates are decoded when used
+  @property
+  def create_date(self):
+    return parse_date_from_epoch(self.create_epoch)
+
+  @property
+  def cancel_date(self):
+    return parse_date_from_epoch(self.cancel_epoch)
+
+  @property
+  def delete_date(self):
+    return parse_date_from_epoch(self.delete_epoch)
 
 
 def to_order_dto(order):
-  return {
-    "owner_address": order['owner']['id'],
-    "order_id": int(order['orderId']),
-    "from_batch_id": int(order['fromBatchId']),
-    "until_batch_id": int(order['untilBatchId']),
-    "sell_token": to_token(order['sellToken']),
-    "buy_token": to_token(order['buyToken']),
-    "price_numerator": Decimal(order['priceNumerator']),
-    "price_denominator": Decimal(order['priceDenominator']),
-    "max_sell_amount": Decimal(order['maxSellAmount']),
-    "sold_volume": Decimal(order['soldVolume']),
-    "bought_volume": Decimal(order['boughtVolume']),
-    "create_date": parse_date_from_epoch(order['createEpoch']),
-    "cancel_date": parse_date_from_epoch(order['cancelEpoch']),
-    "delete_date": parse_date_from_epoch(order['deleteEpoch']),
-    "tx_hash": order['txHash']
-  }
+  network = order.get('network')
+  return Order(
+    owner_address=order['owner']['id'],
+    order_id=int(order['orderId']),
+    from_batch_id=int(order['fromBatchId']),
+    until_batch_id=int(order['untilBatchId']),
+    sell_token=to_token(order['sellToken'], network),
+    buy_token=to_token(order['buyToken'], network),
+    price_numerator=int(order['priceNumerator']),
+    price_denominator=int(order['priceDenominator']),
+    max_sell_amount=int(order['maxSellAmount']),
+    sold_volume=int(order['soldVolume']),
+    bought_volume=int(order['boughtVolume']),
+    create_epoch=order['createEpoch'],
+    cancel_epoch=order['cancelEpoch'],
+    delete_epoch=order['deleteEpoch'],
+    tx_hash=order['txHash'],
+    network=network
+  )
 
 
 def print_orders_pretty(orders):
-  click.echo(click.style(SEPARATOR, fg=COLOR_SEPARATOR))
+  context = FormatContext()
+  echo(style_label(SEPARATOR, COLOR_SEPARATOR))
 
   for order in orders:
-    cancel_date, delete_date = order['cancel_date'], order['delete_date']
-    price_numerator, price_denominator = order['price_numerator'], order['price_denominator']
-    sell_token, sold_volume, max_sell_amount = order['sell_token'], order['sold_volume'], order['max_sell_amount']
-    buy_token, bought_volume = order['buy_token'], order['bought_volume']
-    sellTokenDecimals, sellTokenLabel = sell_token['decimals'], format_token_short(sell_token)
-    buyTokenDecimals, buyTokenLabel = buy_token['decimals'], format_token_short(buy_token)
+    cancel_date, delete_date = context.epoch_date_time(order.cancel_epoch), context.epoch_date_time(order.delete_epoch)
+    price_numerator, price_denominator = order.price_numerator, order.price_denominator
+    sell_token, sold_volume, max_sell_amount = order.sell_token, order.sold_volume, order.max_sell_amount
+    buy_token, bought_volume = order.buy_token, order.bought_volume
+    sellTokenDecimals, sellTokenLabel = sell_token.decimals, context.token_short(sell_token)
+    buyTokenDecimals, buyTokenLabel = buy_token.decimals, context.token_short(buy_token)
 
     # Canceled trade date
     label_color = COLOR_LABEL
-    if cancel_date is None:
+    if not cancel_date:
       cancel_date_text = ''
     else:
       label_color = COLOR_LABEL_DELETED
-      cancel_date_text = click.style('  Cancel date', fg=label_color) + ': ' + click.style(format_date_time(cancel_date), bg=COLOR_LABEL_DELETED) + '\n'
+      cancel_date_text = style_label('  Cancel date', label_color) + ': ' + style(cancel_date, bg=COLOR_LABEL_DELETED) + '\n'
 
     # Deleted trade date
-    if delete_date is None:
+    if not delete_date:
       delete_date_text = ''
     else:
       label_color = COLOR_LABEL_DELETED
-      delete_date_text = click.style('  Deleted date', fg=label_color) + ': ' + click.style(format_date_time(delete_date), bg=COLOR_LABEL_DELETED) + '\n'
+      delete_date_text = style_label('  Deleted date', label_color) + ': ' + style(delete_date, bg=COLOR_LABEL_DELETED) + '\n'
 
 
     # Limit Price
@@ -173,35 +265,36 @@ def print_orders_pretty(orders):
     # Calculate percentage, if not unlimited amount
     percentageText = ''
     if not is_unlimited_amount(max_sell_amount):
-      percentageText = click.style(f" ({format_percentage(value=sold_volume, total=max_sell_amount)})", fg=COLOR_SECONDARY)
+      percentageText = style(f" ({format_percentage(value=sold_volume, total=max_sell_amount)})", fg=COLOR_SECONDARY)
 
-    click.echo(
-      click.style('  Order date', fg=label_color) + ': ' + 
-      format_date_time(order['create_date']) + '\n' +       
+    echo(
+      (style_label('  Network', label_color) + ': ' + order.network + '\n' if order.network else '') +
+      style_label('  Order date', label_color) + ': ' + 
+      context.epoch_date_time(order.create_epoch) + '\n' +       
       cancel_date_text + 
       delete_date_text + 
       '\n' + 
 
-      click.style('  Trader', fg=label_color) + ': ' + 
-      order['owner_address'] + '\n' + 
+      style_label('  Trader', label_color) + ': ' + 
+      order.owner_address + '\n' + 
 
-      click.style('  Order Id', fg=label_color) + ': ' + 
-      format_integer(order['order_id']) + '\n' + 
+      style_label('  Order Id', label_color) + ': ' + 
+      format_integer(order.order_id) + '\n' + 
 
-      click.style('  From batch', fg=label_color) + ': ' + 
-      format_batch_id_with_date(order['from_batch_id']) + '\n' +
+      style_label('  From batch', label_color) + ': ' + 
+      context.batch_id_with_date(order.from_batch_id) + '\n' +
 
-      click.style('  To batch', fg=label_color) + ': ' +
-      format_batch_id_with_date(order['until_batch_id']) + 
+      style_label('  To batch', label_color) + ': ' +
+      context.batch_id_with_date(order.until_batch_id) + 
       '\n\n' + 
 
-      click.style('  Sell Token', fg=label_color) + ': ' + 
-      format_token_long(sell_token) + '\n' + 
+      style_label('  Sell Token', label_color) + ': ' + 
+      context.token_long(sell_token) + '\n' + 
 
-      click.style('  Buy Token', fg=label_color) + ': ' + 
-      format_token_long(buy_token) + '\n' +
+      style_label('  Buy Token', label_color) + ': ' + 
+      context.token_long(buy_token) + '\n' +
 
-      click.style('  Sold volume', fg=label_color) + ': ' + 
+      style_label('  Sold volume', label_color) + ': ' + 
       format_amount_in_weis(sold_volume, sellTokenDecimals) +
       ' of ' +
       format_amount_in_weis(max_sell_amount, sellTokenDecimals) + ' ' + sellTokenLabel + 
@@ -209,7 +302,7 @@ def print_orders_pretty(orders):
       '\n' + 
 
       (
-        click.style('  Bought volume', fg=label_color) + ': ' + 
+        style_label('  Bought volume', label_color) + ': ' + 
         format_amount_in_weis(bought_volume, buyTokenDecimals) + ' ' + buyTokenLabel +      
         '\n'
         if sold_volume else ''
@@ -221,17 +314,18 @@ def print_orders_pretty(orders):
       trade_price_text +
       '\n' +
 
-      click.style('  Transaction', fg=label_color) + ': ' + 
-      to_etherscan_link(order['tx_hash']) + '\n' + 
+      style_label('  Transaction', label_color) + ': ' + 
+      to_etherscan_link(order.tx_hash, order.network) + '\n' + 
 
-      click.style(SEPARATOR, fg=COLOR_SEPARATOR)
+      style_label(SEPARATOR, COLOR_SEPARATOR)
     )
 
-def print_orders_csv(orders):
+def print_orders_csv(orders, with_network=False):
 
+  context = FormatContext()
   writer = get_csv_writer()
 
-  writer.writerow([
+  writer.writerow((['Network'] if with_network else []) + [
     'ID',
     'From Batch Id',
     'Until Batch Id',
@@ -256,77 +350,100 @@ def print_orders_csv(orders):
 
   for order in orders:
 
-    price_sell_buy = format_amount(
-      calculate_price(
-          numerator=order['price_numerator'],
-          denominator=order['price_denominator'],
-          decimals_numerator=order['buy_token']['decimals'],
-          decimals_denominator=order['sell_token']['decimals'],
-      ), thousands_separator=False)
-
-    price_buy_sell = format_amount(
-      calculate_price(
-        numerator=order['price_denominator'],
-        denominator=order['price_numerator'],
-        decimals_numerator=order['sell_token']['decimals'],
-        decimals_denominator=order['buy_token']['decimals'],
-      ), thousands_separator=False)
-
-    avg_sell_buy = format_amount(
-      calculate_price(
-          numerator=order['bought_volume'],
-          denominator=order['sold_volume'],
-          decimals_numerator=order['buy_token']['decimals'],
-          decimals_denominator=order['sell_token']['decimals'],
-      ), thousands_separator=False)
-
-    avg_buy_sell = format_amount(
-      calculate_price(
-        numerator=order['sold_volume'],
-        denominator=order['bought_volume'],
-        decimals_numerator=order['sell_token']['decimals'],
-        decimals_denominator=order['buy_token']['decimals'],
-      ), thousands_separator=False)
-
-    pair_sell_buy = format_token_short(order['sell_token']) + '/' + format_token_short(order['buy_token'])
-    pair_buy_sell = format_token_short(order['buy_token']) + '/' + format_token_short(order['sell_token'])
-
-    max_sell_amount = format_amount_in_weis(order['max_sell_amount'], order['sell_token']['decimals'], thousands_separator=False)
-
-    writer.writerow([
-      order['order_id'],
-      order['from_batch_id'],
-      order['until_batch_id'],
-      format_date_time_iso8601(order['create_date']),
-      format_date_time_iso8601(order['cancel_date']),
-      format_date_time_iso8601(order['delete_date']),
+    price_sell_buy = format_ratio(
+      numerator=order.price_numerator,
+      denominator=order.price_denominator,
+      decimals_numerator=order.buy_token.decimals,
+      decimals_denominator=order.sell_token.decimals,
+      thousands_separator=False
+    )
+
+    price_buy_sell = format_ratio(
+      numerator=order.price_denominator,
+      denominator=order.price_numerator,
+      decimals_numerator=order.sell_token.decimals,
+      decimals_denominator=order.buy_token.decimals,
+      thousands_separator=False
+    )
+
+    avg_sell_buy = format_ratio(
+      numerator=order.bought_volume,
+      denominator=order.sold_volume,
+      decimals_numerator=order.buy_token.decimals,
+      decimals_denominator=order.sell_token.decimals,
+      thousands_separator=False
+    )
+
+    avg_buy_sell = format_ratio(
+      numerator=order.sold_volume,
+      denominator=order.bought_volume,
+      decimals_numerator=order.sell_token.decimals,
+      decimals_denominator=order.buy_token.decimals,
+      thousands_separator=False
+    )
+
+    pair_sell_buy = context.token_short(order.sell_token) + '/' + context.token_short(order.buy_token)
+    pair_buy_sell = context.token_short(order.buy_token) + '/' + context.token_short(order.sell_token)
+
+    max_sell_amount = format_amount_in_weis(order.max_sell_amount, order.sell_token.decimals, thousands_separator=False)
+
+    writer.writerow(([order.network] if with_network else []) + [
+      order.order_id,
+      order.from_batch_id,
+      order.until_batch_id,
+      context.epoch_date_time_iso8601(order.create_epoch),
+      context.epoch_date_time_iso8601(order.cancel_epoch),
+      context.epoch_date_time_iso8601(order.delete_epoch),
       pair_sell_buy,
       price_sell_buy,
       avg_sell_buy,
       pair_buy_sell,
       price_buy_sell,
       avg_buy_sell,
-      format_token_short(order['sell_token']),
-      format_amount_in_weis(order['sold_volume'], order['sell_token']['decimals'], thousands_separator=False),
+      context.token_short(order.sell_token),
+      format_amount_in_weis(order.sold_volume, order.sell_token.decimals, thousands_separator=False),
       max_sell_amount,
-      format_token_short(order['buy_token']),
-      format_amount_in_weis(order['bought_volume'], order['buy_token']['decimals'], thousands_separator=False),
-      format_date_time_iso8601(order['create_date']),
-      to_etherscan_link(order['tx_hash']),
-      order['owner_address'],
+      context.token_short(order.buy_token),
+      format_amount_in_weis(order.bought_volume, order.buy_token.decimals, thousands_separator=False),
+      context.epoch_date_time_iso8601(order.create_epoch),
+      to_etherscan_link(order.tx_hash, order.network),
+      order.owner_address,
     ])
 
 
+def print_orders_records(orders, print_format, with_network=False):
+  records = (
+    {
+      **({'network': order.network} if with_network else {}),
+      'order_id': order.order_id,
+      'trader': order.owner_address,
+      'from_batch_id': order.from_batch_id,
+      'until_batch_id': order.until_batch_id,
+      **to_token_record(order.sell_token, 'sell_token'),
+      **to_token_record(order.buy_token, 'buy_token'),
+      'price_numerator': order.price_numerator,
+      'price_denominator': order.price_denominator,
+      'max_sell_amount': order.max_sell_amount,
+      'sold_volume': order.sold_volume,
+      'bought_volume': order.bought_volume,
+      'create_date': order.create_date,
+      'cancel_date': order.cancel_date,
+      'delete_date': order.delete_date,
+      'tx_hash': order.tx_hash
+    }
+    for order in orders
+  )
+  export_records(records, {'network': 'string', **ORDER_COLUMNS} if with_network else ORDER_COLUMNS, print_format)
+
+
 def _get_price_text (label, sell_label, buy_label, numerator, denominator, decimals_numerator, decimals_denominator, label_color):
   return (
-    click.style(f'  {label} {sell_label}/{buy_label}', fg=label_color) + ': ' +
-    format_price(
-      calculate_price(
-        numerator=numerator,
-        denominator=denominator,
-        decimals_numerator=decimals_numerator,
-        decimals_denominator=decimals_denominator
-      ), 
+    style(f'  {label} {sell_label}/{buy_label}', fg=label_color) + ': ' +
+    format_price_ratio(
+      numerator=numerator,
+      denominator=denominator,
+      decimals_numerator=decimals_numerator,
+      decimals_denominator=decimals_denominator,
       currency=buy_label
     )
   )
@@ -1,21 +1,21 @@
-from commands.tokens import TOKEN_FIELDS_BASIC, to_token
+from commands.tokens import Token, get_token_columns, to_token, to_token_record
 from decimal import Decimal
-
-import click
-from gql import gql
+from typing import NamedTuple
 
 from constants import COLOR_LABEL, COLOR_SEPARATOR, OWL_DECIMALS, SEPARATOR
-from utils.format import (format_amount_in_weis, format_batch_id_with_date, format_price,
-                          format_date_time, format_integer, format_date_time_iso8601, format_token_long,
-                          format_token_short)
-from utils.graphql import (debug_query, get_graphql_client, gql_filter,
-                           gql_sort_by)
-from utils.misc import to_date_from_epoch, to_etherscan_link, get_csv_writer, to_date_from_batch_id
+from utils.format import MAX_EXACT_AMOUNT, FormatContext, format_price, format_price_ratio
+from utils.export import EXPORT_FORMATS, export_records
+from utils.follow import follow_pages
+from utils.graphql import gql_range_filter, paginate, paginate_networks
+from utils.mirror import query_mirror
+from utils.misc import to_etherscan_link, get_csv_writer
+from utils.output import echo, flush_output, style_label
+from utils.profile import Phase, profile_rows
 
 # Price entity fields
 #   See https://thegraph.com/explorer/subgraph/gnosis/protocol
-PRICES_FIELDS = f'''
-  token {{ {TOKEN_FIELDS_BASIC} }}
+PRICES_FIELDS = '''
+  token { id }
   batchId
   priceInOwlNumerator
   priceInOwlDenominator
@@ -23,73 +23,126 @@ PRICES_FIELDS = f'''
   txHash
 '''
 
-def get_prices(count, skip, sort, sort_ascending, print_format, verbose, batch_id, token_id, tx_hash):
-    filters = gql_filter({
+# Columns of the exported prices (jsonl, parquet and arrow formats)
+PRICE_COLUMNS = {
+  **get_token_columns('token'),
+  'batch_id': 'integer',
+  'price_in_owl_numerator': 'amount',
+  'price_in_owl_denominator': 'amount',
+  'volume': 'amount',
+  'tx_hash': 'string'
+}
+
+
+def get_prices(count, skip, sort, sort_ascending, print_format, verbose, batch_id, token_id, tx_hash, fetch_all=False, limit=None, local=False, networks=None, follow=False, from_batch_id=None, to_batch_id=None):
+    filters = {
       "batchId": batch_id if batch_id else None,
       "token": token_id if token_id else None,
-      "txHash": tx_hash.lower() if tx_hash else None
-    })
-
-    query = f'''
-{{
-  prices (first: {count} , skip: {skip}, {gql_sort_by(sort, sort_ascending)}{filters}) {{{PRICES_FIELDS}  }}
-}}
-    '''
-    
-    debug_query(query, verbose)
-    client = get_graphql_client()
-    result = client.execute(gql(query))    
-    prices_dto = [to_price_dto(price) for price in result['prices']]
-    print_prices(prices_dto, print_format)
-
-
-def print_prices(prices, print_format):
-  if print_format == 'pretty':    
-    print_prices_pretty(prices)
-  elif print_format == 'csv':
-    print_prices_csv(prices)
-  else:
-    raise Exception('Format "%s" is not supported. Supported formats are: pretty, csv' % (print_format))  
+      "txHash": tx_hash.lower() if tx_hash else None,
+      **gql_range_filter('batchId', from_batch_id, to_batch_id)
+    }
+
+    if follow:
+      if sort != 'batchId':
+        raise Exception('Following prices requires sorting by batchId')
+      if local or networks:
+        raise Exception('Following prices is only supported for the subgraph of a single network')
+
+      prices_dto = (
+        price
+        for page in follow_pages('prices', PRICES_FIELDS, filters, sort, verbose, limit or count)
+        for price in profile_rows(page, to_price_dto)
+      )
+      print_prices(prices_dto, print_format)
+      return
+
+    def fetch_prices():
+      if local:
+        return query_mirror('prices', filters, sort, sort_ascending, skip=skip, limit=None if fetch_all else (limit or count))
+      else:
+        return paginate(
+          entity='prices',
+          fields=PRICES_FIELDS,
+          filters=filters,
+          sort=sort,
+          sort_ascending=sort_ascending,
+          verbose=verbose,
+          skip=skip,
+          limit=None if fetch_all else (limit or count)
+        )
+
+    prices = paginate_networks(networks, fetch_prices) if networks else fetch_prices()
+    prices_dto = profile_rows(prices, to_price_dto)
+    print_prices(prices_dto, print_format, with_network=bool(networks))
+
+
+def print_prices(prices, print_format, with_network=False):
+  with Phase('render'):
+    try:
+      if print_format == 'pretty':    
+        print_prices_pretty(prices)
+      elif print_format == 'csv':
+        print_prices_csv(prices, with_network)
+      elif print_format in EXPORT_FORMATS:
+        print_prices_records(prices, print_format, with_network)
+      else:
+        raise Exception('Format "%s" is not supported. Supported formats are: pretty, csv, %s' % (print_format, ', '.join(EXPORT_FORMATS)))
+    finally:
+      flush_output()
+
+
+class Price(NamedTuple):
+  token: Token
+  batch_id: int
+  price_in_owl_numerator: int
+  price_in_owl_denominator: int
+  volume: int
+  tx_hash: str
+  network: str = None
 
 
 def to_price_dto(price):
-  # No transformation is needed
-  return {
-    "token": to_token(price['token']),
-    "batch_id": int(price['batchId']),
-    "price_in_owl_numerator": Decimal(price['priceInOwlNumerator']),
-    "price_in_owl_denominator": Decimal(price['priceInOwlDenominator']),
-    "volume": Decimal(price['volume']),
-    "tx_hash": price['txHash']
-  }
+  network = price.get('network')
+  return Price(
+    token=to_token(price['token'], network),
+    batch_id=int(price['batchId']),
+    price_in_owl_numerator=int(price['priceInOwlNumerator']),
+    price_in_owl_denominator=int(price['priceInOwlDenominator']),
+    volume=int(price['volume']),
+    tx_hash=price['txHash'],
+    network=network
+  )
 
 
 def print_prices_pretty(prices):
-  click.echo(click.style(SEPARATOR, fg=COLOR_SEPARATOR))
+  context = FormatContext()
+  echo(style_label(SEPARATOR, COLOR_SEPARATOR))
 
   for price in prices:
 
-    click.echo(
-      click.style('  Token', fg=COLOR_LABEL) + ': ' + 
-      format_token_long(price['token']) + '\n' + 
+    echo(
+      (style_label('  Network', COLOR_LABEL) + ': ' + price.network + '\n' if price.network else '') +
+      style_label('  Token', COLOR_LABEL) + ': ' + 
+      context.token_long(price.token) + '\n' + 
 
-      click.style('  Batch Id', fg=COLOR_LABEL) + ': ' + 
-      format_batch_id_with_date(price['batch_id']) + '\n' + 
+      style_label('  Batch Id', COLOR_LABEL) + ': ' + 
+      context.batch_id_with_date(price.batch_id) + '\n' + 
 
-      click.style('  Price in OWL', fg=COLOR_LABEL) + ': ' + 
+      style_label('  Price in OWL', COLOR_LABEL) + ': ' + 
       format_price_in_owl(price) + '\n' +
 
-      click.style('  Transaction', fg=COLOR_LABEL) + ': ' + 
-      to_etherscan_link(price['tx_hash']) + '\n' + 
+      style_label('  Transaction', COLOR_LABEL) + ': ' + 
+      to_etherscan_link(price.tx_hash, price.network) + '\n' + 
 
-      click.style(SEPARATOR, fg=COLOR_SEPARATOR)
+      style_label(SEPARATOR, COLOR_SEPARATOR)
     )
 
 
-def print_prices_csv(prices):
+def print_prices_csv(prices, with_network=False):
+  context = FormatContext()
   writer = get_csv_writer()
 
-  writer.writerow(['Token',
+  writer.writerow((['Network'] if with_network else []) + ['Token',
                    'Registered',
                    'Batch Id',
                    'Batch Start',  # artificial
@@ -97,14 +150,35 @@ def print_prices_csv(prices):
                    'Transaction'])
 
   for price in prices:
-    writer.writerow([
-      format_token_short(price['token']),
-      price['token']['address'],
-      price['batch_id'],
-      format_date_time_iso8601(to_date_from_batch_id(price['batch_id'])),
+    writer.writerow(([price.network] if with_network else []) + [
+      context.token_short(price.token),
+      price.token.address,
+      price.batch_id,
+      context.batch_date_iso8601(price.batch_id),
       format_price_in_owl(price),
-      price['tx_hash']])
+      price.tx_hash])
+
+
+def print_prices_records(prices, print_format, with_network=False):
+  records = (
+    {
+      **({'network': price.network} if with_network else {}),
+      **to_token_record(price.token, 'token'),
+      'batch_id': price.batch_id,
+      'price_in_owl_numerator': price.price_in_owl_numerator,
+      'price_in_owl_denominator': price.price_in_owl_denominator,
+      'volume': price.volume,
+      'tx_hash': price.tx_hash
+    }
+    for price in prices
+  )
+  export_records(records, {'network': 'string', **PRICE_COLUMNS} if with_network else PRICE_COLUMNS, print_format)
 
 
 def format_price_in_owl(price):
-  return format_price(price['price_in_owl_numerator'] / price['price_in_owl_denominator'], OWL_DECIMALS)
+  numerator, denominator = price.price_in_owl_numerator, price.price_in_owl_denominator
+  if 0 < denominator <= MAX_EXACT_AMOUNT:
+    return format_price_ratio(numerator, denominator, decimals=OWL_DECIMALS)
+  else:
+    # Same as calculate_price only for denominators that fit in the Decimal precision
+    return format_price(Decimal(numerator) / Decimal(denominator), OWL_DECIMALS)
@@ -0,0 +1,137 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import parse_qs, urlparse
+import json
+
+import click
+
+from commands.tokens import get_token_registry
+from utils.graphql import get_graphql_client
+from utils.mirror import MIRROR_ENTITIES, get_mirror_columns
+from utils.output import use_output
+
+# Commands served, with the options a request can give (i.e. /trades?trader=0x...&count=5&format=csv). Only the
+# options that read are listed, the ones that change the process or write files (output, profile, cache...) are not
+SERVE_COMMANDS = {
+  'tokens': ['count', 'skip', 'sort', 'asc', 'desc', 'from', 'to', 'id', 'symbol', 'address', 'local', 'network'],
+  'trades': [
+    'count', 'skip', 'all', 'limit', 'parallel', 'sort', 'asc', 'desc', 'from', 'to', 'trader', 'batch', 'buy', 'sell',
+    'tx', 'local', 'network'
+  ],
+  'orders': [
+    'count', 'skip', 'all', 'limit', 'parallel', 'sort', 'asc', 'desc', 'from', 'to', 'trader', 'id', 'buy', 'sell',
+    'traded', 'not-traded', 'tx', 'local', 'network'
+  ],
+  'prices': [
+    'count', 'skip', 'all', 'limit', 'sort', 'asc', 'desc', 'from', 'to', 'batch', 'token', 'tx', 'local', 'network'
+  ],
+  'volume': ['by', 'from', 'to', 'parallel', 'trader', 'buy', 'sell', 'local', 'network']
+}
+
+CONTENT_TYPES = {
+  'csv': 'text/csv; charset=utf-8',
+  'jsonl': 'application/x-ndjson',
+  'parquet': 'application/vnd.apache.parquet',
+  'arrow': 'application/vnd.apache.arrow.file'
+}
+
+
+def serve(host, port):
+  # Everything the requests share is loaded before the first one: GraphQL client, token registry and query cache
+  get_graphql_client()
+  get_token_registry()
+
+  server = ThreadingHTTPServer((host, port), QueryHandler)
+  server.daemon_threads = True
+  click.echo(f'Serving {", ".join("/" + name for name in SERVE_COMMANDS)} on http://{host}:{port}', err=True)
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.server_close()
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+  def do_GET(self):
+    url = urlparse(self.path)
+    name = url.path.strip('/')
+    if name not in SERVE_COMMANDS:
+      self.send_text(404, 'application/json', json.dumps({'error': f'Unknown command: {name}'}))
+      return
+
+    try:
+      print_format, body = run_command(name, parse_qs(url.query, keep_blank_values=True))
+    except Exception as error:
+      self.send_text(400, 'application/json', json.dumps({'error': str(error)}))
+      return
+
+    self.send_body(200, CONTENT_TYPES[print_format], body)
+
+  def send_text(self, status, content_type, text):
+    self.send_body(status, content_type, text.encode('utf-8'))
+
+  def send_body(self, status, content_type, body):
+    self.send_response(status)
+    self.send_header('Content-Type', content_type)
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, format, *args):
+    pass
+
+
+def run_command(name, query):
+  """Run a command with the options of a query string ("?option=value", or "?flag"), returning the format and output"""
+  from cli import main
+
+  print_format = query.pop('format', ['jsonl'])[-1]
+  if print_format not in CONTENT_TYPES:
+    raise Exception('Format "%s" is not supported. Supported formats are: %s' % (print_format, ', '.join(CONTENT_TYPES)))
+
+  command = main.get_command(None, name)
+  options = get_serve_options(command, SERVE_COMMANDS[name])
+  args = ['--format', print_format]
+  for option, values in query.items():
+    param = options.get(option)
+    if param is None:
+      raise Exception('Unknown option: %s. Supported options are: format, %s' % (option, ', '.join(sorted(options))))
+    if option == 'sort':
+      check_sort_fields(name, values)
+
+    for value in values:
+      if not param.is_flag:
+        args += [f'--{option}', value]
+      elif value.lower() not in ('false', '0'):
+        args.append(f'--{option}')
+
+  # The options that would change the whole process (output file, profile, cache mode...) are never accepted, so
+  # their callbacks do nothing
+  params = command.make_context(name, args).params
+
+  stream = BytesIO()
+  with use_output(stream):
+    command.callback(**params)
+
+  return print_format, stream.getvalue()
+
+
+def get_serve_options(command, allowed):
+  """Allowed options of a command by name (without dashes), including the secondary names of the flags (i.e. desc)"""
+  options = {}
+  for param in command.params:
+    for name in param.opts + getattr(param, 'secondary_opts', []):
+      if name.startswith('--') and name[2:] in allowed:
+        options[name[2:]] = param
+
+  return options
+
+
+def check_sort_fields(entity, sort_fields):
+  # Only the fields of the entity itself can be sorted by (i.e. not sellToken, a nested entity)
+  references = MIRROR_ENTITIES[entity]['references']
+  fields = [field for field in get_mirror_columns(entity) if field not in references]
+  for sort in sort_fields:
+    if sort not in fields:
+      raise Exception('Sorting by "%s" is not supported. Supported fields are: %s' % (sort, ', '.join(sorted(fields))))
@@ -0,0 +1,99 @@
+import click
+
+from commands.tokens import register_tokens
+from constants import COLOR_LABEL, COLOR_SECONDARY, PAGE_SIZE
+from utils.cache import set_query_cache_mode
+from utils.format import format_integer
+from utils.graphql import paginate, paginate_pages
+from utils.mirror import (MIRROR_ENTITIES, clear_mirror, get_mirror_fields,
+                          get_mirror_mark, save_to_mirror)
+
+
+def sync(verbose, full):
+  # Sync always pulls the latest rows, there's no point in caching them
+  set_query_cache_mode(read=False, write=False)
+  if full:
+    clear_mirror()
+
+  for entity, spec in MIRROR_ENTITIES.items():
+    mark = spec['mark']
+    mark_value = get_mirror_mark(entity)
+    # Taken before the new rows are saved, so it's not past the updates made since the last sync
+    updates_mark_value = get_mirror_mark(entity, [spec['updates_since'], *spec['updates']]) if spec['updates'] else None
+
+    count = 0
+    filled_order_ids = set()
+    pages = paginate_pages(
+      entity=entity,
+      fields=get_mirror_fields(entity),
+      filters={f'{mark}_gte': str(mark_value)} if mark_value is not None else {},
+      sort=mark,
+      sort_ascending=True,
+      verbose=verbose
+    )
+    for page in pages:
+      save_to_mirror(entity, page)
+      count += len(page)
+      if entity == 'tokens':
+        register_tokens(page)
+      elif entity == 'trades':
+        # Orders are updated when traded, so the ones filled by these trades are pulled again
+        filled_order_ids.update(trade['order']['id'] for trade in page)
+
+    click.echo(
+      click.style(f'  {entity.capitalize()}', fg=COLOR_LABEL) + ': ' +
+      f'{format_integer(count)} rows synced' +
+      click.style(f' ({mark} >= {mark_value or 0})', fg=COLOR_SECONDARY)
+    )
+
+    if updates_mark_value is not None:
+      updated = _refresh_updated(entity, spec['updates'], updates_mark_value, verbose)
+      if entity == 'trades':
+        # Reverted trades update their orders too
+        filled_order_ids.update(trade['order']['id'] for trade in updated)
+
+    if filled_order_ids:
+      _refresh_orders(sorted(filled_order_ids), verbose)
+
+
+def _refresh_updated(entity, updates, updates_mark_value, verbose):
+  # Rows are cancelled, deleted or reverted after they are created, so they are missed by the mark
+  updated = []
+  for field in updates:
+    pages = paginate_pages(
+      entity=entity,
+      fields=get_mirror_fields(entity),
+      filters={f'{field}_gte': str(updates_mark_value)},
+      sort=field,
+      sort_ascending=True,
+      verbose=verbose
+    )
+    for page in pages:
+      save_to_mirror(entity, page)
+      updated += page
+
+  click.echo(
+    click.style(f'  {entity.capitalize()}', fg=COLOR_LABEL) + ': ' +
+    f'{format_integer(len(updated))} rows refreshed' +
+    click.style(f' ({" or ".join(updates)} >= {updates_mark_value})', fg=COLOR_SECONDARY)
+  )
+  return updated
+
+
+def _refresh_orders(order_ids, verbose):
+  for start in range(0, len(order_ids), PAGE_SIZE):
+    orders = paginate(
+      entity='orders',
+      fields=get_mirror_fields('orders'),
+      filters={'id_in': order_ids[start:start + PAGE_SIZE]},
+      sort='id',
+      sort_ascending=True,
+      verbose=verbose
+    )
+    save_to_mirror('orders', orders)
+
+  click.echo(
+    click.style('  Orders', fg=COLOR_LABEL) + ': ' +
+    f'{format_integer(len(order_ids))} rows refreshed' +
+    click.style(' (filled by the synced trades)', fg=COLOR_SECONDARY)
+  )
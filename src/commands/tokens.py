@@ -1,14 +1,19 @@
 from datetime import datetime
+from threading import Lock
+from typing import NamedTuple
+import json
+import os
 
-import click
-from gql import gql
-
-from constants import COLOR_LABEL, COLOR_SEPARATOR, OWL_DECIMALS, SEPARATOR
+from constants import COLOR_LABEL, COLOR_SEPARATOR, OWL_DECIMALS, SEPARATOR, Network
 from utils.format import (format_amount_in_weis, format_date_time, format_date_time_iso8601,
                           format_integer, parse_date_from_epoch)
-from utils.graphql import (debug_query, get_graphql_client, gql_filter,
-                           gql_sort_by)
-from utils.misc import to_date_from_epoch, to_etherscan_link, get_csv_writer
+from utils.export import EXPORT_FORMATS, export_records
+from utils.graphql import gql_range_filter, paginate, paginate_networks, query_entity
+from utils.mirror import query_mirror
+from utils.network import get_network, use_network
+from utils.misc import to_date_from_epoch, to_etherscan_link, get_csv_writer, get_cache_path
+from utils.output import echo, flush_output, style_label
+from utils.profile import Phase, profile_rows
 
 TOKEN_FIELDS_BASIC = 'id, name, symbol, address, decimals'
 
@@ -24,100 +29,244 @@ TOKENS_FIELDS = '''
     txHash  
 '''
 
+TOKEN_REGISTRY_FILE = 'tokens.json'
+
+# Columns of the exported tokens (jsonl, parquet and arrow formats)
+TOKEN_COLUMNS = {
+  'id': 'integer',
+  'address': 'string',
+  'symbol': 'string',
+  'name': 'string',
+  'decimals': 'integer',
+  'create_date': 'date',
+  'tx_hash': 'string'
+}
+
+
+class Token(NamedTuple):
+  id: str
+  name: str
+  symbol: str
+  address: str
+  decimals: int
+
+
+class TokenRow(NamedTuple):
+  id: int
+  address: str
+  decimals: int
+  name: str
+  symbol: str
+  create_epoch: str
+  tx_hash: str
+  network: str = None
+
+  @property
+  def create_date(self):
+    return parse_date_from_epoch(self.create_epoch)
+
+
+# Token metadata by id, of each network (by name), persisted in the cache dir. Trades, orders and prices only query the
+# token ids, and resolve them here, so all the rows of a token share the same Token
+token_registries = {}
+token_registry_lock = Lock()
+
+
+def to_token(token, network_name=None):
+  """Token of a reference ({"id": ...}) from a row of a network (the current one by default)"""
+  registry = get_token_registry(network_name)
+  token_id = token['id']
+  if token_id not in registry:
+    with use_network(Network(network_name) if network_name else get_network()):
+      _fetch_tokens({"id": token_id})
+    if token_id not in registry:
+      raise Exception('Unknown token: %s' % token_id)
+
+  return registry[token_id]
+
+
+def get_token_registry(network_name=None):
+  token_registry = token_registries.get(network_name or get_network().value)
+  if token_registry is None:
+    with use_network(Network(network_name) if network_name else get_network()):
+      token_registry = _get_network_registry()
+      if not token_registry:
+        _fetch_tokens({})
+
+  return token_registry
+
+
+def register_tokens(tokens):
+  """Add tokens (with at least the fields in TOKEN_FIELDS_BASIC) to the registry of the current network"""
+  token_registry = _get_network_registry()
+  new_tokens = {
+    token['id']: Token(
+      id=token['id'],
+      name=token['name'],
+      symbol=token['symbol'],
+      address=token['address'],
+      decimals=int(token['decimals'] or '18')
+    )
+    for token in tokens
+  }
+
+  # Several threads may register tokens at the same time (i.e. "serve")
+  with token_registry_lock:
+    token_registry.update(new_tokens)
+    registry_path = get_cache_path(TOKEN_REGISTRY_FILE)
+    with open(registry_path + '.tmp', 'w') as registry_file:
+      json.dump({token_id: token._asdict() for token_id, token in token_registry.items()}, registry_file)
+    os.replace(registry_path + '.tmp', registry_path)
+
 
-def to_token(token):
+def get_token_columns(prefix):
+  """Columns of the token referenced by a exported row (i.e. sell_token_id, sell_token_symbol, ...)"""
   return {
-    "id": token['id'],
-    "name": token['name'],
-    "symbol": token['symbol'],
-    "address": token['address'],
-    "decimals": int(token['decimals'] or '18')
+    f'{prefix}_id': 'integer',
+    f'{prefix}_symbol': 'string',
+    f'{prefix}_address': 'string',
+    f'{prefix}_decimals': 'integer'
   }
 
 
-def get_tokens(count, skip, sort, sort_ascending, print_format, verbose, token_id, symbol, address):
-  filters = gql_filter({
+def to_token_record(token, prefix):
+  return {
+    f'{prefix}_id': int(token.id),
+    f'{prefix}_symbol': token.symbol,
+    f'{prefix}_address': token.address,
+    f'{prefix}_decimals': token.decimals
+  }
+
+
+def _get_network_registry():
+  network_name = get_network().value
+  token_registry = token_registries.get(network_name)
+  if token_registry is None:
+    token_registry = token_registries[network_name] = _load_token_registry()
+
+  return token_registry
+
+
+def _load_token_registry():
+  try:
+    with open(get_cache_path(TOKEN_REGISTRY_FILE)) as registry_file:
+      return {token_id: Token(**token) for token_id, token in json.load(registry_file).items()}
+  except (FileNotFoundError, json.JSONDecodeError, TypeError):
+    return {}
+
+
+def _fetch_tokens(filters):
+  register_tokens(paginate('tokens', TOKEN_FIELDS_BASIC, filters, sort='id', sort_ascending=True, verbose=0))
+
+
+def get_tokens(count, skip, sort, sort_ascending, print_format, verbose, token_id, symbol, address, local=False, networks=None, from_batch_id=None, to_batch_id=None):
+  filters = {
     "id": token_id,
     "address": address.lower() if address else None,
-    "symbol": symbol
-  })
-
-  query = f'''
-{{
-  tokens (first: {count} , skip: {skip}, {gql_sort_by(sort, sort_ascending)}{filters}) {{{TOKENS_FIELDS}  }}
-}}
-    '''  
-  debug_query(query, verbose)
-  client = get_graphql_client()
-  result = client.execute(gql(query))
-  tokens_dto = [to_token_dto(token) for token in result['tokens']]
-  print_tokens(tokens_dto, print_format)
-
-
-def print_tokens(tokens, print_format):
-  if print_format == 'pretty':    
-    print_tokens_pretty(tokens)
-  elif print_format == 'csv':
-    print_tokens_csv(tokens)
-  else:
-    raise Exception('Format "%s" is not supported. Supported formats are: pretty, csv' % (print_format))  
+    "symbol": symbol,
+    **gql_range_filter('createEpoch', from_batch_id, to_batch_id)
+  }
+
+  def fetch_tokens():
+    if local:
+      return query_mirror('tokens', filters, sort, sort_ascending, skip=skip, limit=count)
+    else:
+      return query_entity('tokens', TOKENS_FIELDS, count, skip, filters, sort, sort_ascending, verbose)
+
+  tokens = paginate_networks(networks, fetch_tokens) if networks else fetch_tokens()
+  tokens_dto = list(profile_rows(tokens, to_token_dto))
+  print_tokens(tokens_dto, print_format, with_network=bool(networks))
+
+
+def print_tokens(tokens, print_format, with_network=False):
+  with Phase('render'):
+    try:
+      if print_format == 'pretty':    
+        print_tokens_pretty(tokens)
+      elif print_format == 'csv':
+        print_tokens_csv(tokens, with_network)
+      elif print_format in EXPORT_FORMATS:
+        print_tokens_records(tokens, print_format, with_network)
+      else:
+        raise Exception('Format "%s" is not supported. Supported formats are: pretty, csv, %s' % (print_format, ', '.join(EXPORT_FORMATS)))
+    finally:
+      flush_output()
 
 
 def to_token_dto(token):
-  return {
-    "id": int(token['id']),
-    "address": token['address'],
-    "decimals": int(token['decimals'] or '18'),
-    "name": token['name'],
-    "symbol": token['symbol'],
-    "create_date": parse_date_from_epoch(token['createEpoch']),
-    "tx_hash": token['txHash']
-  }
+  return TokenRow(
+    id=int(token['id']),
+    address=token['address'],
+    decimals=int(token['decimals'] or '18'),
+    name=token['name'],
+    symbol=token['symbol'],
+    create_epoch=token['createEpoch'],
+    tx_hash=token['txHash'],
+    network=token.get('network')
+  )
 
 
 def print_tokens_pretty(tokens):
-  click.echo(click.style(SEPARATOR, fg=COLOR_SEPARATOR))
+  echo(style_label(SEPARATOR, COLOR_SEPARATOR))
 
   for token in tokens:
-    symbol = token['symbol'] or ''
-    name = token['name'] or ''
-    click.echo( 
-      click.style('  Id', fg=COLOR_LABEL) + ': ' + 
-      str(token['id']) + '\n' +
+    symbol = token.symbol or ''
+    name = token.name or ''
+    echo( 
+      (style_label('  Network', COLOR_LABEL) + ': ' + token.network + '\n' if token.network else '') +
+      style_label('  Id', COLOR_LABEL) + ': ' + 
+      str(token.id) + '\n' +
 
-      click.style('  Address', fg=COLOR_LABEL) + ': ' + 
-      token['address'] + '\n\n' +
+      style_label('  Address', COLOR_LABEL) + ': ' + 
+      token.address + '\n\n' +
 
-      click.style('  Symbol', fg=COLOR_LABEL) + ': ' + 
+      style_label('  Symbol', COLOR_LABEL) + ': ' + 
       symbol + '\n' +
 
-      click.style('  Name', fg=COLOR_LABEL) + ': ' + 
+      style_label('  Name', COLOR_LABEL) + ': ' + 
       name + '\n' +
 
-      click.style('  Decimals', fg=COLOR_LABEL) + ': ' + 
-      str(token['decimals']) + '\n\n' +
+      style_label('  Decimals', COLOR_LABEL) + ': ' + 
+      str(token.decimals) + '\n\n' +
 
-      click.style('  Registered', fg=COLOR_LABEL) + ': ' + 
-      format_date_time(token['create_date']) + '\n' +
+      style_label('  Registered', COLOR_LABEL) + ': ' + 
+      format_date_time(token.create_date) + '\n' +
 
-      click.style('  Transaction', fg=COLOR_LABEL) + ': ' + 
-      to_etherscan_link(token['tx_hash']) + '\n' + 
+      style_label('  Transaction', COLOR_LABEL) + ': ' + 
+      to_etherscan_link(token.tx_hash, token.network) + '\n' + 
 
-      click.style(SEPARATOR, fg=COLOR_SEPARATOR)
+      style_label(SEPARATOR, COLOR_SEPARATOR)
     )
 
 
-def print_tokens_csv(tokens):
+def print_tokens_csv(tokens, with_network=False):
 
   writer = get_csv_writer()
 
-  writer.writerow(['ID', 'Symbol', 'Name', 'Decimals', 'Registered', 'Transaction'])
+  writer.writerow((['Network'] if with_network else []) + ['ID', 'Symbol', 'Name', 'Decimals', 'Registered', 'Transaction'])
 
   for token in tokens:
-    writer.writerow([token['id'],
-      token.get('symbol', ''),
-      token.get('name', ''),
-      token['decimals'],
-      token['address'],
-      format_date_time_iso8601(token['create_date']),
-      to_etherscan_link(token['tx_hash'])])
+    writer.writerow(([token.network] if with_network else []) + [token.id,
+      token.symbol,
+      token.name,
+      token.decimals,
+      token.address,
+      format_date_time_iso8601(token.create_date),
+      to_etherscan_link(token.tx_hash, token.network)])
+
+
+def print_tokens_records(tokens, print_format, with_network=False):
+  records = (
+    {
+      **({'network': token.network} if with_network else {}),
+      'id': token.id,
+      'address': token.address,
+      'symbol': token.symbol,
+      'name': token.name,
+      'decimals': token.decimals,
+      'create_date': token.create_date,
+      'tx_hash': token.tx_hash
+    }
+    for token in tokens
+  )
+  export_records(records, {'network': 'string', **TOKEN_COLUMNS} if with_network else TOKEN_COLUMNS, print_format)
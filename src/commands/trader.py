@@ -0,0 +1,197 @@
+from commands.orders import ORDERS_FIELDS, to_order_dto
+from commands.tokens import TOKEN_FIELDS_BASIC, register_tokens, to_token_record
+from commands.trades import TRADE_FIELDS, to_trade_dto
+
+from constants import COLOR_LABEL, COLOR_LABEL_DELETED, COLOR_SECONDARY, COLOR_SEPARATOR, PAGE_SIZE, SEPARATOR
+from utils.format import FormatContext, format_amount_in_weis, format_integer, format_percentage
+from utils.export import write_jsonl
+from utils.graphql import (execute_query, get_cursor_filters, get_next_cursor, gql_filter, gql_range_filter,
+                           paginate)
+from utils.misc import get_current_batch_id, is_unlimited_amount
+from utils.output import echo, flush_output, style, style_label
+from utils.profile import Phase
+
+
+def _with_tokens(fields):
+  # Tokens are selected with the rows, so they are all resolved with the same response
+  return (fields
+    .replace('sellToken { id }', f'sellToken {{ {TOKEN_FIELDS_BASIC} }}')
+    .replace('buyToken { id }', f'buyToken {{ {TOKEN_FIELDS_BASIC} }}'))
+
+
+# Recent orders, orders still open and recent trades of a trader, in a single query (one round trip)
+TRADER_QUERY = f'''
+query Trader($first: Int!, $ordersWhere: Order_filter!, $openOrdersWhere: Order_filter!, $tradesWhere: Trade_filter!) {{
+  orders: orders (first: $first, where: $ordersWhere, orderBy: createEpoch, orderDirection: desc) {{ {_with_tokens(ORDERS_FIELDS)} }}
+  openOrders: orders (first: {PAGE_SIZE}, where: $openOrdersWhere, orderBy: createEpoch, orderDirection: desc) {{ {_with_tokens(ORDERS_FIELDS)} }}
+  trades: trades (first: $first, where: $tradesWhere, orderBy: tradeBatchId, orderDirection: desc) {{ {_with_tokens(TRADE_FIELDS)} }}
+}}
+'''
+
+
+def get_trader(address, count, print_format, verbose, from_batch_id=None, to_batch_id=None):
+  owner = address.lower()
+  variables = get_trader_variables(owner, count, from_batch_id, to_batch_id)
+  result = execute_query(TRADER_QUERY, variables, verbose)
+  if len(result['openOrders']) == PAGE_SIZE:
+    # More open orders than the page of the query: the rest are paginated after it
+    cursor = get_next_cursor(result['openOrders'], 'createEpoch', None)
+    result['openOrders'] += paginate(
+      entity='orders',
+      fields=_with_tokens(ORDERS_FIELDS),
+      filters=get_cursor_filters(variables['openOrdersWhere'], cursor, 'createEpoch', False),
+      sort='createEpoch',
+      sort_ascending=False,
+      verbose=verbose
+    )
+
+  with Phase('dto'):
+    orders, open_orders, trades = to_trader_dtos(result)
+
+  print_trader(owner, orders, open_orders, trades, print_format)
+
+
+def get_trader_variables(owner, count, from_batch_id=None, to_batch_id=None):
+  return {
+    'first': count,
+    'ordersWhere': gql_filter({'owner': owner, **gql_range_filter('createEpoch', from_batch_id, to_batch_id)}),
+    'openOrdersWhere': gql_filter({'owner': owner, 'untilBatchId_gte': get_current_batch_id()}),
+    'tradesWhere': gql_filter({'owner': owner, **gql_range_filter('tradeBatchId', from_batch_id, to_batch_id)})
+  }
+
+
+def to_trader_dtos(result):
+  """Recent orders, open orders and recent trades of a TRADER_QUERY result"""
+  rows = result['orders'] + result['openOrders'] + result['trades']
+  register_tokens({
+    token['id']: token for row in rows for token in (row['sellToken'], row['buyToken'])
+  }.values())
+
+  orders = [to_order_dto(order) for order in result['orders']]
+  open_orders = [order for order in map(to_order_dto, result['openOrders']) if is_open(order)]
+  trades = [to_trade_dto(trade) for trade in result['trades']]
+  return orders, open_orders, trades
+
+
+def is_open(order):
+  return order.cancel_epoch is None and order.delete_epoch is None and (
+    is_unlimited_amount(order.max_sell_amount) or order.sold_volume < order.max_sell_amount
+  )
+
+
+def get_open_exposure(open_orders):
+  """Remaining sell amount of the open orders, by sell token: [token, amount, orders, unlimited orders]"""
+  exposure = {}
+  for order in open_orders:
+    token_exposure = exposure.get(order.sell_token.id)
+    if token_exposure is None:
+      token_exposure = exposure[order.sell_token.id] = [order.sell_token, 0, 0, 0]
+    if is_unlimited_amount(order.max_sell_amount):
+      token_exposure[3] += 1
+    else:
+      token_exposure[1] += order.max_sell_amount - order.sold_volume
+    token_exposure[2] += 1
+
+  return list(exposure.values())
+
+
+def get_token_volumes(trades):
+  """Sold and bought volume of the trades (not reverted), by token: [token, sold, bought, trades]"""
+  volumes = {}
+  for trade in trades:
+    if trade.revert_epoch is not None:
+      continue
+
+    for token, sold, bought in ((trade.sell_token, trade.sell_volume, 0), (trade.buy_token, 0, trade.buy_volume)):
+      token_volume = volumes.get(token.id)
+      if token_volume is None:
+        token_volume = volumes[token.id] = [token, 0, 0, 0]
+      token_volume[1] += sold
+      token_volume[2] += bought
+      token_volume[3] += 1
+
+  return list(volumes.values())
+
+
+def print_trader(owner, orders, open_orders, trades, print_format):
+  with Phase('render'):
+    try:
+      if print_format == 'pretty':
+        print_trader_pretty(owner, orders, open_orders, trades)
+      elif print_format == 'jsonl':
+        print_trader_records(orders, open_orders, trades)
+      else:
+        raise Exception('Format "%s" is not supported. Supported formats are: pretty, jsonl' % print_format)
+    finally:
+      flush_output()
+
+
+def print_trader_pretty(owner, orders, open_orders, trades):
+  context = FormatContext()
+
+  def format_amount(amount, token):
+    return format_amount_in_weis(amount, token.decimals) + ' ' + context.token_short(token)
+
+  echo(
+    style_label(SEPARATOR, COLOR_SEPARATOR) + '\n' +
+    style_label('  Trader', COLOR_LABEL) + ': ' + owner + '\n' +
+    style_label('  Open orders', COLOR_LABEL) + ': ' + format_integer(len(open_orders)) + '\n' +
+    style_label('  Recent orders', COLOR_LABEL) + ': ' + format_integer(len(orders)) + '\n' +
+    style_label('  Recent trades', COLOR_LABEL) + ': ' + format_integer(len(trades)) + '\n'
+  )
+
+  echo(style('  Open exposure (remaining sell amount)', fg=COLOR_SECONDARY))
+  for token, amount, order_count, unlimited in get_open_exposure(open_orders):
+    echo(
+      style_label(f'    {context.token_short(token)}', COLOR_LABEL) + ': ' + format_amount(amount, token) +
+      (f' + {format_integer(unlimited)} unlimited' if unlimited else '') +
+      style(f' ({format_integer(order_count)} orders)', fg=COLOR_SECONDARY)
+    )
+
+  echo('\n' + style('  Volume of the recent trades', fg=COLOR_SECONDARY))
+  for token, sold, bought, trade_count in get_token_volumes(trades):
+    echo(
+      style_label(f'    {context.token_short(token)}', COLOR_LABEL) + ': ' +
+      'sold ' + format_amount(sold, token) + ', bought ' + format_amount(bought, token) +
+      style(f' ({format_integer(trade_count)} trades)', fg=COLOR_SECONDARY)
+    )
+
+  echo('\n' + style('  Fill ratio of the recent orders', fg=COLOR_SECONDARY))
+  for order in orders:
+    label_color = COLOR_LABEL if order.cancel_epoch is None and order.delete_epoch is None else COLOR_LABEL_DELETED
+    unlimited = is_unlimited_amount(order.max_sell_amount)
+    echo(
+      style_label(f'    #{order.order_id}', label_color) + ': ' +
+      f'{context.token_short(order.sell_token)} -> {context.token_short(order.buy_token)}, ' +
+      (f'sold {format_amount(order.sold_volume, order.sell_token)} (unlimited)' if unlimited else
+        f'{format_percentage(order.sold_volume, order.max_sell_amount)} of {format_amount(order.max_sell_amount, order.sell_token)}')
+    )
+
+  echo(style_label(SEPARATOR, COLOR_SEPARATOR))
+
+
+def print_trader_records(orders, open_orders, trades):
+  """One record per line: the open exposure and volume by token, and the recent orders"""
+  write_jsonl([
+    *(
+      {'type': 'exposure', **to_token_record(token, 'token'), 'amount': amount, 'orders': order_count, 'unlimited_orders': unlimited}
+      for token, amount, order_count, unlimited in get_open_exposure(open_orders)
+    ),
+    *(
+      {'type': 'volume', **to_token_record(token, 'token'), 'sold_volume': sold, 'bought_volume': bought, 'trades': trade_count}
+      for token, sold, bought, trade_count in get_token_volumes(trades)
+    ),
+    *(
+      {
+        'type': 'order',
+        'order_id': order.order_id,
+        **to_token_record(order.sell_token, 'sell_token'),
+        **to_token_record(order.buy_token, 'buy_token'),
+        'max_sell_amount': None if is_unlimited_amount(order.max_sell_amount) else order.max_sell_amount,
+        'sold_volume': order.sold_volume,
+        'bought_volume': order.bought_volume,
+        'cancel_date': order.cancel_date
+      }
+      for order in orders
+    )
+  ])
@@ -1,30 +1,26 @@
-from commands.tokens import TOKEN_FIELDS_BASIC, to_token
-from decimal import Decimal
-
-import click
-from gql import gql
+from commands.tokens import Token, get_token_columns, to_token, to_token_record
+from typing import NamedTuple
 
 from constants import (COLOR_LABEL, COLOR_LABEL_DELETED, COLOR_SEPARATOR,
                        SEPARATOR)
-from utils.format import (format_amount, format_amount_in_weis,
-                          format_batch_id_with_date, format_date_time, format_date_time_iso8601,
-                          format_integer, format_percentage, format_price,
-                          format_token_long, format_token_short,
-                          parse_date_from_epoch)
-from utils.graphql import (debug_query, get_graphql_client, gql_filter,
-                           gql_sort_by)
-from utils.misc import (calculate_price, is_unlimited_amount,
-                        to_date_from_batch_id, to_date_from_epoch,
-                        to_etherscan_link, get_csv_writer)
+from utils.format import (FormatContext, format_amount_in_weis, format_integer,
+                          format_price_ratio, parse_date_from_epoch)
+from utils.export import EXPORT_FORMATS, export_records
+from utils.follow import follow_pages
+from utils.graphql import gql_range_filter, paginate, paginate_networks, paginate_parallel
+from utils.mirror import query_mirror
+from utils.misc import to_etherscan_link, get_csv_writer
+from utils.output import echo, flush_output, style, style_label
+from utils.profile import Phase, profile_rows
 
 # Trade entity fields
 #   See https://thegraph.com/explorer/subgraph/gnosis/protocol
-TRADE_FIELDS = f'''
-    owner {{ id }}
-    order {{ orderId }}
+TRADE_FIELDS = '''
+    owner { id }
+    order { orderId }
     tradeBatchId
-    sellToken {{ {TOKEN_FIELDS_BASIC} }}
-    buyToken {{ {TOKEN_FIELDS_BASIC} }}
+    sellToken { id }
+    buyToken { id }
     sellVolume
     buyVolume
     tradeEpoch
@@ -32,70 +28,153 @@ TRADE_FIELDS = f'''
     txHash
 '''
 
+# Columns of the exported trades (jsonl, parquet and arrow formats)
+TRADE_COLUMNS = {
+  'trade_date': 'date',
+  'revert_date': 'date',
+  'batch_id': 'integer',
+  'trader': 'string',
+  'order_id': 'integer',
+  **get_token_columns('sell_token'),
+  **get_token_columns('buy_token'),
+  'sell_volume': 'amount',
+  'buy_volume': 'amount',
+  'tx_hash': 'string'
+}
+
+class Trade(NamedTuple):
+  owner_address: str
+  order_id: int
+  trade_batch_id: int
+  sell_token: Token
+  buy_token: Token
+  sell_volume: int
+  buy_volume: int
+  trade_epoch: str
+  revert_epoch: str
+  tx_hash: str
+  network: str = None
+
+  # Dates are decoded when used
+  @property
+  def trade_date(self):
+    return parse_date_from_epoch(self.trade_epoch)
+
+  @property
+  def revert_date(self):
+    return parse_date_from_epoch(self.revert_epoch)
+
+
 def to_trade_dto(trade):
-  return {
-    "owner_address": trade['owner']['id'],    
-    "order_id": int(trade['order']['orderId']),
-    "trade_date": parse_date_from_epoch(trade['tradeEpoch']),
-    "revert_date": parse_date_from_epoch(trade['revertEpoch']),
-    "sell_token": to_token(trade['sellToken']),
-    "buy_token": to_token(trade['buyToken']),
-    "trade_batch_id": int(trade['tradeBatchId']),
-    "sell_volume": Decimal(trade['sellVolume']),
-    "buy_volume": Decimal(trade['buyVolume']),
-    "tx_hash": trade['txHash']
-  }
-
-def get_trades(count, skip, sort, sort_ascending, print_format, verbose, trader, batch_id, buy_token_id, sell_token_id, tx_hash):
-    filters = gql_filter({
+  network = trade.get('network')
+  return Trade(
+    owner_address=trade['owner']['id'],
+    order_id=int(trade['order']['orderId']),
+    trade_batch_id=int(trade['tradeBatchId']),
+    sell_token=to_token(trade['sellToken'], network),
+    buy_token=to_token(trade['buyToken'], network),
+    sell_volume=int(trade['sellVolume']),
+    buy_volume=int(trade['buyVolume']),
+    trade_epoch=trade['tradeEpoch'],
+    revert_epoch=trade['revertEpoch'],
+    tx_hash=trade['txHash'],
+    network=network
+  )
+
+def get_trades(count, skip, sort, sort_ascending, print_format, verbose, trader, batch_id, buy_token_id, sell_token_id, tx_hash, fetch_all=False, limit=None, parallel=None, local=False, networks=None, follow=False, from_batch_id=None, to_batch_id=None):
+    filters = {
       "owner": trader.lower() if trader else None,
       # TODO: https://github.com/gnosis/dex-cli/issues/50
       #"order": order_id if order_id else None,
       "tradeBatchId": batch_id if batch_id else None,
       "buyToken": buy_token_id if buy_token_id else None,
       "sellToken": sell_token_id if sell_token_id else None,
-      "txHash": tx_hash.lower() if tx_hash else None
-    })
-
-    query = f'''
-{{
-  trades (first: {count} , skip: {skip}, {gql_sort_by(sort, sort_ascending)}{filters}) {{{TRADE_FIELDS}  }}
-}}
-    '''
-    
-    debug_query(query, verbose)
-    client = get_graphql_client()
-    result = client.execute(gql(query))
-    trades_dto = [to_trade_dto(trade) for trade in result['trades']] 
-    print_trades(trades_dto, print_format)
-
-
-def print_trades(trades, print_format):
-  if print_format == 'pretty':    
-    print_trades_pretty(trades)
-  elif print_format == 'csv':
-    print_trades_csv(trades)
-  else:
-    raise Exception('Format "%s" is not supported. Supported formats are: pretty, csv' % (print_format))  
+      "txHash": tx_hash.lower() if tx_hash else None,
+      **gql_range_filter('tradeBatchId', from_batch_id, to_batch_id)
+    }
+
+    if follow:
+      if sort != 'tradeBatchId':
+        raise Exception('Following trades requires sorting by tradeBatchId')
+      if local or networks:
+        raise Exception('Following trades is only supported for the subgraph of a single network')
+
+      trades_dto = (
+        trade
+        for page in follow_pages('trades', TRADE_FIELDS, filters, sort, verbose, limit or count)
+        for trade in profile_rows(page, to_trade_dto)
+      )
+      print_trades(trades_dto, print_format)
+      return
+
+    def fetch_trades():
+      if local:
+        return query_mirror('trades', filters, sort, sort_ascending, skip=skip, limit=None if fetch_all else (limit or count))
+      elif parallel:
+        if sort != 'tradeBatchId':
+          raise Exception('Parallel fetching of trades requires sorting by tradeBatchId')
+
+        return paginate_parallel(
+          entity='trades',
+          fields=TRADE_FIELDS,
+          filters=filters,
+          sort=sort,
+          sort_ascending=sort_ascending,
+          verbose=verbose,
+          partitions=parallel,
+          skip=skip,
+          limit=None if fetch_all else (limit or count)
+        )
+      else:
+        return paginate(
+          entity='trades',
+          fields=TRADE_FIELDS,
+          filters=filters,
+          sort=sort,
+          sort_ascending=sort_ascending,
+          verbose=verbose,
+          skip=skip,
+          limit=None if fetch_all else (limit or count)
+        )
+
+    trades = paginate_networks(networks, fetch_trades) if networks else fetch_trades()
+    trades_dto = profile_rows(trades, to_trade_dto)
+    print_trades(trades_dto, print_format, with_network=bool(networks))
+
+
+def print_trades(trades, print_format, with_network=False):
+  with Phase('render'):
+    try:
+      if print_format == 'pretty':    
+        print_trades_pretty(trades)
+      elif print_format == 'csv':
+        print_trades_csv(trades, with_network)
+      elif print_format in EXPORT_FORMATS:
+        print_trades_records(trades, print_format, with_network)
+      else:
+        raise Exception('Format "%s" is not supported. Supported formats are: pretty, csv, %s' % (print_format, ', '.join(EXPORT_FORMATS)))
+    finally:
+      flush_output()
 
 
 def print_trades_pretty(trades):
-  click.echo(click.style(SEPARATOR, fg=COLOR_SEPARATOR))
+  context = FormatContext()
+  echo(style_label(SEPARATOR, COLOR_SEPARATOR))
 
   for trade in trades:
-    revert_date = trade['revert_date']
-    sell_token, sell_volume = trade['sell_token'], trade['sell_volume']
-    buy_token, buy_volume = trade['buy_token'], trade['buy_volume']
-    sellTokenDecimals, sellTokenLabel = sell_token['decimals'], format_token_short(sell_token)
-    buyTokenDecimals, buyTokenLabel = buy_token['decimals'], format_token_short(buy_token)
+    revert_date = context.epoch_date_time(trade.revert_epoch)
+    sell_token, sell_volume = trade.sell_token, trade.sell_volume
+    buy_token, buy_volume = trade.buy_token, trade.buy_volume
+    sellTokenDecimals, sellTokenLabel = sell_token.decimals, context.token_short(sell_token)
+    buyTokenDecimals, buyTokenLabel = buy_token.decimals, context.token_short(buy_token)
 
     # Revert date
-    if revert_date is None:
+    if not revert_date:
       label_color = COLOR_LABEL
       revert_date_text = ''
     else:
       label_color = COLOR_LABEL_DELETED
-      revert_date_text = click.style('  Reverted date', fg=label_color) + ': ' + click.style(format_date_time(revert_date), bg=COLOR_LABEL_DELETED) + '\n'
+      revert_date_text = style_label('  Reverted date', label_color) + ': ' + style(revert_date, bg=COLOR_LABEL_DELETED) + '\n'
 
     # Prices
     order_price_text_1 = _get_price_text(
@@ -119,48 +198,50 @@ def print_trades_pretty(trades):
       label_color=label_color
     )
       
-    click.echo(
-      click.style('  Trade date', fg=label_color) + ': ' + 
-      format_date_time(trade['trade_date']) + '\n' +       
+    echo(
+      (style_label('  Network', label_color) + ': ' + trade.network + '\n' if trade.network else '') +
+      style_label('  Trade date', label_color) + ': ' + 
+      context.epoch_date_time(trade.trade_epoch) + '\n' +       
       revert_date_text + 
       '\n' + 
 
-      click.style('  Batch Id', fg=label_color) + ': ' + 
-      format_integer(trade['trade_batch_id']) + '\n' + 
+      style_label('  Batch Id', label_color) + ': ' + 
+      format_integer(trade.trade_batch_id) + '\n' + 
 
-      click.style('  Trader', fg=label_color) + ': ' + 
-      trade['owner_address'] + '\n' + 
+      style_label('  Trader', label_color) + ': ' + 
+      trade.owner_address + '\n' + 
 
-      click.style('  Order Id', fg=label_color) + ': ' + 
-      format_integer(trade['order_id']) + '\n\n' + 
+      style_label('  Order Id', label_color) + ': ' + 
+      format_integer(trade.order_id) + '\n\n' + 
       
-      click.style('  Sell Token', fg=label_color) + ': ' + 
-      format_token_long(sell_token) + '\n' + 
+      style_label('  Sell Token', label_color) + ': ' + 
+      context.token_long(sell_token) + '\n' + 
 
-      click.style('  Buy Token', fg=label_color) + ': ' + 
-      format_token_long(buy_token) + '\n' +
+      style_label('  Buy Token', label_color) + ': ' + 
+      context.token_long(buy_token) + '\n' +
 
       # Prices
       f'{order_price_text_1}\n{order_price_text_2}\n' +
 
-      click.style('  Sell volume', fg=label_color) + ': ' + 
+      style_label('  Sell volume', label_color) + ': ' + 
       format_amount_in_weis(sell_volume, sellTokenDecimals) + ' ' + sellTokenLabel + '\n' + 
 
-      click.style('  Buy volume', fg=label_color) + ': ' + 
+      style_label('  Buy volume', label_color) + ': ' + 
       format_amount_in_weis(buy_volume, buyTokenDecimals) + ' ' + buyTokenLabel + '\n\n' + 
 
 
-      click.style('  Transaction', fg=label_color) + ': ' + 
-      to_etherscan_link(trade['tx_hash']) + '\n' + 
+      style_label('  Transaction', label_color) + ': ' + 
+      to_etherscan_link(trade.tx_hash, trade.network) + '\n' + 
 
-      click.style(SEPARATOR, fg=COLOR_SEPARATOR)
+      style_label(SEPARATOR, COLOR_SEPARATOR)
     )
 
 
-def print_trades_csv(trades):
+def print_trades_csv(trades, with_network=False):
+  context = FormatContext()
   writer = get_csv_writer()
 
-  writer.writerow(['Date',
+  writer.writerow((['Network'] if with_network else []) + ['Date',
                    'Reverted',
                    'Batch Id',
                    'Trader Address',
@@ -175,55 +256,70 @@ def print_trades_csv(trades):
 
   for trade in trades:
 
-    revert_date = trade.get('revert_date', None)
-    revert_date_text = format_date_time_iso8601(revert_date) if revert_date else ''
-
-    sell_token, sell_volume = trade['sell_token'], trade['sell_volume']
-    buy_token, buy_volume = trade['buy_token'], trade['buy_volume']
-
-    price_sell_buy = format_price(
-      calculate_price(
-          numerator=buy_volume,
-          denominator=sell_volume,
-          decimals_numerator=buy_token['decimals'],
-          decimals_denominator=sell_token['decimals'],
-      ))
-
-    price_buy_sell = format_price(
-      calculate_price(
-        numerator=sell_volume,
-        denominator=buy_volume,
-        decimals_numerator=sell_token['decimals'],
-        decimals_denominator=buy_token['decimals'],
-      ))
-
-    writer.writerow([format_date_time_iso8601(trade['trade_date']),
+    revert_date_text = context.epoch_date_time_iso8601(trade.revert_epoch)
+
+    sell_token, sell_volume = trade.sell_token, trade.sell_volume
+    buy_token, buy_volume = trade.buy_token, trade.buy_volume
+
+    price_sell_buy = format_price_ratio(
+      numerator=buy_volume,
+      denominator=sell_volume,
+      decimals_numerator=buy_token.decimals,
+      decimals_denominator=sell_token.decimals
+    )
+
+    price_buy_sell = format_price_ratio(
+      numerator=sell_volume,
+      denominator=buy_volume,
+      decimals_numerator=sell_token.decimals,
+      decimals_denominator=buy_token.decimals
+    )
+
+    writer.writerow(([trade.network] if with_network else []) + [context.epoch_date_time_iso8601(trade.trade_epoch),
         revert_date_text,
-        trade['trade_batch_id'],
-        trade['owner_address'],
-        trade['order_id'],
+        trade.trade_batch_id,
+        trade.owner_address,
+        trade.order_id,
         price_sell_buy,
         price_buy_sell,
-        format_amount_in_weis(sell_volume, sell_token['decimals']),
-        format_token_short(sell_token),
-        format_amount_in_weis(buy_volume, buy_token['decimals']),
-        format_token_short(buy_token),
-        sell_token['address'],
-        buy_token['address'],
-        to_etherscan_link(trade['tx_hash'])
+        format_amount_in_weis(sell_volume, sell_token.decimals),
+        context.token_short(sell_token),
+        format_amount_in_weis(buy_volume, buy_token.decimals),
+        context.token_short(buy_token),
+        sell_token.address,
+        buy_token.address,
+        to_etherscan_link(trade.tx_hash, trade.network)
     ])
 
 
+def print_trades_records(trades, print_format, with_network=False):
+  records = (
+    {
+      **({'network': trade.network} if with_network else {}),
+      'trade_date': trade.trade_date,
+      'revert_date': trade.revert_date,
+      'batch_id': trade.trade_batch_id,
+      'trader': trade.owner_address,
+      'order_id': trade.order_id,
+      **to_token_record(trade.sell_token, 'sell_token'),
+      **to_token_record(trade.buy_token, 'buy_token'),
+      'sell_volume': trade.sell_volume,
+      'buy_volume': trade.buy_volume,
+      'tx_hash': trade.tx_hash
+    }
+    for trade in trades
+  )
+  export_records(records, {'network': 'string', **TRADE_COLUMNS} if with_network else TRADE_COLUMNS, print_format)
+
+
 def _get_price_text (label, sell_label, buy_label, numerator, denominator, decimals_numerator, decimals_denominator, label_color):
   return (
-    click.style(f'  {label} {sell_label}/{buy_label}', fg=label_color) + ': ' +
-    format_price(
-      calculate_price(
-        numerator=numerator,
-        denominator=denominator,
-        decimals_numerator=decimals_numerator,
-        decimals_denominator=decimals_denominator
-      ), 
+    style(f'  {label} {sell_label}/{buy_label}', fg=label_color) + ': ' +
+    format_price_ratio(
+      numerator=numerator,
+      denominator=denominator,
+      decimals_numerator=decimals_numerator,
+      decimals_denominator=decimals_denominator,
       currency=buy_label
     )
   )
@@ -0,0 +1,283 @@
+from commands.tokens import Token, get_token_columns, to_token, to_token_record
+from datetime import datetime, timedelta
+from functools import lru_cache
+from itertools import islice
+from typing import NamedTuple
+
+from constants import (COLOR_LABEL, COLOR_SEPARATOR, FORMAT_CACHE_SIZE, PAGE_SIZE,
+                       SEPARATOR)
+from utils.format import (FormatContext, format_amount_in_weis, format_integer)
+from utils.export import EXPORT_FORMATS, export_records
+from utils.graphql import gql_range_filter, paginate, paginate_networks, paginate_parallel
+from utils.mirror import query_mirror
+from utils.misc import get_csv_writer, to_date_from_batch_id
+from utils.output import echo, flush_output, style_label
+from utils.profile import Phase, count
+
+# Only the fields needed to aggregate the trades
+VOLUME_FIELDS = '''
+    owner { id }
+    tradeBatchId
+    sellToken { id }
+    buyToken { id }
+    sellVolume
+    buyVolume
+    revertEpoch
+'''
+
+# Fields of the key of each group. Volumes can only be added up for the same token, so the time buckets and traders are
+# split by pair
+VOLUME_GROUPS = {
+  'sell': ['sell_token'],
+  'buy': ['buy_token'],
+  'pair': ['sell_token', 'buy_token'],
+  'trader': ['trader', 'sell_token', 'buy_token'],
+  'hour': ['date', 'sell_token', 'buy_token'],
+  'day': ['date', 'sell_token', 'buy_token'],
+  'week': ['date', 'sell_token', 'buy_token'],
+  'month': ['date', 'sell_token', 'buy_token']
+}
+
+# Columns of the exported volumes (jsonl, parquet and arrow formats), the ones of the group are included
+VOLUME_COLUMNS = {
+  'date': {'date': 'date'},
+  'trader': {'trader': 'string'},
+  'sell_token': {**get_token_columns('sell_token'), 'sell_volume': 'amount'},
+  'buy_token': {**get_token_columns('buy_token'), 'buy_volume': 'amount'}
+}
+
+class Volume(NamedTuple):
+  date: datetime
+  trader: str
+  sell_token: Token
+  buy_token: Token
+  trades: int
+  sell_volume: int
+  buy_volume: int
+  network: str = None
+
+
+def get_volume(group_by, from_batch_id, to_batch_id, print_format, verbose, trader, buy_token_id, sell_token_id, parallel=None, local=False, networks=None):
+  filters = {
+    "owner": trader.lower() if trader else None,
+    "buyToken": buy_token_id if buy_token_id else None,
+    "sellToken": sell_token_id if sell_token_id else None,
+    **gql_range_filter('tradeBatchId', from_batch_id, to_batch_id)
+  }
+
+  def fetch_trades():
+    if local:
+      return query_mirror('trades', filters, 'tradeBatchId', True)
+    elif parallel:
+      return paginate_parallel(
+        entity='trades',
+        fields=VOLUME_FIELDS,
+        filters=filters,
+        sort='tradeBatchId',
+        sort_ascending=True,
+        verbose=verbose,
+        partitions=parallel
+      )
+    else:
+      return paginate(
+        entity='trades',
+        fields=VOLUME_FIELDS,
+        filters=filters,
+        sort='tradeBatchId',
+        sort_ascending=True,
+        verbose=verbose
+      )
+
+  trades = paginate_networks(networks, fetch_trades) if networks else fetch_trades()
+  volumes = aggregate_volume(trades, group_by)
+  print_volume(to_volume_dtos(volumes, group_by), group_by, print_format, with_network=bool(networks))
+
+
+def aggregate_volume(trades, group_by):
+  """Add up the trades (not reverted) of each group, as they are fetched. Only the totals are kept, so the memory
+  doesn't grow with the number of trades.
+
+  Returns the number of trades, sell volume and buy volume by group key (see VOLUME_GROUPS), in weis
+  """
+  get_key = _get_group_key(group_by)
+  volumes = {}
+  trades = iter(trades)
+  while True:
+    with Phase('fetch'):
+      chunk = list(islice(trades, PAGE_SIZE))
+    if not chunk:
+      break
+
+    with Phase('aggregate'):
+      for trade in chunk:
+        if trade['revertEpoch'] is not None:
+          continue
+
+        key = get_key(trade)
+        volume = volumes.get(key)
+        if volume is None:
+          volume = volumes[key] = [0, 0, 0]
+        volume[0] += 1
+        volume[1] += int(trade['sellVolume'])
+        volume[2] += int(trade['buyVolume'])
+    count('rows', len(chunk))
+
+  return volumes
+
+
+def to_volume_dtos(volumes, group_by):
+  fields = VOLUME_GROUPS[group_by]
+  for key in sorted(volumes, key=_get_sort_key):
+    network, *values = key
+    group = dict(zip(fields, values))
+    trades, sell_volume, buy_volume = volumes[key]
+    yield Volume(
+      date=group.get('date'),
+      trader=group.get('trader'),
+      sell_token=to_token({'id': group['sell_token']}, network) if 'sell_token' in group else None,
+      buy_token=to_token({'id': group['buy_token']}, network) if 'buy_token' in group else None,
+      trades=trades,
+      sell_volume=sell_volume if 'sell_token' in group else None,
+      buy_volume=buy_volume if 'buy_token' in group else None,
+      network=network
+    )
+
+
+def print_volume(volumes, group_by, print_format, with_network=False):
+  with Phase('render'):
+    try:
+      if print_format == 'pretty':
+        print_volume_pretty(volumes)
+      elif print_format == 'csv':
+        print_volume_csv(volumes, group_by, with_network)
+      elif print_format in EXPORT_FORMATS:
+        print_volume_records(volumes, group_by, print_format, with_network)
+      else:
+        raise Exception('Format "%s" is not supported. Supported formats are: pretty, csv, %s' % (print_format, ', '.join(EXPORT_FORMATS)))
+    finally:
+      flush_output()
+
+
+def print_volume_pretty(volumes):
+  context = FormatContext()
+  echo(style_label(SEPARATOR, COLOR_SEPARATOR))
+
+  for volume in volumes:
+    sell_token, buy_token = volume.sell_token, volume.buy_token
+    echo(
+      (style_label('  Network', COLOR_LABEL) + ': ' + volume.network + '\n' if volume.network else '') +
+      (style_label('  Date', COLOR_LABEL) + ': ' + context.date_time(volume.date) + '\n' if volume.date else '') +
+      (style_label('  Trader', COLOR_LABEL) + ': ' + volume.trader + '\n' if volume.trader else '') +
+      (style_label('  Sell Token', COLOR_LABEL) + ': ' + context.token_long(sell_token) + '\n' if sell_token else '') +
+      (style_label('  Buy Token', COLOR_LABEL) + ': ' + context.token_long(buy_token) + '\n' if buy_token else '') +
+      '\n' +
+
+      style_label('  Trades', COLOR_LABEL) + ': ' +
+      format_integer(volume.trades) + '\n' +
+
+      (
+        style_label('  Sell volume', COLOR_LABEL) + ': ' +
+        format_amount_in_weis(volume.sell_volume, sell_token.decimals) + ' ' + context.token_short(sell_token) + '\n'
+        if sell_token else ''
+      ) +
+      (
+        style_label('  Buy volume', COLOR_LABEL) + ': ' +
+        format_amount_in_weis(volume.buy_volume, buy_token.decimals) + ' ' + context.token_short(buy_token) + '\n'
+        if buy_token else ''
+      ) +
+
+      style_label(SEPARATOR, COLOR_SEPARATOR)
+    )
+
+
+def print_volume_csv(volumes, group_by, with_network=False):
+  context = FormatContext()
+  writer = get_csv_writer()
+  fields = VOLUME_GROUPS[group_by]
+
+  writer.writerow(
+    (['Network'] if with_network else []) +
+    (['Date'] if 'date' in fields else []) +
+    (['Trader Address'] if 'trader' in fields else []) +
+    (['Sell Token', 'Sell Token Address'] if 'sell_token' in fields else []) +
+    (['Buy Token', 'Buy Token Address'] if 'buy_token' in fields else []) +
+    ['Trades'] +
+    (['Sell Volume'] if 'sell_token' in fields else []) +
+    (['Buy Volume'] if 'buy_token' in fields else [])
+  )
+
+  for volume in volumes:
+    sell_token, buy_token = volume.sell_token, volume.buy_token
+    writer.writerow(
+      ([volume.network] if with_network else []) +
+      ([context.date_time_iso8601(volume.date)] if 'date' in fields else []) +
+      ([volume.trader] if 'trader' in fields else []) +
+      ([context.token_short(sell_token), sell_token.address] if sell_token else []) +
+      ([context.token_short(buy_token), buy_token.address] if buy_token else []) +
+      [volume.trades] +
+      ([format_amount_in_weis(volume.sell_volume, sell_token.decimals, thousands_separator=False)] if sell_token else []) +
+      ([format_amount_in_weis(volume.buy_volume, buy_token.decimals, thousands_separator=False)] if buy_token else [])
+    )
+
+
+def print_volume_records(volumes, group_by, print_format, with_network=False):
+  fields = VOLUME_GROUPS[group_by]
+  columns = {
+    **({'network': 'string'} if with_network else {}),
+    **{column: column_type for field in fields for column, column_type in VOLUME_COLUMNS[field].items()},
+    'trades': 'integer'
+  }
+  records = (
+    {
+      **({'network': volume.network} if with_network else {}),
+      **({'date': volume.date} if volume.date else {}),
+      **({'trader': volume.trader} if volume.trader else {}),
+      **({**to_token_record(volume.sell_token, 'sell_token'), 'sell_volume': volume.sell_volume} if volume.sell_token else {}),
+      **({**to_token_record(volume.buy_token, 'buy_token'), 'buy_volume': volume.buy_volume} if volume.buy_token else {}),
+      'trades': volume.trades
+    }
+    for volume in volumes
+  )
+  export_records(records, columns, print_format)
+
+
+def _get_group_key(group_by):
+  """Function returning the key of the group of a trade: its network, and the values of the fields of the group"""
+  if group_by == 'sell':
+    return lambda trade: (trade.get('network'), trade['sellToken']['id'])
+  elif group_by == 'buy':
+    return lambda trade: (trade.get('network'), trade['buyToken']['id'])
+  elif group_by == 'pair':
+    return lambda trade: (trade.get('network'), trade['sellToken']['id'], trade['buyToken']['id'])
+  elif group_by == 'trader':
+    return lambda trade: (trade.get('network'), trade['owner']['id'], trade['sellToken']['id'], trade['buyToken']['id'])
+  elif group_by in ('hour', 'day', 'week', 'month'):
+    return lambda trade: (
+      trade.get('network'),
+      _get_bucket_date(group_by, int(trade['tradeBatchId'])),
+      trade['sellToken']['id'],
+      trade['buyToken']['id']
+    )
+  else:
+    raise Exception('Group "%s" is not supported. Supported groups are: %s' % (group_by, ', '.join(VOLUME_GROUPS)))
+
+
+@lru_cache(maxsize=FORMAT_CACHE_SIZE)
+def _get_bucket_date(interval, batch_id):
+  """Start (UTC) of the hour, day, week (on Monday) or month of a batch"""
+  date = to_date_from_batch_id(batch_id)
+  if interval == 'hour':
+    return date.replace(minute=0, second=0, microsecond=0)
+
+  day = date.replace(hour=0, minute=0, second=0, microsecond=0)
+  if interval == 'day':
+    return day
+  elif interval == 'week':
+    return day - timedelta(days=day.weekday())
+  else:
+    return day.replace(day=1)
+
+
+def _get_sort_key(key):
+  # Token ids are sorted numerically
+  return tuple(int(value) if type(value) is str and value.isdigit() else value for value in key)
@@ -1,5 +1,6 @@
 from decimal import Decimal
 from enum import Enum
+from hashlib import sha256
 import os
 
 class Network(Enum):
@@ -22,24 +23,93 @@ class Network(Enum):
     raise RuntimeError("Unknown env value for Network: " + os.environ['NETWORK'])
     
 
-# Datasource
+# Datasource of each network: subgraph API, subgraph UI and transactions explorer
+NETWORK_URLS = {
+  Network.XDAI: (
+    'https://api.thegraph.com/subgraphs/name/gnosis/protocol-xdai',
+    'https://thegraph.com/explorer/subgraph/gnosis/protocol-xdai',
+    'https://blockscout.com/poa/xdai'
+  ),
+  Network.RINKEBY: (
+    'https://api.thegraph.com/subgraphs/name/gnosis/protocol-rinkeby',
+    'https://thegraph.com/explorer/subgraph/gnosis/protocol-rinkeby',
+    'https://rinkeby.etherscan.io'
+  ),
+  Network.MAINNET: (
+    'https://api.thegraph.com/subgraphs/name/gnosis/protocol',
+    'https://thegraph.com/explorer/subgraph/gnosis/protocol',
+    'https://etherscan.io'
+  )
+}
+
+# Default network of the queries (other ones can be queried with --network, see utils/network.py)
 network = Network.from_env()
-if network is Network.XDAI:
-  URL_API_THE_GRAPH = 'https://api.thegraph.com/subgraphs/name/gnosis/protocol-xdai'
-  URL_UI_THE_GRAPH = 'https://thegraph.com/explorer/subgraph/gnosis/protocol-xdai'
-  TX_EXPLORER_BASE_URL = 'https://blockscout.com/poa/xdai'
-elif network is Network.RINKEBY:
-  URL_API_THE_GRAPH = 'https://api.thegraph.com/subgraphs/name/gnosis/protocol-rinkeby'
-  URL_UI_THE_GRAPH = 'https://thegraph.com/explorer/subgraph/gnosis/protocol-rinkeby'
-  TX_EXPLORER_BASE_URL = 'https://rinkeby.etherscan.io'
-elif network is Network.MAINNET:
-  URL_API_THE_GRAPH = 'https://api.thegraph.com/subgraphs/name/gnosis/protocol'
-  URL_UI_THE_GRAPH = 'https://thegraph.com/explorer/subgraph/gnosis/protocol'
-  TX_EXPLORER_BASE_URL = 'https://etherscan.io'
-else:
-  raise RuntimeError("Unknown Network")
-
-RETRIES = 3
+URL_API_THE_GRAPH, URL_UI_THE_GRAPH, TX_EXPLORER_BASE_URL = NETWORK_URLS[network]
+
+# Another GraphQL server, instead of The Graph (i.e. a local one serving fixtures, see benchmarks/fixture_server.py)
+URL_API_THE_GRAPH = os.environ.get('GNOP_SUBGRAPH_URL', URL_API_THE_GRAPH)
+
+# Requests (see RequestScheduler in utils/graphql.py). Failed requests are retried after a random delay of up to
+# RETRY_BACKOFF_SECONDS, doubling with every retry (up to RETRY_MAX_BACKOFF_SECONDS). When the subgraph throttles them,
+# all the requests are spaced out (from THROTTLE_MIN_INTERVAL_SECONDS, doubling up to THROTTLE_MAX_INTERVAL_SECONDS),
+# and sped up again as they succeed
+RETRIES = 5
+REQUEST_TIMEOUT_SECONDS = 60
+RETRY_BACKOFF_SECONDS = 0.5
+RETRY_MAX_BACKOFF_SECONDS = 30
+THROTTLE_MIN_INTERVAL_SECONDS = 0.05
+THROTTLE_MAX_INTERVAL_SECONDS = 10
+
+# Local cache (per network). The rows of another GraphQL server (GNOP_SUBGRAPH_URL) or of the recorded responses
+# (GNOP_TRANSPORT=replay) are cached apart, so the query cache, token registry, mirror and candles of the subgraph
+# never get their rows (i.e. synthetic tokens with the ids of real ones)
+CACHE_BASE_DIR = os.environ.get('GNOP_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'gnop'))
+TRANSPORT_MODE = os.environ.get('GNOP_TRANSPORT', 'http')
+
+
+def get_cache_dir(base_dir, network_name, api_url, transport_mode):
+  """Cache dir of a network, in a sub dir of the source of the rows unless they come from The Graph"""
+  if transport_mode == 'replay':
+    return os.path.join(base_dir, 'sources', 'replay', network_name)
+  elif api_url != NETWORK_URLS[Network(network_name)][0]:
+    return os.path.join(base_dir, 'sources', sha256(api_url.encode()).hexdigest()[:16], network_name)
+  else:
+    return os.path.join(base_dir, network_name)
+
+
+CACHE_DIR = get_cache_dir(CACHE_BASE_DIR, network.value, URL_API_THE_GRAPH, TRANSPORT_MODE)
+QUERY_CACHE_MAX_BYTES = 256 * 1024 * 1024
+QUERY_CACHE_EVICTION_RATIO = 0.9  # Once over the max size, results are evicted down to this ratio of it
+QUERY_CACHE_TTL_SECONDS = 60  # Results that can still change (i.e. not limited to settled batches)
+
+# Transport of the queries (see utils/transport.py):
+#   - GNOP_TRANSPORT: "http" (default), "record" (save the responses in the fixtures dir) or "replay" (answer the
+#     queries from the recorded responses, with no network)
+#   - GNOP_LATENCY: Simulated latency (ms) of each query i.e. "fixed:200", "uniform:50:500", "normal:200:50",
+#     "exponential:200" or "lognormal:200:0.5" (median and sigma)
+#   - GNOP_ERROR_RATE: Ratio of queries failing (0 to 1)
+#   - GNOP_MAX_REQUESTS_PER_SECOND: Queries are delayed to send no more than these per second
+# The responses are recorded in (and replayed from) the cache dir of the subgraph
+FIXTURES_DIR = os.environ.get('GNOP_FIXTURES_DIR', os.path.join(CACHE_BASE_DIR, network.value, 'fixtures'))
+TRANSPORT_LATENCY = os.environ.get('GNOP_LATENCY')
+TRANSPORT_ERROR_RATE = float(os.environ.get('GNOP_ERROR_RATE', 0))
+TRANSPORT_MAX_REQUESTS_PER_SECOND = float(os.environ.get('GNOP_MAX_REQUESTS_PER_SECOND', 0))
+TRANSPORT_SEED = int(os.environ.get('GNOP_TRANSPORT_SEED', 1))
+
+# Pagination
+#   The Graph never returns more than 1000 entities per query
+PAGE_SIZE = 1000
+#   Pages shrink (down to MIN_PAGE_SIZE rows) when a query times out or its response is too large, and grow back (up to
+#   PAGE_SIZE rows) while a page twice as big would still take less than these
+MIN_PAGE_SIZE = 10
+PAGE_TARGET_SECONDS = 5
+PAGE_TARGET_BYTES = 8 * 1024 * 1024
+PARALLEL_PREFETCH_PAGES = 4
+MAX_CONCURRENT_QUERIES = 16  # Queries in flight at the same time, when they are run concurrently (see utils/async_graphql.py)
+
+# Follow mode (--follow): new rows are polled this many seconds after each batch starts (solutions are submitted during
+# the next batch). If there are none yet, it polls again doubling the delay, until the next batch starts
+FOLLOW_POLL_SECONDS = 15
 
 # Model
 BATCH_TIME_SECONDS = 300
@@ -59,6 +129,15 @@ COLOR_LABEL_DELETED = 'red'
 COLOR_SEPARATOR = 'blue'
 COLOR_SECONDARY = 'cyan'
 
+# Output is written in chunks of this many characters
+OUTPUT_CHUNK_SIZE = 64 * 1024
+
+# Formatted dates kept while printing (many rows share the same batch, and dates)
+FORMAT_CACHE_SIZE = 4096
+
+# Rows in each row group of the parquet and arrow output
+EXPORT_ROW_GROUP_SIZE = 64 * 1024
+
 # CSV Output
 CSV_DELIMITER = ','
 CSV_QUOTE = '"'
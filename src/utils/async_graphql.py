@@ -0,0 +1,199 @@
+"""Concurrent queries: many pages or entities in flight from a single thread, with asyncio.
+
+Queries are sent with aiohttp (one pooled session) if it's installed, or else by the transport of the (sync) GraphQL
+client in a pool of threads. Either way, up to MAX_CONCURRENT_QUERIES queries are in flight at the same time. The
+commands stay synchronous, and use run_concurrently as a facade:
+
+  trades, orders = run_concurrently(
+    paginate_async('trades', TRADE_FIELDS, filters, 'tradeBatchId', False, verbose),
+    paginate_async('orders', ORDERS_FIELDS, filters, 'createEpoch', False, verbose)
+  )
+"""
+from contextvars import ContextVar, copy_context
+import asyncio
+import json
+import time
+
+from constants import MAX_CONCURRENT_QUERIES, PAGE_SIZE, QUERY_CACHE_TTL_SECONDS, REQUEST_TIMEOUT_SECONDS
+from utils.cache import cache_result, get_cached_result, get_query_key
+from utils.graphql import (PageSizer, ScheduledTransport, check_sort_field,
+                           debug_query, get_cursor_filters, get_entity_query,
+                           get_graphql_client, get_next_cursor,
+                           get_page_fields, get_query_document, gql_filter,
+                           gql_sort_by, is_settled, normalize_query,
+                           page_sizer, request_scheduler)
+from utils.network import get_network
+from utils.profile import Phase, add_phase_time, count
+from utils.transport import HTTPTransport
+
+# Clients of each network, only while run_concurrently is running (it can run in several threads at the same time)
+async_clients = ContextVar('async_clients')
+
+
+def run_concurrently(*coroutines):
+  """Run the coroutines (i.e. of paginate_async) at the same time, and return their results. It can't be nested"""
+  return asyncio.run(_gather(coroutines))
+
+
+async def _gather(coroutines):
+  clients = {}
+  async_clients.set(clients)
+  try:
+    return await asyncio.gather(*coroutines)
+  finally:
+    for async_client in clients.values():
+      await async_client.close()
+
+
+def get_async_client():
+  """Client of the current network"""
+  clients, current = async_clients.get(), get_network()
+  async_client = clients.get(current)
+  if async_client is None:
+    async_client = clients[current] = AsyncClient()
+
+  return async_client
+
+
+class AsyncClient:
+  def __init__(self):
+    # Same transport of the sync client (http, record, replay, ...). Only plain HTTP queries are sent with aiohttp
+    self.transport = get_graphql_client().transport
+    self.semaphore = asyncio.Semaphore(MAX_CONCURRENT_QUERIES)
+    self.session = None
+    self.executor = None
+
+    # Scheduled (and profiled) HTTP transport
+    http_transport = getattr(getattr(self.transport, 'transport', None), 'transport', None)
+    if isinstance(self.transport, ScheduledTransport) and isinstance(http_transport, HTTPTransport):
+      try:
+        import aiohttp
+
+        self.url = http_transport.url
+        self.session = aiohttp.ClientSession(
+          connector=aiohttp.TCPConnector(limit=MAX_CONCURRENT_QUERIES),
+          timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT_SECONDS)
+        )
+      except ImportError:
+        pass
+
+    if self.session is None:
+      from concurrent.futures import ThreadPoolExecutor
+      self.executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_QUERIES)
+
+  async def execute(self, document, variables):
+    async with self.semaphore:
+      if self.session is not None:
+        result = await request_scheduler.execute_async(self._post, document, variables)
+      else:
+        # The transport of the sync client is scheduled (and retried) in the thread, reporting to the page sizer of
+        # this task
+        result = await asyncio.get_running_loop().run_in_executor(
+          self.executor, copy_context().run, self.transport.execute, document, variables
+        )
+
+    if result.errors:
+      raise Exception(str(result.errors[0]))
+
+    return result.data
+
+  async def _post(self, document, variables):
+    from graphql.execution import ExecutionResult
+    from graphql.language.printer import print_ast
+
+    count('requests')
+    start = time.perf_counter()
+    try:
+      async with self.session.post(self.url, json={'query': print_ast(document), 'variables': variables or {}}) as response:
+        response.raise_for_status()
+        content = await response.read()
+    except Exception:
+      count('retries')
+      raise
+    finally:
+      # Concurrent queries are not nested, so they are timed apart
+      add_phase_time('network', time.perf_counter() - start)
+
+    count('bytes', len(content))
+    with Phase('decode'):
+      result = json.loads(content)
+    if 'errors' not in result and 'data' not in result:
+      raise Exception(f'Received non-compatible response "{result}"')
+
+    return ExecutionResult(errors=result.get('errors'), data=result.get('data'), extensions={'bytes': len(content)})
+
+  async def close(self):
+    if self.session is not None:
+      await self.session.close()
+    if self.executor is not None:
+      self.executor.shutdown(wait=False)
+
+
+async def execute_query_async(query, variables, verbose, immutable=False):
+  """Same as execute_query, without blocking the other queries"""
+  debug_query(query, variables, verbose)
+  key = get_query_key(normalize_query(query), variables)
+  count('queries')
+  with Phase('cache'):
+    result = get_cached_result(key)
+  if result is None:
+    result = await get_async_client().execute(get_query_document(query), variables)
+    with Phase('cache'):
+      cache_result(key, result, ttl=None if immutable else QUERY_CACHE_TTL_SECONDS)
+  else:
+    count('cached')
+
+  return result
+
+
+async def query_entity_async(entity, fields, first, skip, filters, sort, sort_ascending, verbose, immutable=False):
+  """Same as query_entity, without blocking the other queries"""
+  variables = {
+    'first': first,
+    'skip': skip,
+    'where': gql_filter(filters),
+    **gql_sort_by(sort, sort_ascending)
+  }
+  return (await execute_query_async(get_entity_query(entity, fields), variables, verbose, immutable))[entity]
+
+
+async def paginate_async(entity, fields, filters, sort, sort_ascending, verbose, skip=0, limit=None, page_size=PAGE_SIZE):
+  """Same as paginate, returning all the rows at once. Pages of a query follow each other (each one continues from the
+  cursor of the previous one), but other queries run meanwhile"""
+  immutable = is_settled(filters)
+  cursor = None
+  remaining = limit
+  rows = []
+  sizer = PageSizer(page_size)
+
+  while remaining is None or remaining > 0:
+    first = sizer.size if remaining is None else min(sizer.size, remaining)
+    page_filters = get_cursor_filters(filters, cursor, sort, sort_ascending)
+    # Each coroutine runs in its own task (and context), so the sizer is only seen by the queries of this pagination
+    token = page_sizer.set(sizer)
+    try:
+      page = await query_entity_async(
+        entity, get_page_fields(fields, sort), first, skip, page_filters, sort, sort_ascending, verbose, immutable
+      )
+    except Exception as error:
+      if not sizer.shrink(error):
+        raise
+      continue
+    finally:
+      page_sizer.reset(token)
+    if page:
+      count('pages')
+      rows += page
+
+    if len(page) < first:
+      break
+    if remaining is not None:
+      remaining -= len(page)
+      if remaining <= 0:
+        break
+
+    check_sort_field(fields, sort)
+    cursor = get_next_cursor(page, sort, cursor)
+    skip = 0
+
+  return rows
@@ -0,0 +1,125 @@
+from hashlib import sha256
+from threading import Lock
+import json
+import sqlite3
+import time
+
+from constants import QUERY_CACHE_EVICTION_RATIO, QUERY_CACHE_MAX_BYTES
+from utils.misc import get_cache_path
+from utils.network import get_api_url, get_network
+
+QUERY_CACHE_FILE = 'queries.sqlite'
+
+# Connections to the query cache of each network (by path), shared by all threads
+query_cache_connections = {}
+query_cache_lock = Lock()
+
+# Running total of the size of the results in each query cache (by connection), so it's not added up on every write
+query_cache_sizes = {}
+
+# Read cached results, and write the new ones
+query_cache_mode = {
+  'read': True,
+  'write': True
+}
+
+
+def set_query_cache_mode(read=True, write=True):
+  query_cache_mode['read'] = read
+  query_cache_mode['write'] = write
+
+
+def get_query_key(query, variables):
+  """Cache key of a (normalized) query and its variables, sent to the API of the current network (so the results of
+  another server, i.e. GNOP_SUBGRAPH_URL, are never taken for the ones of the subgraph)
+  """
+  return sha256(
+    f'{get_network().value}\n{get_api_url()}\n{query}\n{json.dumps(variables, sort_keys=True)}'.encode()
+  ).hexdigest()
+
+
+def get_cached_result(key):
+  if not query_cache_mode['read']:
+    return None
+
+  now = time.time()
+  with query_cache_lock:
+    connection = _get_query_cache()
+    row = connection.execute(
+      'SELECT value FROM queries WHERE key = ? AND (expires IS NULL OR expires > ?)', (key, now)
+    ).fetchone()
+    if row is None:
+      return None
+
+    with connection:
+      connection.execute('UPDATE queries SET accessed = ? WHERE key = ?', (now, key))
+
+  return json.loads(row[0])
+
+
+def cache_result(key, result, ttl=None):
+  """Cache the result of a query, forever if no TTL (in seconds) is given"""
+  if not query_cache_mode['write']:
+    return
+
+  value = json.dumps(result)
+  now = time.time()
+  with query_cache_lock:
+    connection = _get_query_cache()
+    with connection:
+      replaced = connection.execute('SELECT size FROM queries WHERE key = ?', (key,)).fetchone()
+      connection.execute(
+        'INSERT OR REPLACE INTO queries (key, value, size, expires, accessed) VALUES (?, ?, ?, ?, ?)',
+        (key, value, len(value), now + ttl if ttl is not None else None, now)
+      )
+      size = query_cache_sizes[connection] = query_cache_sizes[connection] + len(value) - (replaced[0] if replaced else 0)
+      if size > QUERY_CACHE_MAX_BYTES:
+        _evict(connection)
+
+
+def _get_query_cache():
+  path = get_cache_path(QUERY_CACHE_FILE)
+  query_cache_connection = query_cache_connections.get(path)
+  if query_cache_connection is None:
+    query_cache_connection = query_cache_connections[path] = sqlite3.connect(path, check_same_thread=False)
+    with query_cache_connection:
+      query_cache_connection.execute('''
+        CREATE TABLE IF NOT EXISTS queries (
+          key TEXT PRIMARY KEY,
+          value TEXT,
+          size INTEGER,
+          expires REAL,
+          accessed REAL
+        )
+      ''')
+      query_cache_connection.execute('CREATE INDEX IF NOT EXISTS queries_accessed ON queries (accessed)')
+      query_cache_connection.execute('CREATE INDEX IF NOT EXISTS queries_expires ON queries (expires)')
+    query_cache_sizes[query_cache_connection] = _get_size(query_cache_connection)
+
+  return query_cache_connection
+
+
+def _get_size(connection):
+  return connection.execute('SELECT COALESCE(SUM(size), 0) FROM queries').fetchone()[0]
+
+
+def _evict(connection):
+  """Remove the expired results, and then the least recently used ones, until the cache fits in
+  QUERY_CACHE_EVICTION_RATIO of QUERY_CACHE_MAX_BYTES (so the following writes don't evict again)
+  """
+  connection.execute('DELETE FROM queries WHERE expires <= ?', (time.time(),))
+  # Added up again, as other processes can write to the same cache
+  size = query_cache_sizes[connection] = _get_size(connection)
+  max_size = QUERY_CACHE_MAX_BYTES * QUERY_CACHE_EVICTION_RATIO
+  if size <= max_size:
+    return
+
+  evicted_keys = []
+  for key, entry_size in connection.execute('SELECT key, size FROM queries ORDER BY accessed'):
+    if size <= max_size:
+      break
+    evicted_keys.append((key,))
+    size -= entry_size
+
+  connection.executemany('DELETE FROM queries WHERE key = ?', evicted_keys)
+  query_cache_sizes[connection] = size
@@ -0,0 +1,78 @@
+from datetime import datetime
+from decimal import Decimal
+from itertools import islice
+import json
+
+from constants import EXPORT_ROW_GROUP_SIZE
+from utils.output import echo, get_output_stream
+
+# Machine readable formats. Rows are written as records (dicts) with the raw values, for the given columns:
+#   - string, integer
+#   - amount: Token amounts in weis (exact, as they don't fit in 64 bits)
+#   - date: UTC datetimes
+EXPORT_FORMATS = ['jsonl', 'parquet', 'arrow']
+
+
+def export_records(records, columns, print_format):
+  if print_format == 'jsonl':
+    write_jsonl(records)
+  else:
+    write_columnar(records, columns, print_format)
+
+
+def write_jsonl(records):
+  """One JSON object per line, with dates in ISO 8601 and amounts as (exact) integers"""
+  for record in records:
+    echo(json.dumps(record, separators=(',', ':'), default=_to_json_value))
+
+
+def write_columnar(records, columns, print_format):
+  """Parquet or arrow (IPC) file, with a row group for every EXPORT_ROW_GROUP_SIZE records"""
+  try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+  except ImportError:
+    raise Exception('The %s format requires pyarrow. Install it with: pip install pyarrow' % print_format)
+
+  arrow_types = {
+    'string': pyarrow.string(),
+    'integer': pyarrow.int64(),
+    'amount': pyarrow.decimal256(76, 0),
+    'date': pyarrow.timestamp('us', tz='UTC')
+  }
+  schema = pyarrow.schema([(column, arrow_types[column_type]) for column, column_type in columns.items()])
+
+  stream = get_output_stream()
+  if print_format == 'parquet':
+    writer = pyarrow.parquet.ParquetWriter(stream, schema)
+  else:
+    writer = pyarrow.ipc.new_file(stream, schema)
+
+  with writer:
+    records = iter(records)
+    chunk = list(islice(records, EXPORT_ROW_GROUP_SIZE))
+    while chunk:
+      writer.write_table(pyarrow.table(
+        [
+          pyarrow.array(_get_column_values(chunk, column, column_type), type=arrow_types[column_type])
+          for column, column_type in columns.items()
+        ],
+        schema=schema
+      ))
+      chunk = list(islice(records, EXPORT_ROW_GROUP_SIZE))
+
+  stream.flush()
+
+
+def _get_column_values(records, column, column_type):
+  if column_type == 'amount':
+    return [Decimal(record[column]) if record[column] is not None else None for record in records]
+  else:
+    return [record[column] for record in records]
+
+
+def _to_json_value(value):
+  if isinstance(value, datetime):
+    return value.isoformat()
+  raise TypeError('%s is not JSON serializable' % type(value).__name__)
@@ -0,0 +1,57 @@
+import time
+
+from constants import BATCH_TIME_SECONDS, FOLLOW_POLL_SECONDS
+from utils.cache import set_query_cache_mode
+from utils.graphql import get_cursor_filters, get_next_cursor, paginate
+from utils.output import flush_output
+
+
+def follow_pages(entity, fields, filters, sort, verbose, count):
+  """Yield the last "count" rows of an entity (oldest first), and then the new ones as they appear, a page per poll.
+
+  The sort key of the last row (and the ids already returned with that same key) is kept as high-water mark, so each
+  poll only asks for the rows after it. Polls are aligned to the start of the batches (see FOLLOW_POLL_SECONDS)
+  """
+  # Polls always want the latest rows
+  set_query_cache_mode(read=False, write=False)
+
+  rows = list(paginate(entity, fields, filters, sort, False, verbose, limit=count))
+  rows.reverse()
+  cursor = get_next_cursor(rows, sort, None) if rows else None
+  if rows:
+    yield rows
+
+  delay = FOLLOW_POLL_SECONDS
+  next_poll = _get_next_batch_start(time.time()) + FOLLOW_POLL_SECONDS
+  while True:
+    # Everything printed so far is shown before waiting
+    flush_output()
+    time.sleep(max(0, next_poll - time.time()))
+
+    rows = _get_new_rows(entity, fields, filters, sort, verbose, cursor)
+    now = time.time()
+    batch_poll = _get_next_batch_start(now) + FOLLOW_POLL_SECONDS
+    if rows:
+      cursor = get_next_cursor(rows, sort, cursor)
+      yield rows
+      delay, next_poll = FOLLOW_POLL_SECONDS, batch_poll
+    else:
+      # The batch closes late (or there's nothing new): poll again sooner than the next batch
+      delay *= 2
+      next_poll = min(now + delay, batch_poll)
+      if next_poll == batch_poll:
+        delay = FOLLOW_POLL_SECONDS
+
+
+def _get_new_rows(entity, fields, filters, sort, verbose, cursor):
+  rows = paginate(entity, fields, get_cursor_filters(filters, cursor, sort, True), sort, True, verbose)
+  if cursor is None:
+    return list(rows)
+
+  # Pages continue from their own cursor, which may return again rows with the same key as the mark
+  cursor_value, cursor_ids = cursor[0], set(cursor[1])
+  return [row for row in rows if row[sort] != cursor_value or row['id'] not in cursor_ids]
+
+
+def _get_next_batch_start(now):
+  return (int(now) // BATCH_TIME_SECONDS + 1) * BATCH_TIME_SECONDS
@@ -1,23 +1,31 @@
 from datetime import datetime
 from decimal import ROUND_DOWN, Context, Decimal
+from functools import lru_cache
 
-from constants import BATCH_TIME_SECONDS, MAX_BATCH_ID, DATE_FORMAT, DATE_TIME_FORMAT
-from utils.misc import (is_unlimited_amount, to_date_from_batch_id,
+from constants import BATCH_TIME_SECONDS, FORMAT_CACHE_SIZE, MAX_BATCH_ID, DATE_FORMAT, DATE_TIME_FORMAT
+from utils.misc import (calculate_price, is_unlimited_amount, to_date_from_batch_id,
                         to_date_from_epoch)
 
+# Amounts are formatted with integer math when the result is the same as with Decimal: divisions are rounded to the
+# precision of the default context (28 digits), and format_amount_raw quantizes with a precision of 40 digits
+DECIMAL_PRECISION = 28
+QUANTIZE_PRECISION = 40
+MAX_EXACT_AMOUNT = 10 ** DECIMAL_PRECISION - 1
+QUANTIZE_CONTEXT = Context(prec=QUANTIZE_PRECISION)
+
 
 def format_token_long(token):
-  symbol = token['symbol']
-  address = token['address']
-  name = token['name']
+  symbol = token.symbol
+  address = token.address
+  name = token.name
   label = symbol or name
 
   return f'{label} ({address})' if label else address
 
 def format_token_short(token):
-  symbol = token['symbol']
-  address = token['address']
-  name = token['name']
+  symbol = token.symbol
+  address = token.address
+  name = token.name
   label = symbol or name
 
   return label if label else address
@@ -28,7 +36,10 @@ def format_integer(number):
 
 
 def format_amount_in_weis(amount, decimals, rounding=ROUND_DOWN, unlimited_label='Unlimited', thousands_separator=True):
-  if is_unlimited_amount(amount):
+  if type(amount) is int and 0 <= amount <= MAX_EXACT_AMOUNT and rounding == ROUND_DOWN:
+    # Exact: the amount fits in the precision, so there's no rounding
+    return _format_scaled(amount, decimals, thousands_separator)
+  elif is_unlimited_amount(amount):
     return unlimited_label
   else:
     value = amount / Decimal(10 ** decimals)
@@ -38,9 +49,17 @@ def format_price(amount, decimals=10, rounding=ROUND_DOWN, currency=''):
   price = format_amount(amount, decimals=decimals, rounding=rounding)
   return price + ' ' + currency if currency else price
 
+def format_price_ratio(numerator, denominator, decimals_numerator=0, decimals_denominator=0, decimals=10, currency=''):
+  price = format_ratio(numerator, denominator, decimals_numerator, decimals_denominator, decimals=decimals)
+  return price + ' ' + currency if currency else price
+
 def format_percentage(value, total):
   if is_unlimited_amount(total):
     return ''
+
+  scaled_percentage = _get_scaled_ratio(value * 100, total, 0, 0, 2) if type(value) is int else None
+  if scaled_percentage is not None:
+    return _format_scaled(scaled_percentage, 2, True) + '%'
   else:
     percentage = (Decimal(value) / Decimal(total)) * Decimal(100)
     return format_amount(percentage, decimals=2) + '%'
@@ -54,10 +73,22 @@ def format_amount(amount, decimals=18, rounding=ROUND_DOWN, thousands_separator=
     return f'{rounded_value:.{decimals}f}'.rstrip('0').rstrip('.')
 
 def format_amount_raw(amount, decimals=18, rounding=ROUND_DOWN) -> Decimal:
-  quantize_value = Decimal(10) ** -Decimal(decimals)
-  rounded_value = Decimal(amount).quantize(quantize_value, context=Context(prec=40), rounding=rounding)
+  rounded_value = Decimal(amount).quantize(get_quantizer(decimals), context=QUANTIZE_CONTEXT, rounding=rounding)
   return rounded_value
 
+@lru_cache(maxsize=None)
+def get_quantizer(decimals):
+  return Decimal(10) ** -Decimal(decimals)
+
+def format_ratio(numerator, denominator, decimals_numerator=0, decimals_denominator=0, decimals=18, thousands_separator=True):
+  """Same as format_amount(calculate_price(...)), using integer math for integer amounts"""
+  scaled_value = _get_scaled_ratio(numerator, denominator, decimals_numerator, decimals_denominator, decimals)
+  if scaled_value is None:
+    price = calculate_price(numerator, denominator, decimals_numerator, decimals_denominator)
+    return format_amount(price, decimals=decimals, thousands_separator=thousands_separator)
+  else:
+    return _format_scaled(scaled_value, decimals, thousands_separator)
+
 def format_date(date):
   return '' if date is None else date.strftime(DATE_FORMAT)
 
@@ -83,3 +114,112 @@ def format_batch_id_with_date(batch_id, tooBigLabel='Never expires'):
 
 def parse_date_from_epoch(epoch):
   return to_date_from_epoch(int(epoch)) if epoch else None
+
+
+def format_epoch_date_time(epoch, tooBigLabel='Never'):
+  date = parse_date_from_epoch(epoch)
+  return '' if date is None else format_date_time(date, tooBigLabel)
+
+
+def format_epoch_date_time_iso8601(epoch):
+  return format_date_time_iso8601(parse_date_from_epoch(epoch))
+
+
+class FormatContext:
+  """Formatting of the rows printed by one command. Dates and token labels are shared by many rows, so they are
+  formatted once and cached
+  """
+
+  def __init__(self, cache_size=FORMAT_CACHE_SIZE):
+    self.token_labels_short = {}
+    self.token_labels_long = {}
+    self.date_time = lru_cache(maxsize=cache_size)(format_date_time)
+    self.date_time_iso8601 = lru_cache(maxsize=cache_size)(format_date_time_iso8601)
+    # Keyed by the epochs of the rows as they are, so their dates are only decoded once for each distinct epoch
+    self.epoch_date_time = lru_cache(maxsize=cache_size)(format_epoch_date_time)
+    self.epoch_date_time_iso8601 = lru_cache(maxsize=cache_size)(format_epoch_date_time_iso8601)
+    self.batch_id_with_date = lru_cache(maxsize=cache_size)(format_batch_id_with_date)
+    self.batch_date_iso8601 = lru_cache(maxsize=cache_size)(
+      lambda batch_id: format_date_time_iso8601(to_date_from_batch_id(batch_id))
+    )
+
+  def token_short(self, token):
+    label = self.token_labels_short.get(token.id)
+    if label is None:
+      label = self.token_labels_short[token.id] = format_token_short(token)
+    return label
+
+  def token_long(self, token):
+    label = self.token_labels_long.get(token.id)
+    if label is None:
+      label = self.token_labels_long[token.id] = format_token_long(token)
+    return label
+
+
+@lru_cache(maxsize=None)
+def _power_of_ten(exponent):
+  return 10 ** exponent
+
+
+def _get_scaled_ratio(numerator, denominator, decimals_numerator, decimals_denominator, decimals):
+  """Price calculated as calculate_price does, multiplied by 10^decimals and rounded down.
+
+  Returns None if the result could differ from the one of calculate_price and format_amount_raw (i.e. they would round
+  the denominator, or fail)
+  """
+  if type(numerator) is not int or type(denominator) is not int or numerator < 0 or denominator <= 0:
+    return None
+
+  # calculate_price divides the denominator by the precision factor first, which is exact only if it fits the precision
+  shift = decimals_denominator - decimals_numerator
+  if shift >= 0 and denominator > MAX_EXACT_AMOUNT:
+    return None
+
+  # Round numerator * 10^shift / denominator to DECIMAL_PRECISION significant digits (half even, as the default
+  # context), as coefficient * 10^exponent
+  if numerator == 0:
+    coefficient, exponent = 0, 0
+  else:
+    exponent = len(str(numerator)) - len(str(denominator)) + shift - DECIMAL_PRECISION
+    while True:
+      coefficient, remainder, divisor = _divide_scaled(numerator, denominator, shift - exponent)
+      if coefficient >= _power_of_ten(DECIMAL_PRECISION):
+        exponent += 1
+      elif coefficient < _power_of_ten(DECIMAL_PRECISION - 1):
+        exponent -= 1
+      else:
+        break
+
+    if remainder * 2 > divisor or (remainder * 2 == divisor and coefficient % 2 == 1):
+      coefficient += 1
+      if coefficient == _power_of_ten(DECIMAL_PRECISION):
+        coefficient, exponent = _power_of_ten(DECIMAL_PRECISION - 1), exponent + 1
+
+  # Quantize to the given decimals, rounding down
+  if exponent + decimals >= 0:
+    scaled_value = coefficient * _power_of_ten(exponent + decimals)
+  else:
+    scaled_value = coefficient // _power_of_ten(-exponent - decimals)
+
+  return scaled_value if scaled_value < _power_of_ten(QUANTIZE_PRECISION) else None
+
+
+def _divide_scaled(numerator, denominator, exponent):
+  """Quotient and remainder of numerator * 10^exponent / denominator, and the divisor used"""
+  if exponent >= 0:
+    numerator *= _power_of_ten(exponent)
+  else:
+    denominator *= _power_of_ten(-exponent)
+
+  coefficient, remainder = divmod(numerator, denominator)
+  return coefficient, remainder, denominator
+
+
+def _format_scaled(scaled_value, decimals, thousands_separator):
+  """Format an integer amount with the given decimals, as format_amount does"""
+  integer_part, decimal_part = divmod(scaled_value, _power_of_ten(decimals))
+  text = f'{integer_part:,d}' if thousands_separator else str(integer_part)
+  if decimals > 0:
+    text += '.' + str(decimal_part).zfill(decimals)
+
+  return text.rstrip('0').rstrip('.')
@@ -1,47 +1,577 @@
-import click
-from gql import Client, gql
-from gql.transport.requests import RequestsHTTPTransport
+from contextvars import ContextVar, copy_context
+from hashlib import sha256
+from itertools import islice
+from queue import Full, Queue
+from threading import Event, Lock
+import json
+import pickle
+import random
+import re
+import time
 
-from constants import (COLOR_LABEL, COLOR_SECONDARY, RETRIES,
-                       URL_API_THE_GRAPH, URL_UI_THE_GRAPH)
+# gql (graphql-core) and requests take most of the startup time of the CLI. They are imported only when a query is
+# actually sent, so commands answered from the cache or the local mirror don't need them
 
-# Singleton GraphQL client instance
+from constants import (BATCH_TIME_SECONDS, COLOR_LABEL, COLOR_SECONDARY,
+                       MIN_PAGE_SIZE, PAGE_SIZE,
+                       PAGE_TARGET_BYTES, PAGE_TARGET_SECONDS,
+                       PARALLEL_PREFETCH_PAGES, QUERY_CACHE_TTL_SECONDS,
+                       RETRIES, RETRY_BACKOFF_SECONDS,
+                       RETRY_MAX_BACKOFF_SECONDS,
+                       THROTTLE_MAX_INTERVAL_SECONDS,
+                       THROTTLE_MIN_INTERVAL_SECONDS, network)
+from utils.cache import cache_result, get_cached_result, get_query_key
+from utils.misc import get_cache_path, get_current_batch_id
+from utils.network import get_api_url, get_network, get_ui_url, use_network
+from utils.output import echo, style
+from utils.profile import Phase, count
+from utils.transport import ProfiledTransport, get_transport
+
+# Filters on the batch of the results. Once the batch is settled (its solution can't be reverted anymore) those results
+# never change
+SETTLED_BATCH_FILTERS = ['tradeBatchId', 'batchId']
+
+# Tokens of a GraphQL document: strings, punctuators and names/values. Commas are insignificant, like white space
+GRAPHQL_TOKEN = re.compile(r'"(?:[^"\\]|\\.)*"|\.\.\.|[!$&()\[\]{}:=@|]|[^\s,!$&()\[\]{}:=@|"]+')
+
+# GraphQL types of the entities, used to declare the query variables
+ENTITY_TYPES = {
+  'tokens': 'Token',
+  'orders': 'Order',
+  'trades': 'Trade',
+  'prices': 'Price'
+}
+
+# Parsed query documents, by query
+query_documents = {}
+
+# Singleton GraphQL client instance (of the default network)
 graphql_client = None
 
+# GraphQL clients of the other networks
+network_clients = {}
+
+# Page size of the pagination running in this thread (or task), adjusted to the responses of its queries
+page_sizer = ContextVar('page_sizer', default=None)
+
 
 def get_graphql_client():
-  global graphql_client
-  if graphql_client is None:
-    graphql_client = Client(
-      retries = RETRIES,
-      transport = RequestsHTTPTransport(
-        url = URL_API_THE_GRAPH,
-        use_json = True
+  """Client of the current network"""
+  current = get_network()
+  if current is not network:
+    client = network_clients.get(current)
+    if client is None:
+      from gql import Client
+
+      client = network_clients[current] = Client(
+        transport = ScheduledTransport(ProfiledTransport(get_transport(get_api_url())))
       )
-    )
+    return client
+
+  if graphql_client is None:
+    set_graphql_transport(get_transport())
 
   return graphql_client
 
 
-def debug_query(query, verbose):
+def set_graphql_transport(transport):
+  """Send the queries to this transport instead of the subgraph (i.e. fixtures, in the benchmarks)"""
+  global graphql_client
+  from gql import Client
+
+  graphql_client = Client(
+    transport = ScheduledTransport(ProfiledTransport(transport))
+  )
+
+
+class RequestScheduler:
+  """Paces the requests to the subgraphs, of all the threads and networks.
+
+  Failed requests are retried after a jittered exponential backoff. Throttled ones (HTTP 429 or 503, or a rate limit
+  error) also space out all the following requests, which speed up again as they succeed, so long exports run at the
+  highest rate the subgraph tolerates. Requests of a pagination report their latency and size to its PageSizer.
+  """
+
+  def __init__(self):
+    self.lock = Lock()
+    self.interval = 0
+    self.next_request_time = 0
+
+  def execute(self, transport, document, variable_values=None, timeout=None):
+    retry = 0
+    while True:
+      _sleep(self.reserve())
+      start = time.perf_counter()
+      try:
+        result = transport.execute(document, variable_values=variable_values, timeout=timeout)
+        if result.errors and is_throttled(result.errors[0]):
+          raise Exception(str(result.errors[0]))
+      except Exception as error:
+        delay = self.get_retry_delay(error, retry)
+        if delay is None:
+          raise
+        _sleep(delay)
+        retry += 1
+        continue
+
+      self.on_response(time.perf_counter() - start, result)
+      return result
+
+  async def execute_async(self, send, document, variable_values=None):
+    """Same as execute, without blocking the other queries. send is a coroutine function returning the result"""
+    import asyncio
+
+    retry = 0
+    while True:
+      await asyncio.sleep(self.reserve())
+      start = time.perf_counter()
+      try:
+        result = await send(document, variable_values)
+        if result.errors and is_throttled(result.errors[0]):
+          raise Exception(str(result.errors[0]))
+      except Exception as error:
+        delay = self.get_retry_delay(error, retry)
+        if delay is None:
+          raise
+        await asyncio.sleep(delay)
+        retry += 1
+        continue
+
+      self.on_response(time.perf_counter() - start, result)
+      return result
+
+  def reserve(self):
+    """Seconds to wait before sending a request, to keep the interval between requests"""
+    with self.lock:
+      now = time.monotonic()
+      request_time = max(now, self.next_request_time)
+      self.next_request_time = request_time + self.interval
+    return request_time - now
+
+  def get_retry_delay(self, error, retry):
+    """Seconds to wait before retrying a failed request, or None if it shouldn't be retried"""
+    sizer = page_sizer.get()
+    if retry >= RETRIES or (is_oversized(error) and sizer is not None and sizer.can_shrink()):
+      # Oversized pages are not sent again: the pagination asks for a smaller one
+      return None
+
+    delay = random.uniform(0, min(RETRY_MAX_BACKOFF_SECONDS, RETRY_BACKOFF_SECONDS * 2 ** retry))
+    if is_throttled(error):
+      count('throttled')
+      delay = max(delay, get_retry_after(error))
+      with self.lock:
+        self.interval = min(THROTTLE_MAX_INTERVAL_SECONDS, max(THROTTLE_MIN_INTERVAL_SECONDS, self.interval * 2))
+        self.next_request_time = max(self.next_request_time, time.monotonic() + delay)
+
+    return delay
+
+  def on_response(self, latency, result):
+    if self.interval:
+      with self.lock:
+        # 2% faster after each successful request, until they are not spaced out anymore
+        self.interval = self.interval * 0.98 if self.interval > THROTTLE_MIN_INTERVAL_SECONDS else 0
+
+    sizer = page_sizer.get()
+    if sizer is not None:
+      sizer.update(latency, (result.extensions or {}).get('bytes', 0))
+
+
+request_scheduler = RequestScheduler()
+
+
+class ScheduledTransport:
+  """Sends the queries to another transport through the request scheduler (instead of the retries of the client)"""
+
+  def __init__(self, transport):
+    self.transport = transport
+
+  def execute(self, document, variable_values=None, timeout=None):
+    return request_scheduler.execute(self.transport, document, variable_values=variable_values, timeout=timeout)
+
+
+class PageSizer:
+  """Number of rows of the pages of a pagination. It's halved when a query times out or its response is too large (or
+  slower than PAGE_TARGET_SECONDS), and doubled back while a page twice as big would still be under the targets"""
+
+  def __init__(self, page_size):
+    self.max_size = self.size = page_size
+
+  def can_shrink(self):
+    return self.size > MIN_PAGE_SIZE
+
+  def shrink(self, error=None):
+    """Halve the page size, if the error (if any) was caused by its size. Returns whether it was halved"""
+    if (error is not None and not is_oversized(error)) or not self.can_shrink():
+      return False
+
+    self.size = max(MIN_PAGE_SIZE, self.size // 2)
+    return True
+
+  def update(self, latency, size):
+    if latency > PAGE_TARGET_SECONDS or size > PAGE_TARGET_BYTES:
+      self.shrink()
+    elif latency * 2 < PAGE_TARGET_SECONDS and size * 2 < PAGE_TARGET_BYTES:
+      self.size = min(self.max_size, self.size * 2)
+
+
+def is_throttled(error):
+  """Whether a request (or a GraphQL error) was rejected because of the rate of the requests"""
+  message = str(error).lower()
+  return _get_status(error) in (429, 503) or 'rate limit' in message or 'too many requests' in message
+
+
+def is_oversized(error):
+  """Whether a request failed because of the size of its page: it timed out, or the response was too large"""
+  message = str(error).lower()
+  return (
+    isinstance(error, TimeoutError) or _get_status(error) in (413, 504) or
+    'timed out' in message or 'timeout' in message or 'too large' in message
+  )
+
+
+def get_retry_after(error):
+  """Seconds to wait before retrying, as requested by the server (Retry-After header), or 0"""
+  headers = getattr(getattr(error, 'response', None), 'headers', None) or getattr(error, 'headers', None) or {}
+  retry_after = headers.get('Retry-After', '')
+  return min(RETRY_MAX_BACKOFF_SECONDS, int(retry_after)) if retry_after.isdigit() else 0
+
+
+def _get_status(error):
+  # HTTP status of requests (HTTPError) and aiohttp (ClientResponseError) errors
+  return getattr(getattr(error, 'response', None), 'status_code', None) or getattr(error, 'status', None)
+
+
+def _sleep(seconds):
+  if seconds > 0:
+    time.sleep(seconds)
+
+
+def query_entity(entity, fields, first, skip, filters, sort, sort_ascending, verbose, immutable=False):
+  """Get a page of an entity"""
+  variables = {
+    'first': first,
+    'skip': skip,
+    'where': gql_filter(filters),
+    **gql_sort_by(sort, sort_ascending)
+  }
+  return execute_query(get_entity_query(entity, fields), variables, verbose, immutable)[entity]
+
+
+def get_entity_query(entity, fields):
+  """Query for a page of an entity. Pagination, filters and sorting are variables, so the same query (and parsed
+  document) is reused for all the pages"""
+  entity_type = ENTITY_TYPES[entity]
+  return f'''
+query {entity_type}s($first: Int!, $skip: Int!, $where: {entity_type}_filter!, $orderBy: {entity_type}_orderBy!, $orderDirection: OrderDirection!) {{
+  {entity} (first: $first, skip: $skip, where: $where, orderBy: $orderBy, orderDirection: $orderDirection) {{ {fields} }}
+}}
+'''
+
+
+def execute_query(query, variables, verbose, immutable=False):
+  """Execute a query, or get its result from the cache.
+
+  Results of immutable queries are cached forever, the rest only for QUERY_CACHE_TTL_SECONDS.
+  """
+  debug_query(query, variables, verbose)
+  key = get_query_key(normalize_query(query), variables)
+  count('queries')
+  with Phase('cache'):
+    result = get_cached_result(key)
+  if result is None:
+    result = get_graphql_client().execute(get_query_document(query), variable_values=variables)
+    with Phase('cache'):
+      cache_result(key, result, ttl=None if immutable else QUERY_CACHE_TTL_SECONDS)
+  else:
+    count('cached')
+
+  return result
+
+
+def get_query_document(query):
+  """Parsed query, kept in memory and pickled in the cache dir"""
+  document = query_documents.get(query)
+  if document is None:
+    with Phase('parse'):
+      document = _load_query_document(query)
+    query_documents[query] = document
+
+  return document
+
+
+def _load_query_document(query):
+  document_path = get_cache_path(f'query-{sha256(normalize_query(query).encode()).hexdigest()[:16]}.pickle')
+  try:
+    with open(document_path, 'rb') as document_file:
+      document = pickle.load(document_file)
+  except Exception:
+    # Not parsed yet (or written by an incompatible version)
+    from gql import gql
+
+    document = gql(query)
+    with open(document_path, 'wb') as document_file:
+      pickle.dump(document, document_file)
+
+  return document
+
+
+def normalize_query(query):
+  return ' '.join(GRAPHQL_TOKEN.findall(query))
+
+
+def is_settled(filters):
+  """True if the filters only select rows of batches already settled"""
+  last_settled_batch_id = get_current_batch_id() - 2
+  for key in SETTLED_BATCH_FILTERS:
+    for condition, offset in (('', 0), ('_lte', 0), ('_lt', -1)):
+      value = filters.get(key + condition)
+      if value is not None and int(value) + offset <= last_settled_batch_id:
+        return True
+
+    values = filters.get(key + '_in')
+    if values and max(int(value) for value in values) <= last_settled_batch_id:
+      return True
+
+  return False
+
+
+def debug_query(query, variables, verbose):
   if verbose > 0:
-    click.echo(f'''\
-{click.style('GraphQl query: ', fg=COLOR_LABEL, underline=True)}
-  API: {click.style(URL_API_THE_GRAPH, fg=COLOR_SECONDARY)}
-  Subgraph: {click.style(URL_UI_THE_GRAPH, fg=COLOR_SECONDARY)}
+    echo(f'''\
+{style('GraphQl query: ', fg=COLOR_LABEL, underline=True)}
+  API: {style(get_api_url(), fg=COLOR_SECONDARY)}
+  Subgraph: {style(get_ui_url(), fg=COLOR_SECONDARY)}
 
-{query}''')
+{query}
+{style('Variables: ', fg=COLOR_LABEL)}{json.dumps(variables, indent=2)}
+''')
 
 
 def gql_sort_by(sort, sort_ascending):
-  order_direction = 'asc' if sort_ascending else 'desc'
-  return f'orderBy: {sort}, orderDirection: {order_direction}'
+  return {
+    'orderBy': sort,
+    'orderDirection': 'asc' if sort_ascending else 'desc'
+  }
+
+
+def paginate(entity, fields, filters, sort, sort_ascending, verbose, skip=0, limit=None, page_size=PAGE_SIZE):
+  """Yield the rows of an entity page by page, up to "limit" rows (or all of them if None).
+
+  Instead of increasing "skip", every page continues from a cursor: the sort key of the last row received, plus the ids
+  already returned for that same sort value. This keeps each page equally cheap for the subgraph, and rows don't drift
+  between pages when new ones are added.
+  """
+  for page in paginate_pages(entity, fields, filters, sort, sort_ascending, verbose, skip, limit, page_size):
+    yield from page
+
+
+def paginate_pages(entity, fields, filters, sort, sort_ascending, verbose, skip=0, limit=None, page_size=PAGE_SIZE):
+  """Pages of paginate. Their size is adapted to the responses (see PageSizer), up to page_size rows"""
+  immutable = is_settled(filters)
+  cursor = None
+  remaining = limit
+  sizer = PageSizer(page_size)
+
+  while remaining is None or remaining > 0:
+    first = sizer.size if remaining is None else min(sizer.size, remaining)
+    page_filters = get_cursor_filters(filters, cursor, sort, sort_ascending)
+    token = page_sizer.set(sizer)
+    try:
+      rows = query_entity(entity, get_page_fields(fields, sort), first, skip, page_filters, sort, sort_ascending, verbose, immutable)
+    except Exception as error:
+      if not sizer.shrink(error):
+        raise
+      continue
+    finally:
+      page_sizer.reset(token)
+
+    if rows:
+      count('pages')
+      yield rows
+
+    if len(rows) < first:
+      break
+    if remaining is not None:
+      remaining -= len(rows)
+      if remaining <= 0:
+        break
+
+    check_sort_field(fields, sort)
+    cursor = get_next_cursor(rows, sort, cursor)
+    skip = 0
+
+
+def is_entity_field(fields, sort):
+  return re.search(rf'\b{re.escape(sort)}\s*{{', fields) is not None
+
+
+def get_page_fields(fields, sort):
+  """Fields of the pages: the ones requested, and the id and sort value their cursors continue from"""
+  return f'id {fields}' if is_entity_field(fields, sort) else f'id {sort} {fields}'
+
+
+def check_sort_field(fields, sort):
+  # Pages continue from the sort value of their last row, so the rows sorted by a nested entity (i.e. sellToken) are
+  # limited to the first page
+  if is_entity_field(fields, sort):
+    raise Exception('Sorting by "%s" is only supported for one page of rows, use a field of the rows themselves' % sort)
+
+
+def get_cursor_filters(filters, cursor, sort, sort_ascending):
+  """Filters of the page after the cursor (None for the first page)"""
+  if cursor is None:
+    return filters
+
+  cursor_value, cursor_ids = cursor
+  return {**filters, f'{sort}_gte' if sort_ascending else f'{sort}_lte': cursor_value, 'id_not_in': cursor_ids}
+
+
+def get_next_cursor(rows, sort, cursor):
+  """Cursor after a page: the sort key of its last row, and the ids already returned for that same sort key"""
+  last_value = rows[-1][sort]
+  if last_value is None:
+    # There's no filter to continue after a null, the next page would start from the top again
+    raise Exception('Rows without a "%s" (null) can\'t be paginated by it, sort them by another field' % sort)
+  page_ids = [row['id'] for row in rows if row[sort] == last_value]
+  if cursor is not None and cursor[0] == last_value:
+    return last_value, cursor[1] + page_ids
+
+  return last_value, page_ids
+
+
+def paginate_parallel(entity, fields, filters, sort, sort_ascending, verbose, partitions, skip=0, limit=None):
+  """Same as paginate, but splitting the range of the (integer) sort key in disjoint sub-ranges fetched concurrently.
+
+  Rows are still yielded in sort order: sub-ranges are consumed one after the other, while the following ones are
+  prefetched in the background up to PARALLEL_PREFETCH_PAGES pages each.
+  """
+  from utils.async_graphql import paginate_async, run_concurrently
+
+  # Both ends of the range are queried at the same time
+  lowest, highest = (
+    int(rows[0][sort]) if rows else None
+    for rows in run_concurrently(
+      paginate_async(entity, '', filters, sort, True, verbose, limit=1),
+      paginate_async(entity, '', filters, sort, False, verbose, limit=1)
+    )
+  )
+  if lowest is None or highest is None:
+    return
+
+  span = highest - lowest + 1
+  step = -(-span // min(partitions, span))
+  ranges = [(start, min(start + step, highest + 1)) for start in range(lowest, highest + 1, step)]
+  if not sort_ascending:
+    ranges.reverse()
+
+  # Create the client before starting the workers, so they all share it
+  get_graphql_client()
+  stop = Event()
+
+  def fetch(start, end, pages):
+    try:
+      range_filters = {**filters, f'{sort}_gte': str(start), f'{sort}_lt': str(end)}
+      for page in paginate_pages(entity, fields, range_filters, sort, sort_ascending, verbose):
+        if not _put(pages, page, stop):
+          return
+      _put(pages, None, stop)
+    except Exception as e:
+      _put(pages, e, stop)
+
+  remaining = limit
+  from concurrent.futures import ThreadPoolExecutor
+
+  with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+    try:
+      queues = [Queue(maxsize=PARALLEL_PREFETCH_PAGES) for _ in ranges]
+      for (start, end), pages in zip(ranges, queues):
+        # The workers query the network of this thread
+        executor.submit(copy_context().run, fetch, start, end, pages)
+
+      for pages in queues:
+        for page in iter(pages.get, None):
+          if isinstance(page, Exception):
+            raise page
+          if skip:
+            page, skip = page[skip:], max(0, skip - len(page))
+          if remaining is not None:
+            page, remaining = page[:remaining], remaining - min(remaining, len(page))
+          yield from page
+          if remaining == 0:
+            return
+    finally:
+      stop.set()
+
+
+def paginate_networks(networks, fetch):
+  """Yield the rows fetched by fetch() (i.e. with paginate) from each network, with their network name in "network".
+
+  Networks are queried at the same time, each one with its own client. Rows are still yielded network by network, while
+  the following ones are prefetched in the background up to PARALLEL_PREFETCH_PAGES pages each.
+  """
+  stop = Event()
+
+  def fetch_rows(rows_network, pages):
+    try:
+      with use_network(rows_network):
+        rows = iter(fetch())
+        for page in iter(lambda: list(islice(rows, PAGE_SIZE)), []):
+          for row in page:
+            row['network'] = rows_network.value
+          if not _put(pages, page, stop):
+            return
+      _put(pages, None, stop)
+    except Exception as e:
+      _put(pages, e, stop)
+
+  from concurrent.futures import ThreadPoolExecutor
+
+  with ThreadPoolExecutor(max_workers=len(networks)) as executor:
+    try:
+      queues = [Queue(maxsize=PARALLEL_PREFETCH_PAGES) for _ in networks]
+      for rows_network, pages in zip(networks, queues):
+        executor.submit(fetch_rows, rows_network, pages)
+
+      for pages in queues:
+        for page in iter(pages.get, None):
+          if isinstance(page, Exception):
+            raise page
+          yield from page
+    finally:
+      stop.set()
+
+
+def _put(queue, item, stop):
+  while not stop.is_set():
+    try:
+      queue.put(item, timeout=0.1)
+      return True
+    except Full:
+      pass
+  return False
 
 
 def gql_filter(filters):
-  filter_conditions = [_to_condition(key, value) for key, value in filters.items() if value is not None]
-  return f', where: {{ {", ".join(filter_conditions)} }}' if filter_conditions else ''
+  """Filters of the where argument. Integers are sent as strings, as the BigInt fields (batch ids, epochs, amounts,
+  order ids) of the subgraph are"""
+  return {key: _to_gql_value(value) for key, value in filters.items() if value is not None}
+
+
+def _to_gql_value(value):
+  if type(value) is int:
+    return str(value)
+  elif type(value) is list:
+    return [_to_gql_value(item) for item in value]
+  else:
+    return value
+
 
-def _to_condition(key, value):
-    value_string = '"' + value + '"' if issubclass(type(value), str) else value
-    return f"{key}: {value_string}"
+def gql_range_filter(field, from_batch_id, to_batch_id):
+  """Filters of the rows from a batch until another one (excluded), on a batch id (i.e. tradeBatchId) or epoch (i.e.
+  createEpoch) field. Cursors (see get_cursor_filters) only narrow these bounds, as the rows they continue from are in
+  the range"""
+  scale = BATCH_TIME_SECONDS if field.endswith('Epoch') else 1
+  return {
+    f'{field}_gte': str(from_batch_id * scale) if from_batch_id is not None else None,
+    f'{field}_lt': str(to_batch_id * scale) if to_batch_id is not None else None
+  }
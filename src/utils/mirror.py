@@ -0,0 +1,218 @@
+import sqlite3
+
+from utils.misc import get_cache_path
+
+MIRROR_FILE = 'mirror.sqlite'
+
+# Mirrored entities. Columns are named as the subgraph fields:
+#   - integer: Stored as INTEGER (batch ids, epochs, ...)
+#   - amounts: Token amounts, stored as TEXT because they don't fit in a SQLite INTEGER
+#   - references: Nested entities, stored as one of their fields
+#   - mark: Field used as high-water mark, only rows at or after it are pulled on each sync
+#   - updates: Epochs set after the row is created (cancel, delete, revert), rows with any of them at or after the
+#     last synced epoch (the max of these and the updates_since epoch) are pulled again on each sync
+MIRROR_ENTITIES = {
+  'tokens': {
+    'integer': ['decimals', 'createEpoch'],
+    'amounts': [],
+    'text': ['address', 'name', 'symbol', 'txHash'],
+    'references': {},
+    'mark': 'createEpoch',
+    'updates': [],
+    'updates_since': None,
+    'indexes': ['createEpoch', 'address', 'symbol']
+  },
+  'orders': {
+    'integer': ['orderId', 'fromBatchId', 'untilBatchId', 'createEpoch', 'cancelEpoch', 'deleteEpoch'],
+    'amounts': ['priceNumerator', 'priceDenominator', 'maxSellAmount', 'soldVolume', 'boughtVolume'],
+    'text': ['txHash'],
+    'references': {'owner': 'id', 'buyToken': 'id', 'sellToken': 'id'},
+    'mark': 'createEpoch',
+    'updates': ['cancelEpoch', 'deleteEpoch'],
+    'updates_since': 'createEpoch',
+    'indexes': ['createEpoch', 'owner', 'buyToken', 'sellToken', 'txHash']
+  },
+  'trades': {
+    'integer': ['tradeBatchId', 'tradeEpoch', 'revertEpoch'],
+    'amounts': ['sellVolume', 'buyVolume'],
+    'text': ['txHash'],
+    'references': {'owner': 'id', 'order': 'orderId', 'buyToken': 'id', 'sellToken': 'id'},
+    'mark': 'tradeBatchId',
+    'updates': ['revertEpoch'],
+    'updates_since': 'tradeEpoch',
+    'indexes': ['tradeBatchId', 'owner', 'buyToken', 'sellToken', 'txHash']
+  },
+  'prices': {
+    'integer': ['batchId'],
+    'amounts': ['priceInOwlNumerator', 'priceInOwlDenominator', 'volume'],
+    'text': ['txHash'],
+    'references': {'token': 'id'},
+    'mark': 'batchId',
+    'updates': [],
+    'updates_since': None,
+    'indexes': ['batchId', 'token', 'txHash']
+  }
+}
+
+CONDITION_OPERATORS = {
+  '': '=',
+  '_not': '!=',
+  '_gt': '>',
+  '_gte': '>=',
+  '_lt': '<',
+  '_lte': '<=',
+  '_in': 'IN',
+  '_not_in': 'NOT IN'
+}
+
+# Connections to the local mirror of each network (by path), shared by all threads (i.e. of "serve")
+mirror_connections = {}
+
+
+def get_mirror():
+  path = get_cache_path(MIRROR_FILE)
+  mirror_connection = mirror_connections.get(path)
+  if mirror_connection is None:
+    mirror_connection = mirror_connections[path] = sqlite3.connect(path, check_same_thread=False)
+    mirror_connection.row_factory = sqlite3.Row
+    for entity, spec in MIRROR_ENTITIES.items():
+      _create_table(mirror_connection, entity, spec)
+
+  return mirror_connection
+
+
+def get_mirror_columns(entity):
+  spec = MIRROR_ENTITIES[entity]
+  return ['id'] + spec['integer'] + spec['amounts'] + spec['text'] + list(spec['references'])
+
+
+def get_mirror_fields(entity):
+  """GraphQL selection with all the mirrored fields of an entity"""
+  references = MIRROR_ENTITIES[entity]['references']
+  return ' '.join(
+    f'{column} {{ {_get_reference_fields(references[column])} }}' if column in references else column
+    for column in get_mirror_columns(entity)
+  )
+
+
+def get_mirror_mark(entity, fields=None):
+  """Max value of the mark (or of any of the given fields) in the mirror, None if there are no rows"""
+  fields = fields or [MIRROR_ENTITIES[entity]['mark']]
+  row = get_mirror().execute(
+    'SELECT ' + ', '.join(f'MAX({_quote(field)})' for field in fields) + f' FROM {_quote(entity)}'
+  ).fetchone()
+  return max((value for value in row if value is not None), default=None)
+
+
+def save_to_mirror(entity, rows):
+  columns = get_mirror_columns(entity)
+  spec = MIRROR_ENTITIES[entity]
+  references, integer_columns = spec['references'], set(spec['integer'])
+
+  def to_value(row, column):
+    value = row[column]
+    if value is None:
+      return None
+    elif column in references:
+      return value[references[column]]
+    elif column in integer_columns:
+      return int(value)
+    else:
+      return value
+
+  connection = get_mirror()
+  with connection:
+    connection.executemany(
+      f'INSERT OR REPLACE INTO "{entity}" ({", ".join(_quote(column) for column in columns)}) '
+      f'VALUES ({", ".join("?" for _ in columns)})',
+      ([to_value(row, column) for column in columns] for row in rows)
+    )
+
+
+def clear_mirror():
+  connection = get_mirror()
+  with connection:
+    for entity in MIRROR_ENTITIES:
+      connection.execute(f'DELETE FROM "{entity}"')
+
+
+def query_mirror(entity, filters, sort, sort_ascending, skip=0, limit=None):
+  """Yield the rows of an entity from the local mirror, with the same shape returned by the subgraph.
+
+  Filters use the same syntax as the subgraph ("field", "field_gt", "field_in", ...)
+  """
+  spec = MIRROR_ENTITIES[entity]
+  amounts, references = set(spec['amounts']), spec['references']
+  columns = set(get_mirror_columns(entity))
+  # Sort and filter fields are part of the SQL, only the mirrored columns are accepted
+  if sort not in columns:
+    raise Exception('Sorting by "%s" is not supported. Supported fields are: %s' % (sort, ', '.join(sorted(columns))))
+
+  conditions, params = [], []
+  for key, value in filters.items():
+    if value is not None:
+      condition, condition_params = _to_sql_condition(key, value, amounts, columns)
+      conditions.append(condition)
+      params += condition_params
+
+  direction = 'ASC' if sort_ascending else 'DESC'
+  sort_column = _quote(sort)
+  order_by = (
+    f'LENGTH({sort_column}) {direction}, {sort_column} {direction}' if sort in amounts else f'{sort_column} {direction}'
+  )
+  query = (
+    f'SELECT * FROM "{entity}"' +
+    (f' WHERE {" AND ".join(conditions)}' if conditions else '') +
+    f' ORDER BY {order_by}, "id" {direction} LIMIT ? OFFSET ?'
+  )
+  params += [-1 if limit is None else limit, skip]
+
+  for row in get_mirror().execute(query, params):
+    row = dict(row)
+    for column, field in references.items():
+      row[column] = {field: row[column]} if row[column] is not None else None
+    yield row
+
+
+def _create_table(connection, entity, spec):
+  column_definitions = (
+    ['"id" TEXT PRIMARY KEY'] +
+    [f'{_quote(column)} INTEGER' for column in spec['integer']] +
+    [f'{_quote(column)} TEXT' for column in spec['amounts'] + spec['text'] + list(spec['references'])]
+  )
+  with connection:
+    connection.execute(f'CREATE TABLE IF NOT EXISTS "{entity}" ({", ".join(column_definitions)})')
+    for column in spec['indexes']:
+      connection.execute(f'CREATE INDEX IF NOT EXISTS "{entity}_{column}" ON "{entity}" ({_quote(column)})')
+
+
+def _get_reference_fields(field):
+  # The id of the referenced entity is always selected, so the synced rows can be related to other entities
+  return field if field == 'id' else f'id {field}'
+
+
+def _to_sql_condition(key, value, amounts, columns):
+  column, operator = key, ''
+  for suffix in CONDITION_OPERATORS:
+    if suffix and key.endswith(suffix) and len(suffix) > len(operator) and key[:-len(suffix)] in columns:
+      column, operator = key[:-len(suffix)], suffix
+  if column not in columns:
+    raise Exception('Filter "%s" is not supported by the local mirror' % key)
+
+  sql_operator, sql_column = CONDITION_OPERATORS[operator], _quote(column)
+  if operator in ('_in', '_not_in'):
+    values = [str(item) if column in amounts else item for item in value]
+    return f'{sql_column} {sql_operator} ({", ".join("?" for _ in values)})', values
+  elif column in amounts and operator not in ('', '_not'):
+    # Amounts are stored as text: compare them by length first, so they are sorted numerically
+    value = str(value)
+    return (
+      f'(LENGTH({sql_column}) {sql_operator[0]} LENGTH(?) OR '
+      f'(LENGTH({sql_column}) = LENGTH(?) AND {sql_column} {sql_operator} ?))'
+    ), [value, value, value]
+  else:
+    return f'{sql_column} {sql_operator} ?', [str(value) if column in amounts else value]
+
+
+def _quote(column):
+  return f'"{column}"'
@@ -1,12 +1,14 @@
-from datetime import datetime
+from datetime import datetime, timezone
 from decimal import ROUND_DOWN, Decimal
 
 import csv
 import os
-import sys
+import time
 
-from constants import (BATCH_TIME_SECONDS, TX_EXPLORER_BASE_URL, MAX_AMOUNT,
-                       MAX_EPOCH, CSV_DELIMITER, CSV_QUOTE)
+from constants import (BATCH_TIME_SECONDS, CACHE_DIR, MAX_AMOUNT, MAX_EPOCH,
+                       CSV_DELIMITER, CSV_QUOTE, network)
+from utils.network import get_explorer_url, get_network
+from utils.output import get_output
 
 
 def is_unlimited_amount(amount):
@@ -28,6 +30,25 @@ def to_date_from_batch_id(batch_id):
   return to_date_from_epoch(batch_id * BATCH_TIME_SECONDS)
 
 
+def get_current_batch_id():
+  return int(time.time()) // BATCH_TIME_SECONDS
+
+
+def parse_batch_id(value, end=False):
+  """Batch id of a --from/--to value: a batch id, or a date in ISO 8601 (UTC unless it has an offset) i.e. 2020-05-20
+  or 2020-05-20T13:30. A date is in the batch it falls in, or the first one starting after it for the end of a range"""
+  if value.isdigit():
+    return int(value)
+
+  try:
+    date = datetime.fromisoformat(value.replace('Z', '+00:00'))
+  except ValueError:
+    raise Exception(f'Invalid date or batch id "{value}". Use a batch id, or a date i.e. 2020-05-20 or 2020-05-20T13:30')
+
+  epoch = (date if date.tzinfo else date.replace(tzinfo=timezone.utc)).timestamp()
+  return -int(-epoch // BATCH_TIME_SECONDS) if end else int(epoch // BATCH_TIME_SECONDS)
+
+
 def calculate_price(numerator, denominator, decimals_numerator, decimals_denominator):
   numerator_dec = Decimal(numerator)
   denominator_dec = Decimal(denominator)
@@ -42,10 +63,18 @@ def calculate_price(numerator, denominator, decimals_numerator, decimals_denomin
       return numerator_dec / (denominator_dec / precision_factor)
 
 
-def to_etherscan_link(hash):
-  return TX_EXPLORER_BASE_URL + '/tx/' + hash
+def to_etherscan_link(hash, network_name=None):
+  return get_explorer_url(network_name) + '/tx/' + hash
 
 
 def get_csv_writer() -> csv.writer:
-  return csv.writer(sys.stdout, lineterminator=os.linesep, delimiter=CSV_DELIMITER,
+  return csv.writer(get_output(), lineterminator=os.linesep, delimiter=CSV_DELIMITER,
                       quotechar=CSV_QUOTE, quoting=csv.QUOTE_MINIMAL)
+
+
+def get_cache_path(file_name):
+  """Path of a file in the cache dir of the current network"""
+  current = get_network()
+  cache_dir = CACHE_DIR if current is network else os.path.join(os.path.dirname(CACHE_DIR), current.value)
+  os.makedirs(cache_dir, exist_ok=True)
+  return os.path.join(cache_dir, file_name)
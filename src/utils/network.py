@@ -0,0 +1,55 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from constants import (NETWORK_URLS, TX_EXPLORER_BASE_URL, URL_API_THE_GRAPH,
+                       URL_UI_THE_GRAPH, Network, network)
+
+# Network of the queries: the one in the NETWORK env var, unless another one is used (in this thread or task)
+current_network = ContextVar('current_network', default=network)
+
+# Explorer of the transactions, by network name (rows of several networks keep the name of theirs)
+EXPLORER_URLS = {
+  **{network_option.value: urls[2] for network_option, urls in NETWORK_URLS.items()},
+  network.value: TX_EXPLORER_BASE_URL
+}
+
+
+def get_network():
+  return current_network.get()
+
+
+@contextmanager
+def use_network(network_option):
+  """Send the queries (and use the cache) of this network, instead of the default one"""
+  token = current_network.set(network_option)
+  try:
+    yield network_option
+  finally:
+    current_network.reset(token)
+
+
+def parse_networks(value):
+  """Networks of the --network option: names separated by commas, or "all" """
+  if value.casefold() == 'all':
+    return list(Network)
+
+  try:
+    return [Network(name.strip().casefold()) for name in value.split(',')]
+  except ValueError:
+    raise Exception(f'Unknown network in "{value}". Use {", ".join(option.value for option in Network)} or all')
+
+
+def get_api_url():
+  """API of the subgraph of the current network (GNOP_SUBGRAPH_URL only replaces the default one)"""
+  current = get_network()
+  return URL_API_THE_GRAPH if current is network else NETWORK_URLS[current][0]
+
+
+def get_ui_url():
+  current = get_network()
+  return URL_UI_THE_GRAPH if current is network else NETWORK_URLS[current][1]
+
+
+def get_explorer_url(network_name=None):
+  """Explorer of the transactions of a network (by name), or of the current one"""
+  return EXPLORER_URLS[network_name or get_network().value]
@@ -0,0 +1,103 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+import atexit
+import sys
+
+import click
+
+from constants import OUTPUT_CHUNK_SIZE
+
+
+class OutputSink:
+  """Buffers the output text, and writes it (encoded) in chunks of about OUTPUT_CHUNK_SIZE characters"""
+
+  def __init__(self, stream, chunk_size=OUTPUT_CHUNK_SIZE, flush_at_exit=True):
+    self.stream = stream
+    self.chunk_size = chunk_size
+    self.chunks = []
+    self.size = 0
+    if flush_at_exit:
+      atexit.register(self.flush)
+
+  def write(self, text):
+    self.chunks.append(text)
+    self.size += len(text)
+    if self.size >= self.chunk_size:
+      self.flush()
+
+  def flush(self):
+    if self.chunks:
+      self.stream.write(''.join(self.chunks).encode('utf-8'))
+      self.chunks, self.size = [], 0
+    self.stream.flush()
+
+
+# Singleton output, stdout unless an output file is given
+output = None
+output_styled = False
+
+# Output of the current request when serving (see commands/serve.py), instead of the singleton. Never styled
+request_output = ContextVar('request_output', default=None)
+
+
+def get_output():
+  global output, output_styled
+  sink = request_output.get()
+  if sink is not None:
+    return sink
+
+  if output is None:
+    # Write directly to the binary buffer of stdout, if there's one (i.e. not when captured by tests)
+    stdout = getattr(sys.stdout, 'buffer', None)
+    output = OutputSink(stdout) if stdout is not None else sys.stdout
+    output_styled = sys.stdout.isatty()
+
+  return output
+
+
+def set_output_file(path):
+  global output, output_styled
+  output = OutputSink(open(path, 'wb'))
+  output_styled = False
+  style_label.cache_clear()
+
+
+def get_output_stream():
+  """Binary stream of the output, for the formats that are not text"""
+  sink = get_output()
+  if not isinstance(sink, OutputSink):
+    raise Exception('Binary formats can only be written to a file (--output) or to stdout')
+
+  sink.flush()
+  return sink.stream
+
+
+@contextmanager
+def use_output(stream):
+  """Write the output of this thread (or task) to a binary stream"""
+  token = request_output.set(OutputSink(stream, flush_at_exit=False))
+  try:
+    yield
+  finally:
+    request_output.get().flush()
+    request_output.reset(token)
+
+
+def flush_output():
+  get_output().flush()
+
+
+def echo(text=''):
+  get_output().write(text + '\n')
+
+
+def style(text, **styles):
+  """Same as click.style, but only if the output is a terminal"""
+  get_output()
+  return click.style(text, **styles) if output_styled and request_output.get() is None else text
+
+
+@lru_cache(maxsize=None)
+def style_label(label, color):
+  return style(label, fg=color)
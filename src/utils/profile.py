@@ -0,0 +1,99 @@
+from itertools import islice
+from threading import Lock, local
+import time
+
+import click
+
+from constants import PAGE_SIZE
+
+# Phases of a command, in the order they are reported:
+#   - fetch: Paginating the rows (or querying the local mirror), besides the phases below
+#   - cache: Reading and writing the query cache
+#   - parse: Parsing the queries (gql), when not cached
+#   - network: Sending the queries and receiving the responses
+#   - decode: Decoding the (JSON) responses
+#   - dto: Building the DTOs from the rows
+#   - aggregate: Adding up the rows (i.e. volume), instead of building DTOs
+#   - render: Formatting and writing the output, besides the phases above
+PHASES = ['fetch', 'cache', 'parse', 'network', 'decode', 'dto', 'aggregate', 'render']
+
+# Wall and CPU time spent in each phase, always measured (each phase costs a few microseconds, and phases are timed per
+# query or per page, never per row). Nested phases are not counted in the outer ones
+phase_times = {}
+counters = {}
+profile_lock = Lock()
+profile_stacks = local()
+start_time = time.perf_counter()
+
+
+class Phase:
+  """Context manager timing a phase: with Phase('network'): ..."""
+
+  def __init__(self, name):
+    self.name = name
+
+  def __enter__(self):
+    stack = getattr(profile_stacks, 'stack', None)
+    if stack is None:
+      stack = profile_stacks.stack = []
+
+    # Start wall and CPU time, and time spent in nested phases
+    stack.append([time.perf_counter(), time.thread_time(), 0, 0])
+
+  def __exit__(self, *exc_info):
+    stack = profile_stacks.stack
+    start_wall, start_cpu, nested_wall, nested_cpu = stack.pop()
+    wall, cpu = time.perf_counter() - start_wall, time.thread_time() - start_cpu
+    if stack:
+      stack[-1][2] += wall
+      stack[-1][3] += cpu
+
+    add_phase_time(self.name, wall - nested_wall, cpu - nested_cpu)
+
+
+def add_phase_time(name, wall, cpu=0):
+  """Add the time of a phase timed apart (i.e. concurrent queries of a single thread, which are not nested)"""
+  with profile_lock:
+    times = phase_times.get(name)
+    if times is None:
+      times = phase_times[name] = [0, 0, 0]
+    times[0] += wall
+    times[1] += cpu
+    times[2] += 1
+
+
+def count(name, value=1):
+  with profile_lock:
+    counters[name] = counters.get(name, 0) + value
+
+
+def profile_rows(rows, to_dto, chunk_size=PAGE_SIZE):
+  """Yield the DTOs of the rows, built a chunk at a time so fetching the rows and building the DTOs are timed apart"""
+  rows = iter(rows)
+  while True:
+    with Phase('fetch'):
+      chunk = list(islice(rows, chunk_size))
+    if not chunk:
+      return
+
+    with Phase('dto'):
+      dtos = [to_dto(row) for row in chunk]
+    count('rows', len(chunk))
+    yield from dtos
+
+
+def print_profile():
+  """Print the time of each phase, and the counters, to stderr"""
+  total = time.perf_counter() - start_time
+  click.echo(click.style('Profile', fg='green', underline=True) + click.style('      wall (s)   CPU (s)   calls', fg='cyan'), err=True)
+  names = PHASES + sorted(name for name in phase_times if name not in PHASES)
+  for name in names:
+    if name in phase_times:
+      wall, cpu, calls = phase_times[name]
+      click.echo(f'  {name:<10} {wall:>10.3f} {cpu:>9.3f} {calls:>7,d}', err=True)
+
+  click.echo(f'  {"total":<10} {total:>10.3f} {time.process_time():>9.3f}', err=True)
+  click.echo('  ' + '  '.join(
+    f'{name.capitalize()}: {counters.get(name, 0):,d}'
+    for name in ['rows', 'pages', 'queries', 'cached', 'requests', 'retries', 'throttled', 'bytes']
+  ), err=True)
@@ -0,0 +1,189 @@
+from threading import Lock
+import json
+import math
+import os
+import random
+import time
+
+from constants import (FIXTURES_DIR, REQUEST_TIMEOUT_SECONDS,
+                       TRANSPORT_ERROR_RATE, TRANSPORT_LATENCY,
+                       TRANSPORT_MAX_REQUESTS_PER_SECOND, TRANSPORT_MODE,
+                       TRANSPORT_SEED, URL_API_THE_GRAPH)
+from utils.cache import get_query_key
+from utils.profile import Phase, count
+
+# Latency distributions (in ms), by name. Their parameters follow the name in GNOP_LATENCY i.e. "uniform:50:500"
+LATENCY_DISTRIBUTIONS = {
+  'fixed': lambda rnd, latency: latency,
+  'uniform': lambda rnd, low, high: rnd.uniform(low, high),
+  'normal': lambda rnd, mean, stdev: max(0, rnd.gauss(mean, stdev)),
+  'exponential': lambda rnd, mean: rnd.expovariate(1 / mean),
+  'lognormal': lambda rnd, median, sigma: rnd.lognormvariate(math.log(median), sigma)
+}
+
+
+def get_transport(url=URL_API_THE_GRAPH):
+  """Transport of the queries, as configured by GNOP_TRANSPORT and the simulated network settings"""
+  if TRANSPORT_MODE == 'replay':
+    transport = ReplayTransport(FIXTURES_DIR)
+  elif TRANSPORT_MODE in ('http', 'record'):
+    transport = HTTPTransport(url, timeout=REQUEST_TIMEOUT_SECONDS)
+    if TRANSPORT_MODE == 'record':
+      transport = RecordingTransport(transport, FIXTURES_DIR)
+  else:
+    raise Exception(f'Unknown transport "{TRANSPORT_MODE}" (GNOP_TRANSPORT). Use http, record or replay')
+
+  if TRANSPORT_LATENCY or TRANSPORT_ERROR_RATE or TRANSPORT_MAX_REQUESTS_PER_SECOND:
+    transport = SimulatedTransport(
+      transport,
+      latency=TRANSPORT_LATENCY,
+      error_rate=TRANSPORT_ERROR_RATE,
+      max_requests_per_second=TRANSPORT_MAX_REQUESTS_PER_SECOND,
+      seed=TRANSPORT_SEED
+    )
+
+  return transport
+
+
+class ProfiledTransport:
+  """Times the queries sent to another transport (network phase), and counts them and their retries"""
+
+  def __init__(self, transport):
+    self.transport = transport
+
+  def execute(self, document, variable_values=None, timeout=None):
+    count('requests')
+    try:
+      with Phase('network'):
+        return self.transport.execute(document, variable_values=variable_values, timeout=timeout)
+    except Exception:
+      # The request scheduler retries failed requests (up to RETRIES times)
+      count('retries')
+      raise
+
+
+class HTTPTransport:
+  """Same as the RequestsHTTPTransport of gql, sending the queries as JSON, but reusing the connections (one session)
+  and timing the decoding of the responses apart. The size of the response is in the "bytes" extension of the result"""
+
+  def __init__(self, url, timeout=None):
+    import requests
+
+    self.url = url
+    self.timeout = timeout
+    self.session = requests.Session()
+
+  def execute(self, document, variable_values=None, timeout=None):
+    from graphql.execution import ExecutionResult
+    from graphql.language.printer import print_ast
+
+    response = self.session.post(
+      self.url,
+      json={'query': print_ast(document), 'variables': variable_values or {}},
+      timeout=timeout or self.timeout
+    )
+    response.raise_for_status()
+    content = response.content
+    count('bytes', len(content))
+
+    with Phase('decode'):
+      result = json.loads(content)
+    if 'errors' not in result and 'data' not in result:
+      raise Exception(f'Received non-compatible response "{result}"')
+
+    return ExecutionResult(errors=result.get('errors'), data=result.get('data'), extensions={'bytes': len(content)})
+
+
+def get_recording_key(document, variables):
+  from graphql.language.printer import print_ast
+  from utils.graphql import normalize_query
+
+  return get_query_key(normalize_query(print_ast(document)), variables or {})
+
+
+class RecordingTransport:
+  """Sends the queries to another transport, and saves their responses in a dir (one JSON file per query)"""
+
+  def __init__(self, transport, path):
+    self.transport = transport
+    self.path = path
+    os.makedirs(path, exist_ok=True)
+
+  def execute(self, document, variable_values=None, timeout=None):
+    result = self.transport.execute(document, variable_values=variable_values, timeout=timeout)
+    if not result.errors:
+      key = get_recording_key(document, variable_values)
+      recording_path = os.path.join(self.path, f'{key}.json')
+      with open(recording_path + '.tmp', 'w') as recording_file:
+        json.dump({'variables': variable_values, 'data': result.data}, recording_file)
+      os.replace(recording_path + '.tmp', recording_path)
+
+    return result
+
+
+class ReplayTransport:
+  """Answers the queries with the responses saved by RecordingTransport"""
+
+  def __init__(self, path):
+    self.path = path
+
+  def execute(self, document, variable_values=None, timeout=None):
+    from graphql.execution import ExecutionResult
+
+    key = get_recording_key(document, variable_values)
+    try:
+      with open(os.path.join(self.path, f'{key}.json'), 'rb') as recording_file:
+        content = recording_file.read()
+    except FileNotFoundError:
+      return ExecutionResult(data=None, errors=[
+        Exception(f'No recorded response for this query in {self.path}. Record it with GNOP_TRANSPORT=record')
+      ])
+
+    count('bytes', len(content))
+    with Phase('decode'):
+      return ExecutionResult(data=json.loads(content)['data'], errors=None, extensions={'bytes': len(content)})
+
+
+class SimulatedTransport:
+  """Sends the queries to another transport, as through a slow and unreliable network: each query is delayed by a
+  random latency, throttled to max_requests_per_second, and fails with a probability of error_rate"""
+
+  def __init__(self, transport, latency=None, error_rate=0, max_requests_per_second=0, seed=1):
+    self.transport = transport
+    self.get_latency = get_latency_distribution(latency) if latency else None
+    self.error_rate = error_rate
+    self.request_interval = 1 / max_requests_per_second if max_requests_per_second else 0
+    self.random = random.Random(seed)
+    self.lock = Lock()
+    self.next_request_time = 0
+
+  def execute(self, document, variable_values=None, timeout=None):
+    with self.lock:
+      now = time.monotonic()
+      request_time = max(now, self.next_request_time)
+      self.next_request_time = request_time + self.request_interval
+      latency = self.get_latency(self.random) / 1000 if self.get_latency else 0
+      failed = self.random.random() < self.error_rate
+
+    time.sleep(request_time - now + latency)
+    if failed:
+      raise Exception('Simulated transport error')
+
+    return self.transport.execute(document, variable_values=variable_values, timeout=timeout)
+
+
+def get_latency_distribution(latency):
+  """Function returning random latencies (ms) from a random generator, for a distribution such as "normal:200:50" """
+  name, *parameters = latency.split(':')
+  distribution = LATENCY_DISTRIBUTIONS.get(name)
+  try:
+    parameters = [float(parameter) for parameter in parameters]
+    if distribution is None or distribution.__code__.co_argcount != len(parameters) + 1:
+      raise ValueError()
+  except ValueError:
+    raise Exception(
+      f'Invalid latency "{latency}". Use one of: fixed:MS, uniform:MIN:MAX, normal:MEAN:STDEV, exponential:MEAN, '
+      'lognormal:MEDIAN:SIGMA'
+    )
+
+  return lambda rnd: distribution(rnd, *parameters)
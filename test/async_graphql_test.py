@@ -0,0 +1,38 @@
+from graphql.execution import ExecutionResult
+
+import utils.graphql
+from utils.async_graphql import paginate_async, run_concurrently
+
+
+class FakeTransport:
+  def __init__(self, rows):
+    self.rows = rows
+    self.variables = []
+
+  def execute(self, document, variable_values=None, timeout=None):
+    self.variables.append(variable_values)
+    entity = variable_values['orderBy'] == 'tradeBatchId' and 'trades' or 'orders'
+    rows = [row for row in self.rows[entity] if row['id'] not in variable_values['where'].get('id_not_in', [])]
+    return ExecutionResult(data={entity: rows[:variable_values['first']]}, errors=None)
+
+
+class FakeClient:
+  def __init__(self, transport):
+    self.transport = transport
+
+
+def test_paginate_concurrently(monkeypatch):
+  transport = FakeTransport({
+    'trades': [{'id': id, 'tradeBatchId': '1'} for id in 'abcde'],
+    'orders': [{'id': id, 'createEpoch': '1'} for id in 'fg']
+  })
+  monkeypatch.setattr(utils.graphql, 'graphql_client', FakeClient(transport))
+
+  trades, orders = run_concurrently(
+    paginate_async('trades', '', {}, 'tradeBatchId', True, verbose=0, page_size=2),
+    paginate_async('orders', '', {}, 'createEpoch', True, verbose=0, page_size=2)
+  )
+
+  assert [trade['id'] for trade in trades] == ['a', 'b', 'c', 'd', 'e']
+  assert [order['id'] for order in orders] == ['f', 'g']
+  assert len(transport.variables) == 5
@@ -0,0 +1,44 @@
+from http.server import ThreadingHTTPServer
+from threading import Thread
+import os
+import subprocess
+import sys
+
+from constants import NETWORK_URLS, Network, get_cache_dir
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+
+def test_cache_dir_of_other_sources():
+  subgraph_url = NETWORK_URLS[Network.MAINNET][0]
+  assert get_cache_dir('/cache', 'mainnet', subgraph_url, 'http') == os.path.join('/cache', 'mainnet')
+  assert get_cache_dir('/cache', 'mainnet', subgraph_url, 'record') == os.path.join('/cache', 'mainnet')
+  assert get_cache_dir('/cache', 'mainnet', subgraph_url, 'replay') == os.path.join('/cache', 'sources', 'replay', 'mainnet')
+  assert get_cache_dir('/cache', 'mainnet', 'http://localhost:8000', 'http').startswith(os.path.join('/cache', 'sources', ''))
+
+
+def test_fixture_server_runs_leave_the_cache_of_the_subgraph_untouched(tmp_path):
+  from fixture_server import get_handler
+  from fixtures import FixtureTransport, generate_entities
+
+  server = ThreadingHTTPServer(('localhost', 0), get_handler(FixtureTransport(generate_entities(20, token_count=5))))
+  Thread(target=server.serve_forever, daemon=True).start()
+  try:
+    env = {
+      **os.environ,
+      'NETWORK': 'mainnet',
+      'GNOP_CACHE_DIR': str(tmp_path),
+      'GNOP_SUBGRAPH_URL': f'http://localhost:{server.server_address[1]}'
+    }
+    subprocess.run(
+      [sys.executable, os.path.join(ROOT, 'src', 'cli.py'), 'trades', '--count', '3', '--format', 'csv'],
+      env=env, check=True, capture_output=True
+    )
+  finally:
+    server.shutdown()
+
+  # Tokens and queries are cached, but not with the ones of the subgraph
+  assert not os.path.exists(tmp_path / 'mainnet')
+  fixture_dir = get_cache_dir(str(tmp_path), 'mainnet', env['GNOP_SUBGRAPH_URL'], 'http')
+  assert {'tokens.json', 'queries.sqlite'} <= set(os.listdir(fixture_dir))
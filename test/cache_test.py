@@ -0,0 +1,75 @@
+import utils.cache
+import utils.graphql
+import utils.network
+from utils.cache import cache_result, get_cached_result, get_query_key, set_query_cache_mode
+from utils.graphql import execute_query, is_settled
+from utils.misc import get_current_batch_id
+
+
+class FakeClient:
+  def __init__(self):
+    self.calls = 0
+
+  def execute(self, document, variable_values):
+    self.calls += 1
+    return {'tokens': [{'id': str(self.calls)}]}
+
+
+def test_execute_query_caches_normalized_queries(monkeypatch):
+  client = FakeClient()
+  monkeypatch.setattr(utils.graphql, 'graphql_client', client)
+
+  query = 'query Tokens($first: Int!) { tokens (first: $first) { id } }'
+  assert execute_query(query, {'first': 1}, verbose=0) == {'tokens': [{'id': '1'}]}
+  assert execute_query('''
+    query Tokens($first: Int!) {
+      tokens(first: $first) {
+        id
+      }
+    }''', {'first': 1}, verbose=0) == {'tokens': [{'id': '1'}]}
+  assert client.calls == 1
+
+  assert execute_query(query, {'first': 2}, verbose=0) == {'tokens': [{'id': '2'}]}
+  assert client.calls == 2
+
+  set_query_cache_mode(read=False)
+  assert execute_query(query, {'first': 1}, verbose=0) == {'tokens': [{'id': '3'}]}
+  set_query_cache_mode()
+  assert execute_query(query, {'first': 1}, verbose=0) == {'tokens': [{'id': '3'}]}
+  assert client.calls == 3
+
+
+def test_cache_evicts_least_recently_used(monkeypatch):
+  monkeypatch.setattr(utils.cache, 'QUERY_CACHE_MAX_BYTES', 25)
+  cache_result('a', 'aaaaaaaa')
+  cache_result('b', 'bbbbbbbb')
+  assert get_cached_result('a') == 'aaaaaaaa'
+
+  cache_result('c', 'cccccccc')
+  assert get_cached_result('a') == 'aaaaaaaa'
+  assert get_cached_result('b') is None
+  assert get_cached_result('c') == 'cccccccc'
+
+  cache_result('d', 'dddddddd', ttl=-1)
+  assert get_cached_result('d') is None
+
+  # The running size follows the replaced results
+  cache_result('c', 'cc')
+  assert list(utils.cache.query_cache_sizes.values()) == [10 + 4]
+
+
+def test_query_key_depends_on_the_api(monkeypatch):
+  key = get_query_key('{ tokens { id } }', {})
+  monkeypatch.setattr(utils.network, 'URL_API_THE_GRAPH', 'http://localhost:8000')
+  assert get_query_key('{ tokens { id } }', {}) != key
+
+
+def test_is_settled():
+  batch_id = get_current_batch_id()
+
+  assert is_settled({'tradeBatchId': str(batch_id - 2)})
+  assert is_settled({'batchId_lt': batch_id - 1, 'token': '1'})
+  assert is_settled({'tradeBatchId_in': [batch_id - 10, batch_id - 5]})
+  assert not is_settled({'tradeBatchId': str(batch_id - 1)})
+  assert not is_settled({'tradeBatchId_gte': str(batch_id - 100)})
+  assert not is_settled({'createEpoch_lt': 0})
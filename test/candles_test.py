@@ -0,0 +1,83 @@
+from fractions import Fraction
+
+import commands.candles
+from commands.candles import query_candles, update_candles
+
+
+def _price(token, batch_id, numerator, volume):
+  return {
+    'token': {'id': token},
+    'batchId': str(batch_id),
+    'priceInOwlNumerator': str(numerator),
+    'priceInOwlDenominator': '4',
+    'volume': str(volume)
+  }
+
+
+PRICES = [
+  _price('1', 10, 4, 1),
+  _price('2', 10, 8, 10 ** 30),
+  _price('1', 11, 12, 2),
+  _price('1', 12, 2, 3),
+  _price('1', 13, 6, 4),
+  _price('2', 14, 4, 10 ** 30)
+]
+
+
+def _serve_prices(monkeypatch, current_batch_id):
+  queries = []
+
+  def paginate(entity, fields, filters, sort, sort_ascending, verbose):
+    queries.append(filters)
+    return [
+      price for price in PRICES
+      if int(filters['batchId_gt'] or -1) < int(price['batchId']) <= int(filters['batchId_lte'])
+    ]
+
+  monkeypatch.setattr(commands.candles, 'paginate', paginate)
+  monkeypatch.setattr(commands.candles, 'get_current_batch_id', lambda: current_batch_id)
+  return queries
+
+
+def test_candles_are_extended_incrementally(monkeypatch):
+  # Batches up to 11 settled, then up to 14: the open candles are extended with the new prices
+  queries = _serve_prices(monkeypatch, 13)
+  assert update_candles('3:all', 3, None, verbose=0, local=False) == 11
+  assert queries[0]['batchId_gt'] is None
+  queries = _serve_prices(monkeypatch, 16)
+  assert update_candles('3:all', 3, None, verbose=0, local=False) == 14
+  assert queries[0]['batchId_gt'] == '11'
+
+  assert list(query_candles('3:all')) == [
+    ('1', 9, Fraction(1), Fraction(3), Fraction(1), Fraction(3), 3, 2),
+    ('1', 12, Fraction(1, 2), Fraction(3, 2), Fraction(1, 2), Fraction(3, 2), 7, 2),
+    ('2', 9, Fraction(2), Fraction(2), Fraction(2), Fraction(2), 10 ** 30, 1),
+    ('2', 12, Fraction(1), Fraction(1), Fraction(1), Fraction(1), 10 ** 30, 1)
+  ]
+
+  # Same candles as building the series at once
+  _serve_prices(monkeypatch, 16)
+  update_candles('3:once', 3, None, verbose=0, local=False)
+  assert list(query_candles('3:once')) == list(query_candles('3:all'))
+
+
+def test_interrupted_updates_only_save_complete_batches(monkeypatch):
+  # Chunks of one price end in the middle of batch 10 (two prices), and the update fails after the first one
+  monkeypatch.setattr(commands.candles, 'PAGE_SIZE', 1)
+  _serve_prices(monkeypatch, 16)
+  paginate = commands.candles.paginate
+
+  def interrupted_paginate(*args):
+    yield from paginate(*args)[:1]
+    raise Exception('Connection lost')
+
+  monkeypatch.setattr(commands.candles, 'paginate', interrupted_paginate)
+  try:
+    update_candles('3:all', 3, None, verbose=0, local=False)
+  except Exception:
+    pass
+
+  monkeypatch.setattr(commands.candles, 'paginate', paginate)
+  assert update_candles('3:all', 3, None, verbose=0, local=False) == 14
+  update_candles('3:once', 3, None, verbose=0, local=False)
+  assert list(query_candles('3:once')) == list(query_candles('3:all'))
@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+# The CLI modules are imported as top-level packages from src/ (see ./gnop)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import commands.candles
+import commands.tokens
+import utils.cache
+import utils.mirror
+import utils.misc
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(monkeypatch, tmp_path):
+  """Every test starts with an empty cache dir"""
+  monkeypatch.setattr(utils.misc, 'CACHE_DIR', str(tmp_path))
+  monkeypatch.setattr(utils.cache, 'query_cache_connections', {})
+  monkeypatch.setattr(utils.cache, 'query_cache_sizes', {})
+  monkeypatch.setattr(utils.cache, 'query_cache_mode', {'read': True, 'write': True})
+  monkeypatch.setattr(utils.mirror, 'mirror_connections', {})
+  monkeypatch.setattr(commands.tokens, 'token_registries', {})
+  monkeypatch.setattr(commands.candles, 'candle_connections', {})
+  return tmp_path
@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+import utils.output
+from commands.tokens import Token
+from commands.trades import Trade, print_trades
+from utils.output import set_output_file
+
+WETH = Token(id='1', name='Wrapped Ether', symbol='WETH', address='0x01', decimals=18)
+DAI = Token(id='7', name=None, symbol=None, address='0x07', decimals=18)
+
+TRADES = [
+  Trade(
+    owner_address='0xabc',
+    order_id=3,
+    trade_batch_id=5300000,
+    sell_token=WETH,
+    buy_token=DAI,
+    sell_volume=2 ** 128 - 1,
+    buy_volume=10 ** 18,
+    trade_epoch='1590000310',
+    revert_epoch=None,
+    tx_hash='0x123'
+  )
+]
+
+
+@pytest.fixture
+def output_path(tmp_path, monkeypatch):
+  monkeypatch.setattr(utils.output, 'output', None)
+  path = str(tmp_path / 'output')
+  set_output_file(path)
+  return path
+
+
+def test_jsonl_keeps_raw_amounts(output_path):
+  print_trades(TRADES, 'jsonl')
+
+  with open(output_path) as output_file:
+    records = [json.loads(line) for line in output_file]
+
+  assert records == [{
+    'trade_date': '2020-05-20T18:45:10',
+    'revert_date': None,
+    'batch_id': 5300000,
+    'trader': '0xabc',
+    'order_id': 3,
+    'sell_token_id': 1,
+    'sell_token_symbol': 'WETH',
+    'sell_token_address': '0x01',
+    'sell_token_decimals': 18,
+    'buy_token_id': 7,
+    'buy_token_symbol': None,
+    'buy_token_address': '0x07',
+    'buy_token_decimals': 18,
+    'sell_volume': 2 ** 128 - 1,
+    'buy_volume': 10 ** 18,
+    'tx_hash': '0x123'
+  }]
+
+
+@pytest.mark.parametrize('print_format', ['parquet', 'arrow'])
+def test_columnar_formats_are_typed(output_path, print_format):
+  pyarrow = pytest.importorskip('pyarrow')
+  import pyarrow.ipc
+  import pyarrow.parquet
+
+  print_trades(TRADES * 3, print_format)
+
+  if print_format == 'parquet':
+    table = pyarrow.parquet.read_table(output_path)
+  else:
+    table = pyarrow.ipc.open_file(output_path).read_all()
+
+  assert table.num_rows == 3
+  assert table.schema.field('batch_id').type == pyarrow.int64()
+  assert table.column('sell_volume').to_pylist()[0] == 2 ** 128 - 1
@@ -0,0 +1,53 @@
+import utils.follow
+from utils.follow import follow_pages
+
+
+class FakeTime:
+  def __init__(self, now):
+    self.now = now
+    self.sleeps = []
+
+  def time(self):
+    return self.now
+
+  def sleep(self, seconds):
+    self.sleeps.append(seconds)
+    self.now += seconds
+
+
+def _trade(id, batch_id):
+  return {'id': id, 'tradeBatchId': str(batch_id)}
+
+
+def test_follow_polls_rows_after_the_mark(monkeypatch):
+  trades = [_trade('a', 1), _trade('b', 2), _trade('c', 2)]
+  # New trades (by time), including one of a batch already returned
+  new_trades = {315: [_trade('d', 2)], 960: [_trade('e', 3), _trade('f', 3)]}
+  clock = FakeTime(250)
+  queries = []
+
+  def paginate(entity, fields, filters, sort, sort_ascending, verbose, limit=None):
+    queries.append(filters)
+    for at in sorted(new_trades):
+      if at <= clock.now:
+        trades.extend(new_trades.pop(at))
+
+    rows = sorted(trades, key=lambda trade: (int(trade['tradeBatchId']), trade['id']), reverse=not sort_ascending)
+    if 'tradeBatchId_gte' in filters:
+      rows = [row for row in rows if int(row['tradeBatchId']) >= int(filters['tradeBatchId_gte'])]
+    return rows[:limit]
+
+  monkeypatch.setattr(utils.follow, 'paginate', paginate)
+  monkeypatch.setattr(utils.follow, 'time', clock)
+  monkeypatch.setattr(utils.follow, 'flush_output', lambda: None)
+
+  pages = follow_pages('trades', 'txHash', {'owner': None}, 'tradeBatchId', verbose=0, count=2)
+
+  assert [trade['id'] for trade in next(pages)] == ['b', 'c']
+  assert [trade['id'] for trade in next(pages)] == ['d']
+  assert [trade['id'] for trade in next(pages)] == ['e', 'f']
+
+  # Aligned to the batches (300s), polling sooner while there's nothing new
+  assert clock.sleeps == [65, 300, 30, 60, 120, 90, 30, 60]
+  assert queries[1] == {'owner': None, 'tradeBatchId_gte': '2', 'id_not_in': ['b', 'c']}
+  assert queries[-1] == {'owner': None, 'tradeBatchId_gte': '2', 'id_not_in': ['b', 'c', 'd']}
@@ -0,0 +1,87 @@
+from decimal import Decimal, DivisionByZero, InvalidOperation
+import random
+
+from commands.tokens import Token
+from utils.format import (FormatContext, format_amount, format_amount_in_weis, format_batch_id_with_date,
+                          format_date_time, format_date_time_iso8601, format_percentage, format_price_ratio,
+                          format_ratio, format_token_long, format_token_short, parse_date_from_epoch)
+from utils.misc import calculate_price, to_date_from_batch_id
+
+# Edge cases of the Decimal path: rounding to 28 digits, results over 40 digits, zeros and the stripped zeros of
+# integer amounts (i.e. "1,000" with no decimals is formatted as "1,")
+EDGE_AMOUNTS = [0, 1, 5, 1000, 10 ** 18, 10 ** 28 - 1, 10 ** 28, 10 ** 28 + 1, 10 ** 30 + 1, 2 ** 128 - 1]
+EDGE_DECIMALS = [0, 2, 6, 18, 24]
+
+
+def get_amounts(count, seed=1):
+  rnd = random.Random(seed)
+  amounts = list(EDGE_AMOUNTS)
+  for _ in range(count):
+    digits = rnd.choice([1, 2, 6, 18, 22, 27, 28, 29, 38])
+    amounts.append(rnd.randint(0, 10 ** digits) if rnd.random() < 0.8 else rnd.randint(1, 99) * 10 ** digits)
+  return amounts
+
+
+def to_result(function, *args, **kwargs):
+  try:
+    return function(*args, **kwargs)
+  except (DivisionByZero, InvalidOperation) as error:
+    return type(error)
+
+
+def test_format_amount_in_weis_is_the_same_for_integers():
+  for amount in get_amounts(2000):
+    for decimals in EDGE_DECIMALS:
+      for thousands_separator in (True, False):
+        assert (
+          to_result(format_amount_in_weis, amount, decimals, thousands_separator=thousands_separator) ==
+          to_result(format_amount_in_weis, Decimal(amount), decimals, thousands_separator=thousands_separator)
+        ), (amount, decimals)
+
+
+def test_format_ratio_is_the_same_as_calculate_price():
+  rnd = random.Random(2)
+  amounts = get_amounts(500)
+  for _ in range(20000):
+    numerator, denominator = rnd.choice(amounts), rnd.choice(amounts)
+    decimals_numerator, decimals_denominator = rnd.choice(EDGE_DECIMALS), rnd.choice(EDGE_DECIMALS)
+    decimals = rnd.choice([0, 2, 10, 18])
+    price = to_result(calculate_price, Decimal(numerator), Decimal(denominator), decimals_numerator, decimals_denominator)
+
+    assert (
+      to_result(format_ratio, numerator, denominator, decimals_numerator, decimals_denominator, decimals, False) ==
+      to_result(format_amount, price, decimals=decimals, thousands_separator=False)
+    ), (numerator, denominator, decimals_numerator, decimals_denominator, decimals)
+
+
+def test_format_price_ratio_and_percentage():
+  assert format_price_ratio(3 * 10 ** 18, 2 * 10 ** 6, 18, 6, currency='DAI') == '1.5 DAI'
+  assert format_price_ratio(10 ** 6, 3 * 10 ** 18, 6, 18) == '0.3333333333'
+  assert format_price_ratio(2, 3) == '0.6666666666'
+
+  for value, total in [(1, 3), (2, 3), (0, 10), (10 ** 20, 10 ** 20), (10 ** 29, 3 * 10 ** 29), (5, 0), (0, 0)]:
+    assert to_result(format_percentage, value, total) == to_result(format_percentage, Decimal(value), Decimal(total))
+
+
+def test_format_context_is_the_same_as_the_format_functions():
+  context = FormatContext(cache_size=2)
+  tokens = [
+    Token(id='1', symbol='WETH', name='Wrapped Ether', address='0x01', decimals=18),
+    Token(id='2', symbol=None, name=None, address='0x02', decimals=6)
+  ]
+  for _ in range(2):
+    for token in tokens:
+      assert context.token_short(token) == format_token_short(token)
+      assert context.token_long(token) == format_token_long(token)
+
+    for batch_id in [0, 5300000, 5300001, 5300000, 844674335]:
+      date = to_date_from_batch_id(batch_id)
+      assert context.batch_id_with_date(batch_id) == format_batch_id_with_date(batch_id)
+      assert context.batch_date_iso8601(batch_id) == format_date_time_iso8601(date)
+      assert context.date_time_iso8601(date) == format_date_time_iso8601(date)
+
+    # Epochs as the subgraph (text) and the local mirror (integers) return them
+    for epoch in [None, '0', '1590000000', 1590000000, '253402300800']:
+      date = parse_date_from_epoch(epoch)
+      assert context.epoch_date_time(epoch) == ('' if date is None else format_date_time(date))
+      assert context.epoch_date_time_iso8601(epoch) == format_date_time_iso8601(date)
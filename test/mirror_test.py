@@ -0,0 +1,69 @@
+import pytest
+
+from utils.mirror import query_mirror, save_to_mirror
+
+
+def _order(id, sold_volume, create_epoch):
+  return {
+    'id': id, 'owner': {'id': '0x1'}, 'orderId': id, 'fromBatchId': '1', 'untilBatchId': '2',
+    'buyToken': {'id': '1'}, 'sellToken': {'id': '2'}, 'priceNumerator': '1', 'priceDenominator': '1',
+    'maxSellAmount': '340282366920938463463374607431768211455', 'soldVolume': sold_volume, 'boughtVolume': '0',
+    'createEpoch': create_epoch, 'cancelEpoch': None, 'deleteEpoch': None, 'txHash': '0x' + id
+  }
+
+
+def test_query_mirror_filters_and_sorts_like_the_subgraph():
+  save_to_mirror('orders', [
+    _order('1', '0', '100'),
+    _order('2', '9', '300'),
+    _order('3', '10', '200'),
+    _order('4', '100000000000000000000', '400')
+  ])
+
+  def ids(filters, sort='createEpoch', sort_ascending=True, **kwargs):
+    return [order['id'] for order in query_mirror('orders', filters, sort, sort_ascending, **kwargs)]
+
+  # Amounts are compared and sorted numerically, even if stored as text
+  assert ids({'soldVolume_gt': 0}) == ['3', '2', '4']
+  assert ids({'soldVolume_gte': '10'}, sort='soldVolume') == ['3', '4']
+  assert ids({}, sort='soldVolume', sort_ascending=False) == ['4', '3', '2', '1']
+  assert ids({'soldVolume': 0, 'owner': '0x1'}) == ['1']
+  assert ids({'createEpoch_lt': '300', 'id_not_in': ['1']}) == ['3']
+  assert ids({}, skip=1, limit=2) == ['3', '2']
+
+  # Rows have the same shape returned by the subgraph
+  order = next(query_mirror('orders', {'orderId': 4}, 'id', True))
+  assert order['sellToken'] == {'id': '2'}
+  assert order['createEpoch'] == 400
+  assert order['soldVolume'] == '100000000000000000000'
+
+
+def test_query_mirror_accepts_only_mirrored_columns():
+  save_to_mirror('orders', [_order('1', '0', '100')])
+
+  with pytest.raises(Exception, match='Sorting by'):
+    next(query_mirror('orders', {}, 'createEpoch" --', True))
+  with pytest.raises(Exception, match='is not supported by the local mirror'):
+    next(query_mirror('orders', {'owner = owner --': '0x1'}, 'createEpoch', True))
+  with pytest.raises(Exception, match='is not supported by the local mirror'):
+    next(query_mirror('orders', {'unknown_gt': '1'}, 'createEpoch', True))
+
+
+def test_sync_pulls_again_the_orders_cancelled_since_the_last_sync(monkeypatch):
+  import commands.sync
+
+  subgraph = {'orders': [_order('1', '0', '100'), _order('2', '0', '200')], 'tokens': [], 'trades': [], 'prices': []}
+
+  def paginate_pages(entity, fields, filters, sort, sort_ascending, verbose):
+    (key, value), = filters.items() or [(f'{sort}_gte', '0')]
+    field = key[:-len('_gte')]
+    yield [row for row in subgraph[entity] if row[field] is not None and int(row[field]) >= int(value)]
+
+  monkeypatch.setattr(commands.sync, 'paginate_pages', paginate_pages)
+  commands.sync.sync(verbose=0, full=False)
+  assert [order['id'] for order in query_mirror('orders', {}, 'id', True)] == ['1', '2']
+
+  # Order 1 is cancelled after the last sync, and it's not newer than the mark
+  subgraph['orders'][0] = {**subgraph['orders'][0], 'cancelEpoch': '300'}
+  commands.sync.sync(verbose=0, full=False)
+  assert [order['cancelEpoch'] for order in query_mirror('orders', {}, 'id', True)] == [300, None]
@@ -0,0 +1,41 @@
+from constants import Network, network
+import utils.graphql
+import utils.misc
+from utils.graphql import paginate, paginate_networks
+from utils.network import get_network, parse_networks
+
+
+class FakeClient:
+  def __init__(self, rows):
+    self.rows = rows
+
+  def execute(self, document, variable_values):
+    # Each network has its own client, queried from the thread of that network
+    assert get_network() in self.rows
+    return {'trades': self.rows[get_network()][:variable_values['first']]}
+
+
+def test_paginate_networks(monkeypatch, tmp_path):
+  monkeypatch.setattr(utils.misc, 'CACHE_DIR', str(tmp_path / network.value))
+  other_network = Network.XDAI if network is not Network.XDAI else Network.MAINNET
+  rows = {
+    network: [{'id': 'a', 'tradeBatchId': '2'}, {'id': 'b', 'tradeBatchId': '1'}],
+    other_network: [{'id': 'c', 'tradeBatchId': '3'}]
+  }
+  monkeypatch.setattr(utils.graphql, 'graphql_client', FakeClient(rows))
+  monkeypatch.setattr(utils.graphql, 'network_clients', {other_network: FakeClient(rows)})
+
+  fetched_rows = list(paginate_networks(
+    [network, other_network],
+    lambda: paginate('trades', '', {}, 'tradeBatchId', False, verbose=0)
+  ))
+
+  assert [(row['id'], row['network']) for row in fetched_rows] == [
+    ('a', network.value), ('b', network.value), ('c', other_network.value)
+  ]
+  assert (tmp_path / other_network.value / 'queries.sqlite').exists()
+
+
+def test_parse_networks():
+  assert parse_networks('all') == list(Network)
+  assert parse_networks('xdai, Mainnet') == [Network.XDAI, Network.MAINNET]
@@ -0,0 +1,42 @@
+from decimal import Decimal
+import random
+
+from commands.orderbook import BookOrder, OrderBook
+
+
+def _random_orders(rnd, count):
+  orders = []
+  for _ in range(count):
+    from_batch_id = rnd.randint(0, 50)
+    orders.append(BookOrder(
+      price=Decimal(rnd.randint(1, 20)) / 10,
+      from_batch_id=from_batch_id,
+      end_batch_id=from_batch_id + rnd.randint(1, 30),
+      volume=rnd.choice([None, rnd.randint(1, 10 ** 24)])
+    ))
+  return orders
+
+
+def test_levels_add_up_orders_by_price():
+  asks = [BookOrder(Decimal('1.52'), 0, 10, 5), BookOrder(Decimal('1.5'), 0, 10, 1), BookOrder(Decimal('2'), 5, 10, 7)]
+  bids = [BookOrder(Decimal('1.2'), 0, 10, 3), BookOrder(Decimal('1'), 0, 10, None), BookOrder(Decimal('0.5'), 0, 10, 1)]
+
+  asks_levels, bids_levels = OrderBook(asks, bids).at(1, decimals=1, levels=2)
+
+  assert [(level.price, level.volume, level.cumulative_volume, level.orders) for level in asks_levels] == [
+    (Decimal('1.5'), 1, 1, 1),
+    (Decimal('1.6'), 5, 6, 1)
+  ]
+  assert [(level.price, level.volume, level.cumulative_volume, level.orders) for level in bids_levels] == [
+    (Decimal('1.2'), 3, 3, 1),
+    (Decimal('1.0'), None, None, 1)
+  ]
+
+
+def test_moving_between_batches_is_the_same_as_building_the_book_again():
+  rnd = random.Random(1)
+  asks, bids = _random_orders(rnd, 200), _random_orders(rnd, 200)
+  book = OrderBook(asks, bids)
+
+  for batch_id in [10, 11, 30, 12, 60, 0, 25, 25]:
+    assert book.at(batch_id, decimals=1, levels=5) == OrderBook(asks, bids).at(batch_id, decimals=1, levels=5)
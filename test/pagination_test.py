@@ -0,0 +1,173 @@
+from graphql.execution import ExecutionResult
+import pytest
+
+from constants import PAGE_TARGET_BYTES, PAGE_TARGET_SECONDS, RETRIES, RETRY_MAX_BACKOFF_SECONDS
+import utils.graphql
+from utils.graphql import PageSizer, RequestScheduler, gql_filter, gql_range_filter, paginate
+from utils.misc import parse_batch_id
+
+
+class FakeClient:
+  def __init__(self, pages):
+    self.pages = pages
+    self.variables = []
+
+  def execute(self, document, variable_values):
+    self.variables.append(variable_values)
+    return {'trades': self.pages[len(self.variables) - 1]}
+
+
+def _rows(*values):
+  return [{'id': id, 'tradeBatchId': batch_id} for id, batch_id in values]
+
+
+def test_paginate_continues_from_cursor(monkeypatch):
+  client = FakeClient([
+    _rows(('a', '3'), ('b', '2'), ('c', '2')),
+    _rows(('d', '2'), ('e', '1'), ('f', '1')),
+    _rows(('g', '1'))
+  ])
+  monkeypatch.setattr(utils.graphql, 'graphql_client', client)
+
+  rows = paginate('trades', 'txHash', {'owner': '0x1'}, 'tradeBatchId', False, verbose=0, page_size=3)
+
+  assert [row['id'] for row in rows] == ['a', 'b', 'c', 'd', 'e', 'f', 'g']
+  assert client.variables[0]['where'] == {'owner': '0x1'}
+  assert client.variables[1]['where'] == {'owner': '0x1', 'tradeBatchId_lte': '2', 'id_not_in': ['b', 'c']}
+  assert client.variables[2]['where'] == {'owner': '0x1', 'tradeBatchId_lte': '1', 'id_not_in': ['e', 'f']}
+  assert all(variables['orderBy'] == 'tradeBatchId' for variables in client.variables)
+
+
+def test_paginate_stops_at_limit(monkeypatch):
+  client = FakeClient([
+    _rows(('a', '3'), ('b', '2'), ('c', '2')),
+    _rows(('d', '2'), ('e', '1'))
+  ])
+  monkeypatch.setattr(utils.graphql, 'graphql_client', client)
+
+  rows = list(paginate('trades', 'txHash', {}, 'tradeBatchId', False, verbose=0, limit=5, page_size=3))
+
+  assert [row['id'] for row in rows] == ['a', 'b', 'c', 'd', 'e']
+  assert client.variables[1]['first'] == 2
+  assert len(client.variables) == 2
+
+
+def test_paginate_stops_at_null_sort_values_only_if_another_page_is_needed(monkeypatch):
+  client = FakeClient([_rows(('a', '3'), ('b', None)), _rows(('c', '3'), ('d', None))])
+  monkeypatch.setattr(utils.graphql, 'graphql_client', client)
+
+  assert [row['id'] for row in paginate('trades', 'txHash', {}, 'tradeBatchId', True, verbose=0, limit=2, page_size=2)] == ['a', 'b']
+  with pytest.raises(Exception, match='Rows without a "tradeBatchId"'):
+    list(paginate('trades', 'txHash', {}, 'tradeBatchId', True, verbose=0, page_size=2))
+  assert len(client.variables) == 1
+
+
+def test_paginate_sorts_by_entities_only_in_one_page(monkeypatch):
+  rows = [{'id': 'a', 'sellToken': {'id': '1'}}, {'id': 'b', 'sellToken': {'id': '2'}}]
+  client = FakeClient([rows, rows])
+  monkeypatch.setattr(utils.graphql, 'graphql_client', client)
+
+  assert list(paginate('trades', 'sellToken { id }', {}, 'sellToken', True, verbose=0, limit=2, page_size=2)) == rows
+  with pytest.raises(Exception, match='Sorting by "sellToken" is only supported for one page'):
+    list(paginate('trades', 'sellToken { id }', {}, 'sellToken', True, verbose=0, page_size=2))
+
+
+class TimingOutClient(FakeClient):
+  def execute(self, document, variable_values):
+    if not self.variables:
+      self.variables.append(variable_values)
+      raise Exception('Read timed out. (read timeout=60)')
+    return super().execute(document, variable_values)
+
+
+def test_paginate_halves_the_page_when_a_query_times_out(monkeypatch):
+  client = TimingOutClient([None, _rows(('a', '3'), ('b', '2'))])
+  monkeypatch.setattr(utils.graphql, 'graphql_client', client)
+
+  rows = list(paginate('trades', 'txHash', {}, 'tradeBatchId', False, verbose=0))
+
+  assert [row['id'] for row in rows] == ['a', 'b']
+  assert [variables['first'] for variables in client.variables] == [1000, 500]
+
+
+class HTTPError(Exception):
+  def __init__(self, status, headers=None):
+    super().__init__(f'{status} Error')
+    self.status = status
+    self.headers = headers or {}
+
+
+class ThrottlingTransport:
+  def __init__(self, errors):
+    self.errors = errors
+    self.requests = 0
+
+  def execute(self, document, variable_values=None, timeout=None):
+    self.requests += 1
+    if self.errors:
+      raise self.errors.pop(0)
+    return ExecutionResult(data={'trades': []}, errors=None, extensions={'bytes': 100})
+
+
+def test_scheduler_backs_off_and_spaces_out_throttled_requests(monkeypatch):
+  sleeps = []
+  monkeypatch.setattr(utils.graphql, '_sleep', sleeps.append)
+  scheduler = RequestScheduler()
+
+  transport = ThrottlingTransport([HTTPError(429, {'Retry-After': '2'}), HTTPError(429), HTTPError(500)])
+  assert scheduler.execute(transport, None).data == {'trades': []}
+  assert transport.requests == 4
+  retry_delays = sleeps[1::2]
+  assert len(retry_delays) == 3
+  assert retry_delays[0] >= 2 and all(delay <= RETRY_MAX_BACKOFF_SECONDS for delay in retry_delays)
+  assert scheduler.interval > 0
+
+  # Failing requests are retried RETRIES times at most
+  transport = ThrottlingTransport([HTTPError(500)] * (RETRIES + 1))
+  with pytest.raises(Exception, match='500'):
+    scheduler.execute(transport, None)
+  assert transport.requests == RETRIES + 1
+
+
+def test_page_sizer_adapts_to_latency_and_size():
+  sizer = PageSizer(1000)
+  sizer.update(PAGE_TARGET_SECONDS * 2, 0)
+  assert sizer.size == 500
+  sizer.update(0.1, PAGE_TARGET_BYTES)
+  assert sizer.size == 500
+  sizer.update(0.1, 1000)
+  assert sizer.size == 1000
+  sizer.update(0.1, 1000)
+  assert sizer.size == 1000
+  assert not sizer.shrink(Exception('Invalid query'))
+
+
+def test_range_filters_are_merged_with_the_cursor(monkeypatch):
+  client = FakeClient([
+    _rows(('a', '5'), ('b', '6'), ('c', '6')),
+    _rows(('d', '7'))
+  ])
+  monkeypatch.setattr(utils.graphql, 'graphql_client', client)
+  filters = gql_range_filter('tradeBatchId', parse_batch_id('5'), parse_batch_id('2020-05-20', end=True))
+
+  rows = list(paginate('trades', 'txHash', filters, 'tradeBatchId', True, verbose=0, page_size=3))
+
+  assert [row['id'] for row in rows] == ['a', 'b', 'c', 'd']
+  assert client.variables[0]['where'] == {'tradeBatchId_gte': '5', 'tradeBatchId_lt': '5299776'}
+  assert client.variables[1]['where'] == {'tradeBatchId_gte': '6', 'tradeBatchId_lt': '5299776', 'id_not_in': ['b', 'c']}
+  assert gql_range_filter('createEpoch', 5299776, None) == {'createEpoch_gte': '1589932800', 'createEpoch_lt': None}
+
+
+def test_gql_filter_sends_integers_as_big_ints():
+  assert gql_filter({'orderId': 5, 'soldVolume_gt': 0, 'tradeBatchId_in': [1, 2], 'owner': '0x1', 'txHash': None}) == {
+    'orderId': '5', 'soldVolume_gt': '0', 'tradeBatchId_in': ['1', '2'], 'owner': '0x1'
+  }
+
+
+def test_parse_batch_id():
+  assert parse_batch_id('5300000') == 5300000
+  assert parse_batch_id('2020-05-20T13:31') == 5299938
+  assert parse_batch_id('2020-05-20T13:31', end=True) == 5299939
+  assert parse_batch_id('2020-05-20T15:31+02:00') == 5299938
+  with pytest.raises(Exception, match='Invalid date'):
+    parse_batch_id('yesterday')
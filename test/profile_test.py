@@ -0,0 +1,26 @@
+import time
+
+import utils.profile
+from utils.profile import Phase, profile_rows
+
+
+def test_nested_phases_are_not_counted_in_the_outer_ones(monkeypatch):
+  monkeypatch.setattr(utils.profile, 'phase_times', {})
+  with Phase('render'):
+    with Phase('network'):
+      time.sleep(0.05)
+
+  render_wall, _, render_calls = utils.profile.phase_times['render']
+  network_wall, _, _ = utils.profile.phase_times['network']
+  assert render_calls == 1
+  assert network_wall >= 0.05
+  assert render_wall < 0.05
+
+
+def test_profile_rows(monkeypatch):
+  monkeypatch.setattr(utils.profile, 'phase_times', {})
+  monkeypatch.setattr(utils.profile, 'counters', {})
+
+  assert list(profile_rows(range(5), str, chunk_size=2)) == ['0', '1', '2', '3', '4']
+  assert utils.profile.counters['rows'] == 5
+  assert utils.profile.phase_times['dto'][2] == 3
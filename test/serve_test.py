@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+import commands.tokens
+from commands.serve import run_command
+
+
+def test_run_command_parses_options_like_the_cli(monkeypatch):
+  queries = []
+
+  def query_entity(entity, fields, count, skip, filters, sort, sort_ascending, verbose):
+    queries.append((count, skip, filters, sort, sort_ascending))
+    return [{'id': '1', 'address': '0x1', 'decimals': '18', 'name': 'Token', 'symbol': 'TKN', 'createEpoch': None, 'txHash': '0x2'}]
+
+  monkeypatch.setattr(commands.tokens, 'query_entity', query_entity)
+
+  print_format, body = run_command('tokens', {'symbol': ['TKN'], 'count': ['5'], 'desc': [''], 'from': ['2020-05-20'], 'to': ['5300000']})
+
+  assert print_format == 'jsonl'
+  assert json.loads(body)['symbol'] == 'TKN'
+  assert queries == [(
+    5,
+    0,
+    {'id': None, 'address': None, 'symbol': 'TKN', 'createEpoch_gte': '1589932800', 'createEpoch_lt': '1590000000'},
+    'symbol',
+    False
+  )]
+
+  print_format, body = run_command('tokens', {'format': ['csv']})
+  assert print_format == 'csv'
+  assert body.decode().splitlines()[1].startswith('1,TKN')
+
+
+def test_run_command_rejects_options_of_the_process():
+  with pytest.raises(Exception, match='Unknown option: output'):
+    run_command('trades', {'output': ['trades.csv']})
+  with pytest.raises(Exception, match='Unknown option: refresh'):
+    run_command('trades', {'refresh': ['']})
+  with pytest.raises(Exception, match='Sorting by "sellToken" is not supported'):
+    run_command('trades', {'sort': ['sellToken']})
+  with pytest.raises(Exception, match='Format "pretty" is not supported'):
+    run_command('trades', {'format': ['pretty']})
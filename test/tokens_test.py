@@ -0,0 +1,29 @@
+import commands.tokens
+from commands.tokens import to_token
+
+
+def _token(id, symbol):
+  return {'id': id, 'name': None, 'symbol': symbol, 'address': '0x' + id, 'decimals': 18}
+
+
+def test_to_token_resolves_ids_from_persisted_registry(monkeypatch):
+  queries = []
+
+  def paginate(entity, fields, filters, **kwargs):
+    queries.append(filters)
+    return [_token('3', 'DAI')] if filters else [_token('1', 'OWL'), _token('2', 'WETH')]
+
+  monkeypatch.setattr(commands.tokens, 'paginate', paginate)
+
+  # Seeded from the tokens entity (not including yet the token 3)
+  assert to_token({'id': '2'}).symbol == 'WETH'
+  assert queries == [{}]
+
+  # Unknown ids refresh the registry
+  assert to_token({'id': '3'}).symbol == 'DAI'
+  assert queries == [{}, {'id': '3'}]
+
+  # Later runs read it from disk
+  monkeypatch.setattr(commands.tokens, 'token_registries', {})
+  assert to_token({'id': '3'}) is to_token({'id': '3'})
+  assert len(queries) == 2
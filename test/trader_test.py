@@ -0,0 +1,125 @@
+from io import BytesIO
+import json
+
+import commands.tokens
+import commands.trader
+from commands.trader import get_open_exposure, get_token_volumes, get_trader
+from utils.output import use_output
+
+UNLIMITED = 2 ** 128 - 1
+
+
+def _token(token_id, decimals=18):
+  return {'id': token_id, 'name': f'Token {token_id}', 'symbol': f'T{token_id}', 'address': f'0x{token_id}', 'decimals': str(decimals)}
+
+
+def _order(order_id, sell_token, buy_token, max_sell_amount, sold_volume, cancel_epoch=None):
+  return {
+    'owner': {'id': '0xabc'},
+    'orderId': str(order_id),
+    'fromBatchId': '1',
+    'untilBatchId': '10000000',
+    'buyToken': _token(buy_token),
+    'sellToken': _token(sell_token, 6),
+    'priceNumerator': '1',
+    'priceDenominator': '1',
+    'maxSellAmount': str(max_sell_amount),
+    'soldVolume': str(sold_volume),
+    'boughtVolume': str(sold_volume),
+    'createEpoch': '1590000000',
+    'cancelEpoch': cancel_epoch,
+    'deleteEpoch': None,
+    'txHash': '0x0'
+  }
+
+
+def _trade(sell_token, buy_token, sell_volume, buy_volume, revert_epoch=None):
+  return {
+    'owner': {'id': '0xabc'},
+    'order': {'orderId': '1'},
+    'tradeBatchId': '5300000',
+    'sellToken': _token(sell_token, 6),
+    'buyToken': _token(buy_token),
+    'sellVolume': str(sell_volume),
+    'buyVolume': str(buy_volume),
+    'tradeEpoch': '1590000000',
+    'revertEpoch': revert_epoch,
+    'txHash': '0x0'
+  }
+
+
+def test_trader_sends_one_query_and_resolves_tokens_from_it(monkeypatch):
+  orders = [_order(1, '7', '1', 100, 25), _order(2, '7', '1', UNLIMITED, 3), _order(3, '2', '1', 10, 0, cancel_epoch='1590000300')]
+  trades = [_trade('7', '1', 25, 30), _trade('7', '1', 3, 4), _trade('2', '1', 1, 1, revert_epoch='1590000600')]
+  queries = []
+
+  def execute_query(query, variables, verbose, immutable=False):
+    queries.append(variables)
+    return {'orders': orders, 'openOrders': orders, 'trades': trades}
+
+  monkeypatch.setattr(commands.trader, 'execute_query', execute_query)
+  monkeypatch.setattr(commands.trader, 'flush_output', lambda: None)
+
+  stream = BytesIO()
+  with use_output(stream):
+    get_trader('0xABC', 20, 'jsonl', 0)
+
+  assert len(queries) == 1
+  assert queries[0]['ordersWhere'] == {'owner': '0xabc'}
+  assert type(queries[0]['openOrdersWhere']['untilBatchId_gte']) is str
+  records = [json.loads(line) for line in stream.getvalue().decode().splitlines()]
+  assert [record['type'] for record in records] == ['exposure', 'volume', 'volume', 'order', 'order', 'order']
+  assert records[0]['token_symbol'] == 'T7' and records[0]['token_decimals'] == 6
+  assert (records[0]['amount'], records[0]['orders'], records[0]['unlimited_orders']) == (75, 2, 1)
+  assert records[4]['max_sell_amount'] is None
+
+
+def test_trader_paginates_the_open_orders_after_the_query(monkeypatch):
+  open_orders = [{**_order(i, '7', '1', 100, 0), 'id': str(i), 'createEpoch': str(1590000000 - i)} for i in range(3)]
+  queries = []
+
+  def paginate(entity, fields, filters, sort, sort_ascending, verbose):
+    queries.append(filters)
+    return open_orders[2:]
+
+  monkeypatch.setattr(commands.trader, 'PAGE_SIZE', 2)
+  monkeypatch.setattr(commands.trader, 'execute_query', lambda *args, **kwargs: {'orders': [], 'openOrders': open_orders[:2], 'trades': []})
+  monkeypatch.setattr(commands.trader, 'paginate', paginate)
+  monkeypatch.setattr(commands.trader, 'flush_output', lambda: None)
+
+  stream = BytesIO()
+  with use_output(stream):
+    get_trader('0xabc', 20, 'jsonl', 0)
+
+  assert queries[0]['createEpoch_lte'] == '1589999999' and queries[0]['id_not_in'] == ['1']
+  assert json.loads(stream.getvalue().decode().splitlines()[0])['orders'] == 3
+
+
+def test_trader_registers_the_tokens_without_metadata_as_they_are(monkeypatch):
+  trade = {**_trade('7', '1', 25, 30), 'buyToken': {**_token('1'), 'symbol': None, 'decimals': None}}
+
+  def fetch_tokens(filters):
+    raise Exception('Tokens are fetched with the trader query')
+
+  monkeypatch.setattr(commands.trader, 'execute_query', lambda *args, **kwargs: {'orders': [], 'openOrders': [], 'trades': [trade]})
+  monkeypatch.setattr(commands.trader, 'flush_output', lambda: None)
+  monkeypatch.setattr(commands.tokens, '_fetch_tokens', fetch_tokens)
+
+  with use_output(BytesIO()):
+    get_trader('0xabc', 20, 'pretty', 0)
+
+  token = commands.tokens.get_token_registry()['1']
+  assert (token.symbol, token.decimals) == (None, 18)
+
+
+def test_open_exposure_and_volumes_by_token():
+  commands.trader.register_tokens([_token('7', 6), _token('1')])
+  order_dtos = [commands.trader.to_order_dto(order) for order in [_order(1, '7', '1', 100, 25), _order(2, '7', '1', 10, 0)]]
+
+  assert [(token.id, amount, orders, unlimited) for token, amount, orders, unlimited in get_open_exposure(order_dtos)] == [('7', 85, 2, 0)]
+
+  trade_dtos = [commands.trader.to_trade_dto(trade) for trade in [_trade('7', '1', 25, 30), _trade('1', '7', 5, 6), _trade('7', '1', 1, 1, '1')]]
+  assert [(token.id, sold, bought, count) for token, sold, bought, count in get_token_volumes(trade_dtos)] == [
+    ('7', 25, 6, 2),
+    ('1', 5, 30, 2)
+  ]
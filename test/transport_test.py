@@ -0,0 +1,49 @@
+from graphql.execution import ExecutionResult
+import pytest
+
+from utils.graphql import get_entity_query, get_query_document
+from utils.transport import (RecordingTransport, ReplayTransport, SimulatedTransport,
+                             get_latency_distribution)
+
+
+class FakeTransport:
+  def __init__(self):
+    self.requests = 0
+
+  def execute(self, document, variable_values=None, timeout=None):
+    self.requests += 1
+    return ExecutionResult(data={'tokens': [{'id': str(variable_values['skip'])}]}, errors=None)
+
+
+def test_replay_recorded_responses(tmp_path):
+  document = get_query_document(get_entity_query('tokens', 'id'))
+  recorder = RecordingTransport(FakeTransport(), str(tmp_path))
+  recorder.execute(document, variable_values={'skip': 1})
+  recorder.execute(document, variable_values={'skip': 2})
+
+  replay = ReplayTransport(str(tmp_path))
+  assert replay.execute(document, variable_values={'skip': 2}).data == {'tokens': [{'id': '2'}]}
+  assert replay.execute(document, variable_values={'skip': 1}).data == {'tokens': [{'id': '1'}]}
+  assert replay.execute(document, variable_values={'skip': 3}).errors
+
+
+def test_simulated_errors():
+  document = get_query_document(get_entity_query('tokens', 'id'))
+  fake = FakeTransport()
+  transport = SimulatedTransport(fake, latency='fixed:0', error_rate=0.5, seed=1)
+
+  failures = 0
+  for _ in range(100):
+    try:
+      transport.execute(document, variable_values={'skip': 0})
+    except Exception:
+      failures += 1
+
+  assert 30 < failures < 70
+  assert fake.requests == 100 - failures
+
+
+def test_latency_distribution():
+  assert get_latency_distribution('fixed:200')(None) == 200
+  with pytest.raises(Exception, match='Invalid latency'):
+    get_latency_distribution('uniform:50')
@@ -0,0 +1,44 @@
+from datetime import datetime
+
+from commands.volume import _get_bucket_date, aggregate_volume
+
+
+def _trade(owner, batch_id, sell_token, buy_token, sell_volume, buy_volume, revert_epoch=None):
+  return {
+    'owner': {'id': owner},
+    'tradeBatchId': str(batch_id),
+    'sellToken': {'id': sell_token},
+    'buyToken': {'id': buy_token},
+    'sellVolume': str(sell_volume),
+    'buyVolume': str(buy_volume),
+    'revertEpoch': revert_epoch
+  }
+
+
+def test_aggregate_volume_adds_up_exact_amounts_skipping_reverted():
+  trades = [
+    _trade('0x1', 1, '1', '2', 10 ** 30 + 1, 5),
+    _trade('0x2', 2, '1', '2', 10 ** 30 + 2, 7),
+    _trade('0x1', 3, '2', '1', 3, 4),
+    _trade('0x1', 4, '1', '2', 100, 100, revert_epoch='1590000000')
+  ]
+
+  assert aggregate_volume(trades, 'pair') == {
+    (None, '1', '2'): [2, 2 * 10 ** 30 + 3, 12],
+    (None, '2', '1'): [1, 3, 4]
+  }
+  assert aggregate_volume(trades, 'sell') == {
+    (None, '1'): [2, 2 * 10 ** 30 + 3, 12],
+    (None, '2'): [1, 3, 4]
+  }
+  assert list(aggregate_volume(trades, 'trader')) == [(None, '0x1', '1', '2'), (None, '0x2', '1', '2'), (None, '0x1', '2', '1')]
+
+
+def test_bucket_date():
+  # 2020-05-20 (wednesday) 13:25 UTC
+  batch_id = 1589981100 // 300
+
+  assert _get_bucket_date('hour', batch_id) == datetime(2020, 5, 20, 13)
+  assert _get_bucket_date('day', batch_id) == datetime(2020, 5, 20)
+  assert _get_bucket_date('week', batch_id) == datetime(2020, 5, 18)
+  assert _get_bucket_date('month', batch_id) == datetime(2020, 5, 1)